@@ -0,0 +1 @@
+"""sByterun 虚拟机的性能测试，在 sByterun 目录下以 `python -m benchmarks.xxx` 运行"""
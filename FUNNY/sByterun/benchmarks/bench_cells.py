@@ -0,0 +1,50 @@
+"""cell 变量访问开销的微基准：同样的循环分别读写局部变量与 cell 变量
+
+    python -m benchmarks.bench_cells [n]
+"""
+import sys
+import textwrap
+import time
+
+from byterun.byterun import VirtualMachine
+
+
+SOURCE = textwrap.dedent("""\
+    def local_loop(n):
+        total = 0
+        step = 3
+        for i in range(n):
+            total = total + step
+        return total
+
+    def cell_loop(n):
+        total = 0
+        step = 3
+        def use():
+            return total + step
+        for i in range(n):
+            total = total + step
+        return total
+""")
+
+
+def run(name, n, **options):
+    vm = VirtualMachine(**options)
+    f_globals = {'__builtins__': __builtins__}
+    vm.run_code(compile(SOURCE, "<bench_cells>", "exec"), f_globals=f_globals)
+    func = f_globals[name]
+    start = time.perf_counter()
+    func(n)
+    return time.perf_counter() - start
+
+
+def main(n=200000, repeat=5):
+    for engine in ['table', 'threaded']:
+        local = min(run('local_loop', n, engine=engine) for _ in range(repeat))
+        cell = min(run('cell_loop', n, engine=engine) for _ in range(repeat))
+        print("%-8s local %8.3fs  cell %8.3fs  ratio %.2f" % (
+            engine, local, cell, cell / local))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
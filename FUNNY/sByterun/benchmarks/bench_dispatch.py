@@ -0,0 +1,91 @@
+"""分派方式的微基准：按指令名分派 vs 按指令码查表分派 vs 闭包串联
+
+    python -m benchmarks.bench_dispatch [循环次数]
+"""
+import sys
+import textwrap
+import time
+
+from byterun.byterun import VirtualMachine
+
+
+SOURCE = textwrap.dedent("""\
+    total = 0
+    i = 0
+    while i < N:
+        total = total + i * 2 - -i
+        i = i + 1
+""")
+
+
+class NameDispatchVM(VirtualMachine):
+    """按指令名分派的旧主循环：每条指令都取出指令名，再用 getattr 找到 byte_ 方法"""
+
+    def run_frame(self, frame):
+        self.push_frame(frame)
+        while True:
+            byteName, arguments = self.next_instruction()
+            why = self.dispatch_by_name(byteName, arguments)
+            while why and frame.block_stack:
+                why = self.manage_block_stack(why)
+            if why:
+                break
+        self.pop_frame()
+        return self.return_value
+
+    def next_instruction(self):
+        f = self.frame
+        _, byteName, arguments = f.decoded.instructions[f.f_lasti]
+        f.f_lasti += 1
+        return byteName, arguments
+
+    def dispatch_by_name(self, byteName, arguments):
+        why = None
+        try:
+            if byteName.startswith('UNARY_'):
+                self.unaryOperator(byteName[6:])
+            elif byteName.startswith('BINARY_'):
+                self.binaryOperator(byteName[7:])
+            else:
+                why = getattr(self, 'byte_%s' % byteName)(*arguments)
+        except:
+            self.last_exception = sys.exc_info()[:2] + (None,)
+            why = 'exception'
+        return why
+
+
+class CountingVM(NameDispatchVM):
+    """统计执行的指令条数"""
+
+    def __init__(self):
+        super(CountingVM, self).__init__()
+        self.count = 0
+
+    def next_instruction(self):
+        self.count += 1
+        return super(CountingVM, self).next_instruction()
+
+
+def run(vm_class, code_obj, n, **options):
+    f_globals = {'__builtins__': __builtins__, 'N': n}
+    vm = vm_class(**options)
+    start = time.perf_counter()
+    vm.run_code(code_obj, f_globals=f_globals)
+    return vm, time.perf_counter() - start
+
+
+def main(n=20000, repeat=5):
+    code_obj = compile(SOURCE, "<bench_dispatch>", "exec")
+    counter, _ = run(CountingVM, code_obj, n)
+    print("instructions: %d" % counter.count)
+    for name, vm_class, options in [
+            ('name dispatch', NameDispatchVM, {}),
+            ('table dispatch', VirtualMachine, {}),
+            ('threaded', VirtualMachine, {'engine': 'threaded'})]:
+        best = min(run(vm_class, code_obj, n, **options)[1]
+                   for _ in range(repeat))
+        print("%-15s %12.0f instr/s" % (name, counter.count / best))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
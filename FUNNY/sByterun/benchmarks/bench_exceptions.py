@@ -0,0 +1,60 @@
+"""try 语句开销的微基准：循环体中的 try/except 分别使用块栈与异常表
+
+    python -m benchmarks.bench_exceptions [n]
+
+`quiet` 循环中从不抛出异常，衡量 try 语句本身的开销；
+`raising` 循环中每三次迭代抛出并捕获一次异常
+"""
+import sys
+import textwrap
+import time
+
+from byterun.byterun import VirtualMachine
+
+
+SOURCE = textwrap.dedent("""\
+    def quiet(n):
+        total = 0
+        for i in range(n):
+            try:
+                total = total + i
+            except ValueError:
+                total = 0
+        return total
+
+    def raising(n):
+        total = 0
+        for i in range(n):
+            try:
+                if i % 3 == 0:
+                    raise ValueError(i)
+                total = total + i
+            except ValueError as e:
+                total = total - 1
+        return total
+""")
+
+
+def run(name, n, **options):
+    vm = VirtualMachine(**options)
+    f_globals = {'__builtins__': __builtins__}
+    vm.run_code(compile(SOURCE, "<bench_exceptions>", "exec"),
+                f_globals=f_globals)
+    func = f_globals[name]
+    start = time.perf_counter()
+    func(n)
+    return time.perf_counter() - start
+
+
+def main(n=200000, repeat=5):
+    for engine in ['table', 'threaded']:
+        for name in ['quiet', 'raising']:
+            blocks = min(run(name, n, engine=engine) for _ in range(repeat))
+            table = min(run(name, n, engine=engine, exception_table=True)
+                        for _ in range(repeat))
+            print("%-8s %-8s blocks %8.3fs  table %8.3fs  speedup %.2f" % (
+                engine, name, blocks, table, blocks / table))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,66 @@
+"""帧复用的微基准：调用密集的递归程序
+
+    python -m benchmarks.bench_frame_pool [n] [repeat]
+
+分别在不复用帧（frame_pool=0）与默认复用帧时运行 fib(n) `repeat` 次，
+输出耗时的中位数与最大值、新建的帧对象数，以及运行期间第 0 代垃圾回收的次数
+"""
+import gc
+import statistics
+import sys
+import textwrap
+import time
+
+from byterun import byterun
+from byterun.byterun import VirtualMachine
+
+
+SOURCE = textwrap.dedent("""\
+    def fib(n):
+        if n < 2:
+            return n
+        return fib(n - 1) + fib(n - 2)
+    total = fib(N)
+""")
+
+
+class CountingFrame(byterun.Frame):
+    """统计新建帧对象的数量"""
+    __slots__ = []
+    created = 0
+
+    def __init__(self, *args, **kwargs):
+        CountingFrame.created += 1
+        super(CountingFrame, self).__init__(*args, **kwargs)
+
+
+def run(n, frame_pool, repeat):
+    code = compile(SOURCE, "<bench_frame_pool>", "exec")
+    times = []
+    CountingFrame.created = 0
+    collections = gc.get_stats()[0]['collections']
+    for _ in range(repeat):
+        vm = VirtualMachine(frame_pool=frame_pool)
+        f_globals = {'__builtins__': __builtins__, 'N': n}
+        start = time.perf_counter()
+        vm.run_code(code, f_globals=f_globals)
+        times.append(time.perf_counter() - start)
+    collections = gc.get_stats()[0]['collections'] - collections
+    return times, CountingFrame.created // repeat, collections // repeat
+
+
+def main(n=25, repeat=5):
+    frame_class = byterun.Frame
+    byterun.Frame = CountingFrame
+    try:
+        for label, frame_pool in [('no pool', 0), ('pool', 16)]:
+            times, created, collections = run(n, frame_pool, repeat)
+            print("%-8s median %7.3fs  max %7.3fs  %8d frames  %6d gen0 gcs" % (
+                label, statistics.median(times), max(times), created,
+                collections))
+    finally:
+        byterun.Frame = frame_class
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,85 @@
+"""每个活动帧占用的内存（tracemalloc）
+
+    python -m benchmarks.bench_frames [深度]
+
+递归到给定深度后在最深处测量已分配的内存，与递归深度为 0 时相减再除以深度，
+得到每个活动帧（含其数据栈、局部变量槽位与块栈）平均占用的字节数。
+`plain` 为不含循环的函数，`loop` 的每个帧停在 for 循环中（块栈上有一个块）。
+每个函数分别以属性存放在实例字典中的帧（`dict`，即改用 __slots__ 之前的帧）与
+使用 __slots__ 的帧（`slots`）测量，并给出后者的变化
+"""
+import sys
+import textwrap
+import tracemalloc
+
+from byterun import byterun
+from byterun.byterun import VirtualMachine
+
+
+SOURCE = textwrap.dedent("""\
+    def plain(n):
+        if n == 0:
+            return probe()
+        return plain(n - 1)
+
+    def loop(n):
+        for i in range(1):
+            if n == 0:
+                return probe()
+            return loop(n - 1)
+""")
+
+
+def dict_frame_class():
+    """方法与 Frame 相同、属性存放在实例字典中的帧类"""
+    slots = set(byterun.Frame.__slots__)
+    namespace = {key: value for key, value in vars(byterun.Frame).items()
+                 if key not in slots and key != '__slots__'}
+    return type('DictFrame', (object,), namespace)
+
+
+FRAME_CLASSES = [('dict', dict_frame_class()), ('slots', byterun.Frame)]
+
+
+def measure(name, depth, frame_class):
+    frame = byterun.Frame
+    byterun.Frame = frame_class
+    try:
+        return run(name, depth)
+    finally:
+        byterun.Frame = frame
+
+
+def run(name, depth):
+    vm = VirtualMachine()
+    samples = []
+
+    def probe():
+        samples.append(tracemalloc.get_traced_memory()[0])
+
+    f_globals = {'__builtins__': __builtins__, 'probe': probe}
+    vm.run_code(compile(SOURCE, "<bench_frames>", "exec"), f_globals=f_globals)
+    func = f_globals[name]
+    func(1)      # 预先解码并缓存指令流
+    tracemalloc.start()
+    try:
+        func(0)
+        func(depth)
+    finally:
+        tracemalloc.stop()
+    return (samples[-1] - samples[-2]) / depth
+
+
+def main(depth=10000):
+    for name in ['plain', 'loop']:
+        sizes = []
+        for label, frame_class in FRAME_CLASSES:
+            sizes.append(measure(name, depth, frame_class))
+            line = "%-6s %-6s %7.1f bytes per frame" % (name, label, sizes[-1])
+            if len(sizes) > 1:
+                line += "  %+.0f%%" % ((sizes[-1] / sizes[0] - 1) * 100)
+            print(line)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,44 @@
+"""绿色线程调度器的吞吐量与公平性：大量任务交替计算与等待模拟 I/O
+
+    python -m benchmarks.bench_green [任务数] [时间片指令数]
+"""
+import asyncio
+import json
+import sys
+import textwrap
+
+from byterun.green import Scheduler
+
+
+SOURCE = textwrap.dedent("""\
+    total = 0
+    for round in range(3):
+        for i in range(300):
+            total = total + i
+        total = total + wait(io(round))
+    result = total
+""")
+
+
+async def io(value):
+    await asyncio.sleep(0.001)
+    return value
+
+
+def main(tasks=1000, quantum=1000):
+    scheduler = Scheduler(quantum=quantum)
+    for i in range(tasks):
+        scheduler.spawn(SOURCE, io=io)
+    scheduler.run()
+    metrics = scheduler.metrics()
+    waits = sorted(task['max_ready_wait'] for task in metrics['tasks'])
+    report = {key: metrics[key] for key in [
+        'elapsed', 'finished', 'instructions', 'instructions_per_sec',
+        'tasks_per_sec', 'fairness']}
+    report['max_ready_wait_p50'] = waits[len(waits) // 2]
+    report['max_ready_wait_max'] = waits[-1]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
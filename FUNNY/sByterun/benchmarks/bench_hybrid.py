@@ -0,0 +1,54 @@
+"""混合执行的微基准：程序反复调用一个热点函数
+
+    python -m benchmarks.bench_hybrid [n] [hot_threshold]
+
+分别在纯虚拟机、混合执行（热点函数调用超过 `hot_threshold` 次后交给宿主解释器）
+与原生 exec 下运行，并输出混合执行时各函数的原生调用次数与耗时
+"""
+import sys
+import textwrap
+import time
+
+from byterun.byterun import VirtualMachine
+
+
+SOURCE = textwrap.dedent("""\
+    def fib(n):
+        if n < 2:
+            return n
+        return fib(n - 1) + fib(n - 2)
+
+    total = 0
+    for i in range(N):
+        total = total + fib(12)
+""")
+
+
+def run(n, vm=None):
+    code = compile(SOURCE, "<bench_hybrid>", "exec")
+    f_globals = {'__builtins__': __builtins__, 'N': n}
+    start = time.perf_counter()
+    if vm is None:
+        exec(code, f_globals)
+    else:
+        vm.run_code(code, f_globals=f_globals)
+    return time.perf_counter() - start, f_globals['total']
+
+
+def main(n=20, hot_threshold=1000, repeat=3):
+    native, expected = min(run(n) for _ in range(repeat))
+    pure, result = min(run(n, VirtualMachine()) for _ in range(repeat))
+    assert result == expected
+    vm = VirtualMachine(hybrid=True, hot_threshold=hot_threshold)
+    hybrid, result = run(n, vm)
+    assert result == expected
+    print("vm     %8.3fs" % pure)
+    print("hybrid %8.3fs  speedup %.1fx" % (hybrid, pure / hybrid))
+    print("native %8.3fs" % native)
+    for code, (calls, elapsed) in vm.native_calls.items():
+        print("  %s: %d vm calls, %d native calls, %.3fs native" % (
+            code.co_name, vm.call_counts[code], calls, elapsed))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
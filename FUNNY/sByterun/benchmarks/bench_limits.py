@@ -0,0 +1,65 @@
+"""运行限制检查开销的微基准
+
+    python -m benchmarks.bench_limits [n]
+
+`loop` 为循环密集的程序（检查发生在每次回跳），`calls` 为调用密集的程序
+（检查发生在每次调用）。分别在不限制、只限制指令数、只限制截止时间与全部限制下运行，
+限制都足够宽松，不会触发
+"""
+import sys
+import textwrap
+import time
+
+from byterun.byterun import VirtualMachine
+
+
+PROGRAMS = {
+    'loop': textwrap.dedent("""\
+        total = 0
+        i = 0
+        while i < N:
+            total = total + i % 7
+            i = i + 1
+    """),
+    'calls': textwrap.dedent("""\
+        def fib(n):
+            if n < 2:
+                return n
+            return fib(n - 1) + fib(n - 2)
+        total = fib(N)
+    """),
+}
+
+LIMITS = [
+    ('none', {}),
+    ('instructions', {'max_instructions': 10 ** 12}),
+    ('deadline', {'timeout': 3600}),
+    ('all', {'max_instructions': 10 ** 12, 'timeout': 3600,
+             'max_depth': 1000}),
+]
+
+
+def run(source, n, engine, limits):
+    vm = VirtualMachine(engine=engine)
+    code = compile(source, "<bench_limits>", "exec")
+    f_globals = {'__builtins__': __builtins__, 'N': n}
+    start = time.perf_counter()
+    vm.run_code(code, f_globals=f_globals, **limits)
+    return time.perf_counter() - start
+
+
+def main(n=100000, repeat=3):
+    sizes = {'loop': n, 'calls': max(int(n).bit_length() + 2, 2)}
+    for engine in ['table', 'threaded']:
+        for name, source in PROGRAMS.items():
+            base = None
+            for label, limits in LIMITS:
+                elapsed = min(run(source, sizes[name], engine, limits)
+                              for _ in range(repeat))
+                base = base or elapsed
+                print("%-8s %-6s %-12s %8.3fs  %+6.1f%%" % (
+                    engine, name, label, elapsed, (elapsed / base - 1) * 100))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
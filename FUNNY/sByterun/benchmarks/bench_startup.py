@@ -0,0 +1,59 @@
+"""启动开销的微基准：编译并解码（优化）套件中全部程序的耗时，不运行程序
+
+    python -m benchmarks.bench_startup [次数]
+
+`compile` 为每次重新编译、反汇编并施加优化，`warm` 为从 DiskCache 读取，
+`cold` 为缓存未命中时编译并写入缓存
+"""
+import shutil
+import sys
+import tempfile
+import time
+
+from byterun.byterun import DiskCache, _walk_code, get_code_cache
+
+from .programs import PROGRAMS
+
+
+def compile_all(code_cache):
+    for bench in PROGRAMS.values():
+        code = compile(bench.source, '<%s>' % bench.name, 'exec')
+        for nested in _walk_code(code):
+            code_cache.get(nested)
+
+
+def load_all(disk_cache, code_cache):
+    for bench in PROGRAMS.values():
+        disk_cache.compile(bench.source, '<%s>' % bench.name, code_cache)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main(repeat=20):
+    code_cache = get_code_cache(superinstructions=True, exception_table=True)
+    directory = tempfile.mkdtemp()
+    try:
+        disk_cache = DiskCache(directory)
+        times = {'compile': [], 'cold': [], 'warm': []}
+        for _ in range(repeat):
+            code_cache.clear()
+            times['compile'].append(timed(compile_all, code_cache))
+            disk_cache.clear()
+            code_cache.clear()
+            times['cold'].append(timed(load_all, disk_cache, code_cache))
+            code_cache.clear()
+            times['warm'].append(timed(load_all, disk_cache, code_cache))
+    finally:
+        shutil.rmtree(directory)
+    base = min(times['compile'])
+    for name in ['compile', 'cold', 'warm']:
+        best = min(times[name])
+        print("%-8s %8.3fms  %.2fx" % (name, best * 1000, base / best))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,49 @@
+"""超级指令融合的微基准：关闭 / 开启 superinstructions 的耗时与融合条数
+
+    python -m benchmarks.bench_superinstructions [n]
+"""
+import sys
+import textwrap
+import time
+
+from byterun.byterun import VirtualMachine
+
+
+SOURCE = textwrap.dedent("""\
+    def fib(n):
+        if n < 2:
+            return n
+        return fib(n - 1) + fib(n - 2)
+
+    def loop(n):
+        total = 0
+        for i in range(n):
+            for j in range(10):
+                if i < j:
+                    total = total + i * 2
+        return total
+
+    result = fib(N) + loop(N * 500)
+""")
+
+
+def run(superinstructions, code_obj, n):
+    f_globals = {'__builtins__': __builtins__, 'N': n}
+    vm = VirtualMachine(superinstructions=superinstructions)
+    start = time.perf_counter()
+    vm.run_code(code_obj, f_globals=f_globals)
+    return vm, time.perf_counter() - start
+
+
+def main(n=20, repeat=5):
+    code_obj = compile(SOURCE, "<bench_superinstructions>", "exec")
+    for superinstructions in [False, True]:
+        best = min(run(superinstructions, code_obj, n)[1] for _ in range(repeat))
+        stats = run(superinstructions, code_obj, n)[0].code_cache.stats()
+        print("superinstructions=%-5s %8.3fs  fused %d of %d instructions" % (
+            superinstructions, best, stats['fused'],
+            stats['instructions'] + stats['fused']))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
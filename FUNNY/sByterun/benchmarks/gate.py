@@ -0,0 +1,180 @@
+"""性能回归门禁：与保存的基线比较虚拟机耗时，并核对虚拟机与 CPython 的运行结果
+
+    python -m benchmarks.gate [-b 基线文件] [-r 次数] [--threshold 比例] [--update]
+                              [--json 输出文件] [程序名 ...]
+
+每个程序在虚拟机中重复运行 `repeat` 次，用自助法（bootstrap）估计耗时中位数的置信区间：
+区间下界仍比基线慢超过阈值才判为回归，区间上界比基线快超过阈值判为提升。
+同一轮中再用原生 exec 运行一次，标准输出、`result` 或抛出的异常与虚拟机不一致即判为语义不符。
+基线按虚拟机选项（引擎与各项优化）分别保存，只与相同选项下记录的基线比较。
+基线文件中每个程序可单独指定 `threshold`；`--update` 用本次结果改写基线（保留已有阈值）。
+存在回归、语义不符或新出现的错误时退出码为 1
+
+基线默认保存在 benchmarks/baselines.json（`-b` 指定其他文件）。耗时只在同一台机器、
+同一解释器上可比，因此基线不随代码提交：在运行门禁的机器上先以要比较的选项运行一次
+
+    python -m benchmarks.gate --update [--engine threaded ...]
+
+记录基线，此后不带 `--update` 运行即与之比较；没有基线的程序状态为 new，不算失败
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+
+from .programs import PROGRAMS
+from .suite import execute
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+
+def median_interval(times, confidence=0.95, resamples=1000, seed=0):
+    """自助法估计中位数的置信区间"""
+    rng = random.Random(seed)
+    medians = sorted(
+        statistics.median([rng.choice(times) for _ in times])
+        for _ in range(resamples)
+    )
+    tail = (1 - confidence) / 2
+    return (medians[int(tail * (resamples - 1))],
+            medians[int((1 - tail) * (resamples - 1))])
+
+
+def config_key(vm_options):
+    """基线文件中一组虚拟机选项的键，如 engine=table,hybrid=False,..."""
+    return ','.join('%s=%s' % item for item in sorted(vm_options.items()))
+
+
+def load_baselines(path):
+    """读取基线文件，返回 {选项的键: {程序名: 基线}}"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        # 旧格式（'benchmarks'）没有记录虚拟机选项，无法确定与哪组选项比较，不再使用
+        return json.load(f).get('configs', {})
+
+
+def save_baselines(path, configs):
+    with open(path, 'w') as f:
+        json.dump({'python': sys.version.split()[0], 'configs': configs},
+                  f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def check(bench, baseline, repeat=5, threshold=0.1, vm_options=None):
+    """运行一个程序并与基线比较，返回结果字典，`status` 为：
+       ok / regression / improvement / mismatch / error / unsupported / new
+    """
+    runs = [execute(bench, vm_options=vm_options) for _ in range(repeat)]
+    native = execute(bench, native=True)
+    threshold = (baseline or {}).get('threshold', threshold)
+    result = {'name': bench.name, 'threshold': threshold}
+    error = runs[0].error
+    if error and not native.error:
+        result['error'] = error
+        # 基线中已记录为不支持的程序不算回归
+        known = baseline is not None and baseline.get('error')
+        result['status'] = 'unsupported' if known else 'error'
+        return result
+    # 原生运行也抛出异常时，虚拟机应抛出同样的异常
+    mismatches = [field for field in ('stdout', 'result', 'error')
+                  if getattr(runs[0], field) != getattr(native, field)]
+    times = [run.elapsed for run in runs]
+    median = statistics.median(times)
+    low, high = median_interval(times)
+    result.update(times=times, median=median, interval=[low, high],
+                  native_median=native.elapsed)
+    if mismatches:
+        result['status'] = 'mismatch'
+        result['mismatches'] = mismatches
+    elif baseline is None or baseline.get('median') is None:
+        result['status'] = 'new'
+    else:
+        base = baseline['median']
+        result['baseline'] = base
+        result['change'] = median / base - 1
+        result['status'] = classify((low, high), base, threshold)
+    return result
+
+
+def classify(interval, base, threshold):
+    """按耗时中位数的置信区间 `interval` 与基线中位数 `base` 判定：
+       regression / improvement / ok
+    """
+    low, high = interval
+    if low > base * (1 + threshold):
+        return 'regression'
+    if high < base * (1 - threshold):
+        return 'improvement'
+    return 'ok'
+
+
+def format_result(result):
+    if 'error' in result:
+        detail = result['error']
+    else:
+        detail = '%.4fs [%.4f, %.4f]' % ((result['median'],) +
+                                         tuple(result['interval']))
+        if 'change' in result:
+            detail += ' %+.1f%%' % (result['change'] * 100)
+        if 'mismatches' in result:
+            detail += ' differs in ' + ', '.join(result['mismatches'])
+    return "%-16s %-12s %s" % (result['name'], result['status'], detail)
+
+
+FAILURES = frozenset(['regression', 'mismatch', 'error'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('names', nargs='*')
+    parser.add_argument('-b', '--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('-r', '--repeat', type=int, default=7)
+    parser.add_argument('--threshold', type=float, default=0.1)
+    parser.add_argument('--engine', default='table')
+    parser.add_argument('--superinstructions', action='store_true')
+    parser.add_argument('--exception-table', action='store_true')
+    parser.add_argument('--peephole', action='store_true')
+    parser.add_argument('--hybrid', action='store_true')
+    parser.add_argument('--update', action='store_true')
+    parser.add_argument('--json')
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in PROGRAMS:
+            parser.error('unknown benchmark: %s' % name)
+
+    vm_options = {'engine': args.engine,
+                  'superinstructions': args.superinstructions,
+                  'exception_table': args.exception_table,
+                  'hybrid': args.hybrid,
+                  'peephole': args.peephole}
+    configs = load_baselines(args.baseline)
+    baselines = configs.setdefault(config_key(vm_options), {})
+    results = []
+    for name in args.names or PROGRAMS:
+        result = check(PROGRAMS[name], baselines.get(name), args.repeat,
+                       args.threshold, vm_options)
+        results.append(result)
+        print(format_result(result))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.update:
+        for result in results:
+            if result['status'] == 'mismatch':
+                continue
+            entry = baselines.setdefault(result['name'], {})
+            entry['threshold'] = result['threshold']
+            entry['median'] = result.get('median')
+            entry['error'] = result.get('error')
+        save_baselines(args.baseline, configs)
+        return 0
+    return 1 if any(r['status'] in FAILURES for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
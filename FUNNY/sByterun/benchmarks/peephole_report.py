@@ -0,0 +1,59 @@
+"""窥孔优化前后每个函数的指令数
+
+    python -m benchmarks.peephole_report [--superinstructions] [--exception-table]
+                                         [文件 ...]
+
+不给出文件时统计性能测试套件中的全部程序。每个 code object 输出解码后的指令数，
+以及在选项给出的其他优化之外、不做与做窥孔优化时的指令数。
+CPython 编译器本身已做过常量折叠等优化，窥孔优化主要删去其遗留的不可达代码、
+异常表删去块指令后留下的跳转串联，以及把常量元组的成员判断改为 frozenset
+"""
+import argparse
+
+from byterun.byterun import _walk_code, get_code_cache
+
+from .programs import PROGRAMS
+
+
+def report(name, code, baseline, optimized):
+    print(name)
+    totals = [0, 0]
+    for nested in _walk_code(code):
+        before = len(baseline.get(nested).instructions)
+        after = len(optimized.get(nested).instructions)
+        totals[0] += before
+        totals[1] += after
+        print("  %-20s line %-4d decoded %5d  passes %5d -> %5d  (%+.1f%%)" % (
+            nested.co_name, nested.co_firstlineno,
+            optimized.get(nested).original_size, before, after,
+            (after / before - 1) * 100))
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--superinstructions', action='store_true')
+    parser.add_argument('--exception-table', action='store_true')
+    args = parser.parse_args(argv)
+
+    baseline = get_code_cache(args.superinstructions, args.exception_table)
+    optimized = get_code_cache(args.superinstructions, args.exception_table,
+                               peephole=True)
+    sources = [(name, bench.source) for name, bench in PROGRAMS.items()]
+    if args.files:
+        sources = []
+        for path in args.files:
+            with open(path) as f:
+                sources.append((path, f.read()))
+    totals = [0, 0]
+    for name, source in sources:
+        before, after = report(name, compile(source, name, 'exec'), baseline,
+                               optimized)
+        totals[0] += before
+        totals[1] += after
+    print("total %d -> %d instructions" % tuple(totals))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""以指令级剖析器运行一个脚本，列出耗时最多的指令与源代码行
+
+    python -m benchmarks.profile_opcodes 脚本路径 [--json 输出文件] [--pstats 输出文件]
+
+给出 `--folded` 时改用采样剖析器，把折叠栈写入文件（供 flamegraph.pl 使用）：
+
+    python -m benchmarks.profile_opcodes 脚本路径 --folded 输出文件 [--interval 秒]
+"""
+import argparse
+
+from byterun.byterun import SamplingProfiler, VirtualMachine
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path')
+    parser.add_argument('--json')
+    parser.add_argument('--pstats')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--folded')
+    parser.add_argument('--interval', type=float, default=0.001)
+    args = parser.parse_args(argv)
+
+    with open(args.path) as f:
+        code_obj = compile(f.read(), args.path, 'exec')
+    f_globals = {
+        '__builtins__': __builtins__,
+        '__name__': '__main__',
+        '__doc__': None,
+        '__package__': None,
+    }
+    vm = VirtualMachine()
+    if args.folded:
+        with SamplingProfiler(vm, interval=args.interval) as sampler:
+            vm.run_code(code_obj, f_globals=f_globals)
+        sampler.write_folded(args.folded)
+        print("%d samples written to %s" % (sampler.samples, args.folded))
+        return
+    profiler = vm.enable_profiling()
+    vm.run_code(code_obj, f_globals=f_globals)
+    vm.disable_profiling()
+
+    data = profiler.as_dict()
+    print("%-30s %10s %10s" % ('opcode', 'count', 'time'))
+    for row in data['opcodes'][:args.top]:
+        print("%-30s %10d %10.4f" % (row['opname'], row['count'], row['time']))
+    print()
+    print("%-30s %10s %10s" % ('line', 'count', 'time'))
+    for row in data['lines'][:args.top]:
+        print("%-30s %10d %10.4f" % ('%s:%d' % (row['filename'], row['lineno']),
+                                     row['count'], row['time']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(profiler.to_json(indent=2))
+    if args.pstats:
+        profiler.dump_stats(args.pstats)
+
+
+if __name__ == '__main__':
+    main()
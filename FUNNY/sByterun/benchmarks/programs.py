@@ -0,0 +1,124 @@
+"""性能测试套件使用的程序
+
+每个程序以模块方式运行，运行前在全局命名空间中放入规模参数 `N`，
+运行后全局变量 `result` 为程序的返回值，程序也会向标准输出打印结果。
+`ops` 为程序在规模 N 下执行的基本操作次数，用于换算 ops/sec
+"""
+import collections
+import textwrap
+
+
+Benchmark = collections.namedtuple('Benchmark', 'name, source, n, ops')
+
+
+def benchmark(name, n, ops, source):
+    return Benchmark(name, textwrap.dedent(source), n, ops)
+
+
+PROGRAMS = collections.OrderedDict((bench.name, bench) for bench in [
+    # 基本操作：一次函数调用（每个 fib(15) 递归调用 1973 次）
+    benchmark('fib', 4, lambda n: n * 1973, """\
+        def fib(n):
+            if n < 2:
+                return n
+            return fib(n - 1) + fib(n - 2)
+
+        result = [fib(15) for _ in range(N)]
+        print(result[-1])
+    """),
+
+    # 基本操作：内层循环的一次迭代
+    benchmark('nested_loops', 200, lambda n: n * 100, """\
+        def loops(n):
+            total = 0
+            for i in range(n):
+                for j in range(100):
+                    if i < j:
+                        total = total + i * j
+                    else:
+                        total = total - j
+            return total
+
+        result = loops(N)
+        print(result)
+    """),
+
+    # 基本操作：追加或推导出一个元素
+    benchmark('list_building', 5000, lambda n: n * 3, """\
+        def build(n):
+            squares = []
+            for i in range(n):
+                squares.append(i * i)
+            evens = [x for x in squares if x % 2 == 0]
+            pairs = [(x, x + 1) for x in range(n)]
+            return len(squares) + len(evens) + len(pairs)
+
+        result = build(N)
+        print(result)
+    """),
+
+    # 基本操作：一次字典读写
+    benchmark('dict_heavy', 5000, lambda n: n * 3, """\
+        def count(n):
+            counts = {}
+            for i in range(n):
+                key = i % 97
+                counts[key] = counts.get(key, 0) + 1
+            index = {}
+            for key in counts:
+                index[str(key)] = counts[key]
+            found = 0
+            for i in range(n):
+                if str(i % 131) in index:
+                    found = found + 1
+            return sorted(counts.items())[:3], found
+
+        result = count(N)
+        print(result)
+    """),
+
+    # 基本操作：抛出并捕获一次异常
+    benchmark('exception_heavy', 2000, lambda n: n, """\
+        def parse(values):
+            good = 0
+            bad = 0
+            for value in values:
+                try:
+                    if value % 3 == 0:
+                        raise ValueError(value)
+                    good = good + {}[value] if value % 3 == 1 else good + 1
+                except KeyError:
+                    bad = bad + 1
+                except ValueError as e:
+                    bad = bad + e.args[0] % 2
+                finally:
+                    good = good + 0
+            return good, bad
+
+        result = parse(range(N))
+        print(result)
+    """),
+
+    # 基本操作：一次闭包调用
+    benchmark('closure_heavy', 2000, lambda n: n * 3, """\
+        def make_adder(step):
+            def add(x):
+                return x + step
+            return add
+
+        def accumulate(n):
+            total = 0
+            counter = [0]
+            def bump():
+                counter[0] = counter[0] + 1
+                return counter[0]
+            for i in range(n):
+                total = make_adder(i)(total)
+                total = total + bump()
+            key = lambda x: -x
+            return total, sorted(range(n), key=key)[:3]
+
+        result = accumulate(N)
+        print(result)
+    """),
+])
@@ -0,0 +1,154 @@
+"""sByterun 与原生 CPython 的对比性能测试
+
+每个程序分别在 `VirtualMachine.run_code` 与原生 `exec` 下重复运行，
+输出每个程序的 ops/sec、相对原生的慢速倍数、峰值内存与多次运行耗时的方差（JSON）
+
+    python -m benchmarks.suite [-r 次数] [--scale 倍数] [--engine table|threaded]
+                               [--superinstructions] [--exception-table]
+                               [--hybrid] [--peephole] [-o 输出文件] [程序名 ...]
+"""
+import argparse
+import io
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+from byterun.byterun import VirtualMachine
+
+from .programs import PROGRAMS
+
+
+class Run(object):
+    """一次运行的结果：耗时、`result` 全局变量、标准输出，以及出错时的异常"""
+
+    def __init__(self, elapsed, result, stdout, error=None):
+        self.elapsed = elapsed
+        self.result = result
+        self.stdout = stdout
+        self.error = error
+
+
+def execute(bench, native=False, n=None, vm_options=None):
+    """运行一次程序，`native` 为真时用原生 exec，否则在新建的虚拟机中运行"""
+    code_obj = compile(bench.source, '<%s>' % bench.name, 'exec')
+    f_globals = {
+        '__builtins__': __builtins__,
+        '__name__': '__main__',
+        '__doc__': None,
+        '__package__': None,
+        'N': bench.n if n is None else n,
+    }
+    vm = None if native else VirtualMachine(**(vm_options or {}))
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    error = None
+    start = time.perf_counter()
+    try:
+        if native:
+            exec(code_obj, f_globals)
+        else:
+            vm.run_code(code_obj, f_globals=f_globals)
+    except Exception as e:
+        error = '%s: %s' % (type(e).__name__, e)
+    finally:
+        elapsed = time.perf_counter() - start
+        output = sys.stdout.getvalue()
+        sys.stdout = stdout
+    return Run(elapsed, f_globals.get('result'), output, error)
+
+
+def peak_memory(bench, native=False, n=None, vm_options=None):
+    """单独运行一次，返回 tracemalloc 统计的峰值内存（字节）"""
+    tracemalloc.start()
+    try:
+        execute(bench, native, n, vm_options)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(times, ops):
+    median = statistics.median(times)
+    return {
+        'times': times,
+        'median': median,
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'variance': statistics.variance(times) if len(times) > 1 else 0.0,
+        'ops_per_sec': ops / median if median else None,
+    }
+
+
+def measure(bench, native=False, repeat=5, n=None, vm_options=None):
+    """重复运行 `repeat` 次，返回统计结果；出错时只返回错误信息"""
+    n = bench.n if n is None else n
+    runs = [execute(bench, native, n, vm_options) for _ in range(repeat)]
+    if runs[0].error:
+        return {'error': runs[0].error}
+    stats = summarize([run.elapsed for run in runs], bench.ops(n))
+    stats['peak_memory'] = peak_memory(bench, native, n, vm_options)
+    return stats
+
+
+def run_suite(names=None, repeat=5, scale=1.0, vm_options=None):
+    """运行套件，返回每个程序一项的结果列表"""
+    results = []
+    for name in names or PROGRAMS:
+        bench = PROGRAMS[name]
+        n = max(1, int(bench.n * scale))
+        vm = measure(bench, False, repeat, n, vm_options)
+        native = measure(bench, True, repeat, n)
+        slowdown = None
+        if 'error' not in vm and 'error' not in native:
+            slowdown = vm['median'] / native['median']
+        results.append({
+            'name': name,
+            'n': n,
+            'ops': bench.ops(n),
+            'vm': vm,
+            'native': native,
+            'slowdown': slowdown,
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('names', nargs='*')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--engine', default='table')
+    parser.add_argument('--superinstructions', action='store_true')
+    parser.add_argument('--exception-table', action='store_true')
+    parser.add_argument('--peephole', action='store_true')
+    parser.add_argument('--hybrid', action='store_true')
+    parser.add_argument('-o', '--output')
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in PROGRAMS:
+            parser.error('unknown benchmark: %s' % name)
+
+    vm_options = {'engine': args.engine,
+                  'superinstructions': args.superinstructions,
+                  'exception_table': args.exception_table,
+                  'hybrid': args.hybrid,
+                  'peephole': args.peephole}
+    report = {
+        'python': sys.version.split()[0],
+        'vm_options': vm_options,
+        'repeat': args.repeat,
+        'benchmarks': run_suite(args.names, args.repeat, args.scale,
+                                vm_options),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
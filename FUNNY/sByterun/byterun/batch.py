@@ -0,0 +1,271 @@
+"""批量运行：在进程池中用虚拟机运行大量相互独立的小程序
+
+    python -m byterun.batch [-j 进程数] [--timeout 秒] [--max-jobs 个数]
+                            [--cache-dir 目录] [--engine table|threaded]
+                            [--superinstructions] [--exception-table]
+                            [--peephole] 文件 ...
+
+文件名为 `-` 时从标准输入逐行读取文件名。每个程序运行结束后输出一行 JSON，
+按完成顺序排列；有程序出错、超时或工作进程崩溃时退出码为 1
+"""
+import argparse
+import builtins
+import collections
+import io
+import json
+import marshal
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+import traceback
+import types
+from multiprocessing.connection import wait
+
+from .byterun import ENGINES, VirtualMachine
+
+
+# 以源代码给出的程序
+Job = collections.namedtuple('Job', 'name, source')
+
+# 一个程序的运行结果：`index` 为程序在输入中的序号，`status` 为 ok / error / timeout / crashed，
+# `result` 为程序运行后全局变量 `result` 的值（不能 pickle 时为其 repr），
+# `error` 与 `traceback` 为异常的描述，`pid` 为运行该程序的工作进程
+JobResult = collections.namedtuple(
+    'JobResult',
+    'index, name, status, result, stdout, error, traceback, elapsed, pid')
+
+
+def _job_message(item):
+    """把输入项转换为发送给工作进程的 (类型, 名称, 内容)"""
+    if isinstance(item, Job):
+        return ('source', item.name, item.source)
+    if isinstance(item, types.CodeType):
+        # code object 不能 pickle，以 marshal 格式发送
+        return ('code', item.co_filename, marshal.dumps(item))
+    return ('path', item, None)
+
+
+def _run_job(vm, message, result_name):
+    kind, name, payload = message
+    f_globals = {
+        '__builtins__': builtins,
+        '__name__': '__main__',
+        '__doc__': None,
+        '__package__': None,
+    }
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    status, error, tb, value = 'ok', None, None, None
+    start = time.perf_counter()
+    try:
+        if kind == 'code':
+            code = marshal.loads(payload)
+        else:
+            if kind == 'path':
+                f_globals['__file__'] = name
+                with open(name) as f:
+                    payload = f.read()
+            code = vm.compile_source(payload, name)
+        vm.run_code(code, f_globals=f_globals)
+        value = f_globals.get(result_name)
+    except SystemExit as e:
+        # 程序调用 sys.exit() 只结束该程序，不结束工作进程；
+        # 与进程退出码一致，以 0 或 None 退出视为正常结束
+        if e.code is None or e.code == 0:
+            value = f_globals.get(result_name)
+        else:
+            status = 'error'
+            error = 'SystemExit: %s' % (e.code,)
+            tb = traceback.format_exc()
+    except Exception as e:
+        status = 'error'
+        error = '%s: %s' % (type(e).__name__, e)
+        tb = traceback.format_exc()
+    finally:
+        elapsed = time.perf_counter() - start
+        output = sys.stdout.getvalue()
+        sys.stdout = stdout
+    if vm.frames:
+        # 宿主异常打断了运行，调用栈上残留的帧不能带到下一个程序
+        vm.frames[:] = []
+        vm.frame = None
+    try:
+        pickle.dumps(value)
+    except Exception:
+        value = repr(value)
+    return status, value, output, error, tb, elapsed
+
+
+def _worker_main(conn, vm_options, cache_dir, result_name):
+    """工作进程：整个生命周期使用同一个虚拟机，预解码指令流的缓存也在进程内共享"""
+    vm = VirtualMachine(cache_dir=cache_dir, **vm_options)
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        conn.send(_run_job(vm, message, result_name))
+
+
+class _Worker(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.process = None
+        self.start()
+
+    def start(self):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_main, args=(child,) + self.args)
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        self.done = 0
+        self.job = None
+
+    def submit(self, index, message, timeout):
+        self.conn.send(message)
+        self.job = (index, message[1])
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+
+    def finish(self, status, value=None, output='', error=None, tb=None,
+               elapsed=None):
+        index, name = self.job
+        self.job = None
+        self.done += 1
+        return JobResult(index, name, status, value, output, error, tb,
+                         elapsed, self.process.pid)
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.terminate()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.process.join()
+        self.conn.close()
+
+    def restart(self, kill=False):
+        self.stop(kill)
+        self.start()
+
+
+def run_batch(jobs, workers=None, timeout=None, max_jobs=None,
+              vm_options=None, cache_dir=None, result_name='result'):
+    """在进程池中运行 `jobs`，按完成顺序逐个产出 JobResult
+       `jobs` 可以是列表或任意迭代器，其中每项为源文件路径、code object 或 Job；
+       只在有空闲工作进程时才从中取下一项，因此可以边产生边运行。
+       每个工作进程持有一个虚拟机（`vm_options` 为其构造参数）并复用其缓存，
+       `cache_dir` 为所有进程共享的持久化缓存目录（见 DiskCache）。
+       单个程序运行超过 `timeout` 秒时终止其工作进程并记为 timeout；
+       每个工作进程运行 `max_jobs` 个程序后换成新进程，以限制内存增长
+    """
+    args = (vm_options or {}, cache_dir, result_name)
+    pool = [_Worker(args) for _ in range(workers or os.cpu_count() or 1)]
+    jobs = enumerate(jobs)
+    exhausted = False
+    try:
+        while True:
+            for worker in pool:
+                if worker.job is None and not exhausted:
+                    try:
+                        index, item = next(jobs)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    worker.submit(index, _job_message(item), timeout)
+            running = [worker for worker in pool if worker.job is not None]
+            if not running:
+                break
+            wait_time = None
+            if timeout is not None:
+                wait_time = max(0, min(w.deadline for w in running) -
+                                time.monotonic())
+            ready = wait([worker.conn for worker in running], wait_time)
+            now = time.monotonic()
+            for worker in running:
+                if worker.conn in ready:
+                    try:
+                        reply = worker.conn.recv()
+                    except (EOFError, OSError):
+                        # 工作进程在运行中退出（如解释器崩溃、内存耗尽被杀死）
+                        worker.process.join()
+                        result = worker.finish(
+                            'crashed', error='worker exited with code %s'
+                            % worker.process.exitcode)
+                        worker.restart(kill=True)
+                        yield result
+                        continue
+                    result = worker.finish(*reply)
+                    if max_jobs is not None and worker.done >= max_jobs:
+                        worker.restart()
+                    yield result
+                elif worker.deadline is not None and now >= worker.deadline:
+                    result = worker.finish(
+                        'timeout', error='timed out after %gs' % timeout,
+                        elapsed=timeout)
+                    worker.restart(kill=True)
+                    yield result
+    finally:
+        for worker in pool:
+            worker.stop(kill=worker.job is not None)
+
+
+def read_paths(names):
+    """展开命令行中的文件名，`-` 表示从标准输入逐行读取"""
+    for name in names:
+        if name == '-':
+            for line in sys.stdin:
+                line = line.strip()
+                if line:
+                    yield line
+        else:
+            yield name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('-j', '--workers', type=int)
+    parser.add_argument('--timeout', type=float)
+    parser.add_argument('--max-jobs', type=int)
+    parser.add_argument('--cache-dir')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='table')
+    parser.add_argument('--superinstructions', action='store_true')
+    parser.add_argument('--exception-table', action='store_true')
+    parser.add_argument('--peephole', action='store_true')
+    args = parser.parse_args(argv)
+
+    vm_options = {'engine': args.engine,
+                  'superinstructions': args.superinstructions,
+                  'exception_table': args.exception_table,
+                  'peephole': args.peephole}
+    counts = collections.Counter()
+    start = time.perf_counter()
+    for result in run_batch(read_paths(args.files), args.workers,
+                            args.timeout, args.max_jobs, vm_options,
+                            args.cache_dir):
+        counts[result.status] += 1
+        record = result._asdict()
+        try:
+            line = json.dumps(record)
+        except TypeError:
+            record['result'] = repr(result.result)
+            line = json.dumps(record)
+        print(line, flush=True)
+    print('%d jobs in %.3fs: %s' % (
+        sum(counts.values()), time.perf_counter() - start,
+        ', '.join('%s %d' % item for item in sorted(counts.items()))),
+        file=sys.stderr)
+    return 1 if set(counts) - {'ok'} else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,42 +1,264 @@
 from __future__ import print_function
 
 import collections
+import hashlib
 import operator
 import dis
 import sys
+import threading
 import types
 import inspect
+import json
+import marshal
+import os
+import time
 
 class VirtualMachineError(Exception):
     pass
 
+class ResourceLimitExceeded(VirtualMachineError):
+    """运行超出 run_code 给出的限制，`limit` 为 'instructions'、'deadline' 或 'depth'"""
+
+    def __init__(self, limit, message):
+        super(ResourceLimitExceeded, self).__init__(message)
+        self.limit = limit
+
+# 有截止时间时两次读取时钟之间最多计入的指令数
+DEADLINE_CHECK_INTERVAL = 10000
+
 class VirtualMachine(object):
     """VirtualMachine 类：管理最高层结构，特别时调用栈，同时管理指令到操作的映射"""
 
-    def __init__(self):
+    def __init__(self, superinstructions=False, engine='table',
+                 exception_table=False, cache_dir=None, hybrid=False,
+                 hot_threshold=1000, peephole=False, frame_pool=16):
         self.frames = []    # 调用栈
         self.frame = None
         self.return_value = None
+        # 正在传播的异常，以及正在处理（处于 except / finally 块中）的异常，
+        # 均为 (type, value, traceback)
         self.last_exception = None
-    
-    def run_code(self, code_obj, f_globals=None, f_locals=None):
+        self.exc_info = (None, None, None)
+        # 按指令码索引的分派表，每个虚拟机类只构建一次
+        self.dispatch_table = self.get_dispatch_table()
+        # 预解码指令流的缓存，`superinstructions` 为真时对指令流做超级指令融合，
+        # `exception_table` 为真时把 try/except 的块操作预先计算为异常表，
+        # `peephole` 为真时做常量折叠等窥孔优化（见 peephole_optimize）
+        self.code_cache = get_code_cache(superinstructions, exception_table,
+                                         peephole)
+        # 给出 `cache_dir` 时，run_source 把编译与优化结果持久化到该目录（见 DiskCache）
+        self.disk_cache = DiskCache(cache_dir) if cache_dir else None
+        # 执行引擎：'table' 查表分派预解码指令流，'threaded' 执行闭包串联的指令流
+        if engine not in ENGINES:
+            raise ValueError("unknown engine: %r" % (engine,))
+        self.engine = engine
+        self.execute = getattr(self, ENGINES[engine])
+        # 指令级性能剖析器，见 enable_profiling
+        self.profiler = None
+        # 按指令数采样的采样剖析器，见 SamplingProfiler
+        self.sampler = None
+        # 混合执行：`hybrid` 为真时，被调用超过 `hot_threshold` 次（为 None 则不按次数）
+        # 或含有虚拟机未实现指令的虚拟机函数改由宿主解释器运行其真实函数（见 call_native）
+        self.hybrid = hybrid
+        self.hot_threshold = hot_threshold
+        # 每个 code object 在虚拟机中的调用次数、已确定以原生方式运行的 code object，
+        # 以及原生运行的 [调用次数, 累计耗时]（耗时包含其中再调用的函数）
+        self.call_counts = {}
+        self.native_codes = set()
+        self.native_calls = {}
+        # 原生运行的 code object 可能写入的命名空间中的名字（见 _native_writes）
+        self.native_writes = {}
+        # run_code 给出的运行限制：剩余指令预算、截止时间（time.monotonic）与最大调用深度，
+        # 为 None 表示不限制（见 set_limits）。回跳与调用只递减计数器 `ticks`，
+        # 用完后才在 check_limits 中结算预算、读取时钟，`tick_slice` 为上次补充的数量
+        self.instructions_left = None
+        self.deadline = None
+        self.max_depth = None
+        self.frame_limit = sys.maxsize
+        self.ticks = self.tick_slice = 0
+        # 是否设置了任一限制：宿主解释器中的运行不受限制约束，此时不以原生方式运行
+        self.has_limits = False
+        # 函数帧的空闲链表：code object -> 可复用的帧，每个 code object 最多保留
+        # `frame_pool` 个（为 0 时不复用），见 release_frame
+        self.frame_pool = {}
+        self.frame_pool_size = frame_pool
+
+    @classmethod
+    def get_dispatch_table(cls):
+        """获取当前类的分派表（按需构建并缓存在类上）"""
+        table = cls.__dict__.get('_dispatch_table')
+        if table is None:
+            table = cls.build_dispatch_table()
+            cls._dispatch_table = table
+        return table
+
+    @classmethod
+    def build_dispatch_table(cls):
+        """构建分派表：`table[opcode]` 为以 (vm, *arguments) 调用的处理函数
+           一元/二元操作指令直接绑定到对应的运算函数，不再在运行时拼接方法名
+        """
+        table = []
+        for byteCode, byteName in enumerate(OPNAMES):
+            if byteCode == dis.EXTENDED_ARG:
+                handler = _nop
+            elif byteName.startswith('LOAD_CONST__BINARY_'):
+                # 超级指令：常量作为右操作数的二元运算
+                handler = _make_const_binary_handler(
+                    cls.BINARY_OPERATORS.get(byteName[19:])
+                )
+            elif '__' in byteName:
+                # 其他超级指令
+                handler = getattr(cls, 'byte_%s' % byteName, None)
+            elif byteName.startswith('UNARY_'):
+                handler = _make_unary_handler(
+                    cls.UNARY_OPERATORS.get(byteName[6:])
+                )
+            elif byteName.startswith('BINARY_'):
+                handler = _make_binary_handler(
+                    cls.BINARY_OPERATORS.get(byteName[7:])
+                )
+            elif byteName.startswith('INPLACE_'):
+                handler = _make_binary_handler(
+                    cls.INPLACE_OPERATORS.get(byteName[8:])
+                )
+            else:
+                handler = getattr(cls, 'byte_%s' % byteName, None)
+            if handler is None:
+                handler = _make_unknown_handler(byteName)
+            table.append(handler)
+        return table
+
+    @classmethod
+    def get_limited_dispatch_table(cls):
+        """获取带运行限制检查的分派表（按需构建并缓存在类上）"""
+        table = cls.__dict__.get('_limited_dispatch_table')
+        if table is None:
+            table = cls.build_limited_dispatch_table()
+            cls._limited_dispatch_table = table
+        return table
+
+    @classmethod
+    def build_limited_dispatch_table(cls):
+        """构建带运行限制检查的分派表：只替换回跳与调用指令的处理函数，
+           其余指令与普通分派表相同，不限制时的运行不受影响
+        """
+        table = list(cls.get_dispatch_table())
+        for byteCode, byteName in enumerate(OPNAMES):
+            if byteCode in dis.hasjabs:
+                table[byteCode] = _make_limited_jump(table[byteCode], 0)
+            elif byteName.startswith('COMPARE_OP__POP_JUMP_IF_'):
+                table[byteCode] = _make_limited_jump(table[byteCode], 1)
+            elif byteName.startswith('CALL_'):
+                table[byteCode] = _make_limited_call(table[byteCode])
+        return table
+
+    def run_code(self, code_obj, f_globals=None, f_locals=None,
+                 max_instructions=None, timeout=None, max_depth=None):
         """运行Python程序的入口
            `code_obj` 为源代码编译后的 code object
            `run_code` 根据 `code_obj` 新建帧并运行
+           `max_instructions`、`timeout`（秒）与 `max_depth`（调用栈帧数）限制本次运行，
+           超出时抛出 ResourceLimitExceeded（见 set_limits）
         """
         frame = self.make_frame(code_obj, 
                                 f_globals=f_globals, 
                                 f_locals=f_locals)
-        self.run_frame(frame)
-    
-    def make_frame(self, code_obj, callargs={}, f_globals=None, f_locals=None):
+        if max_instructions is None and timeout is None and max_depth is None:
+            self.run_frame(frame)
+            return
+        saved = self.set_limits(max_instructions, timeout, max_depth)
+        try:
+            self.run_frame(frame)
+        finally:
+            self.set_limits(*saved)
+
+    def set_limits(self, max_instructions=None, timeout=None, max_depth=None):
+        """设置运行限制并返回原先的限制（可再传给 set_limits 恢复）
+           限制只在回跳与调用时检查：有限制时换用 get_limited_dispatch_table 的分派表。
+           指令数按静态估计计入：每次回跳计入循环体的指令数，每次调用计入 1 条，
+           调用虚拟机函数时再计入被调函数的指令数。超出预算与截止时间后每次检查都会
+           再次抛出，程序中的 except 无法让运行继续下去
+        """
+        left = self.instructions_left
+        if left is not None:
+            left -= self.tick_slice - self.ticks
+        remaining = None
+        if self.deadline is not None:
+            remaining = max(self.deadline - time.monotonic(), 0)
+        saved = (left, remaining, self.max_depth)
+        self.instructions_left = max_instructions
+        self.deadline = None
+        if timeout is not None:
+            self.deadline = time.monotonic() + timeout
+        self.max_depth = max_depth
+        self.frame_limit = sys.maxsize if max_depth is None else max_depth
+        self.ticks = self.tick_slice = 0
+        self.has_limits = not (max_instructions is None and timeout is None
+                               and max_depth is None)
+        if not self.has_limits:
+            self.dispatch_table = self.get_dispatch_table()
+        else:
+            self.dispatch_table = self.get_limited_dispatch_table()
+            self.check_limits()
+        return saved
+
+    def check_limits(self):
+        """计数器 `ticks` 用完或调用栈超出深度时调用：检查调用深度、结算指令预算、
+           检查截止时间，再补充计数器。有截止时间时每 DEADLINE_CHECK_INTERVAL 条指令
+           读取一次时钟
+        """
+        if len(self.frames) > self.frame_limit:
+            raise ResourceLimitExceeded('depth', "maximum frame depth exceeded")
+        left = self.instructions_left
+        if left is not None:
+            left = self.instructions_left = left - (self.tick_slice - self.ticks)
+            if left < 0:
+                self.ticks = self.tick_slice = 0
+                raise ResourceLimitExceeded(
+                    'instructions', "instruction budget exhausted")
+        if self.deadline is not None:
+            if time.monotonic() > self.deadline:
+                self.ticks = self.tick_slice = 0
+                raise ResourceLimitExceeded('deadline', "deadline exceeded")
+            ticks = DEADLINE_CHECK_INTERVAL
+        else:
+            ticks = sys.maxsize
+        if left is not None:
+            ticks = min(ticks, left)
+        self.ticks = self.tick_slice = ticks
+
+    def charge_call(self, frame):
+        """宿主代码回调虚拟机函数（见 Function.__call__）时同样计入预算、检查调用深度；
+           `frame` 为即将运行、尚未压入调用栈的被调帧。不限制时 check_limits
+           把计数器补充为 sys.maxsize，此后只有一次减法与两次比较
+        """
+        self.ticks -= 1 + len(frame.decoded.instructions)
+        if len(self.frames) >= self.frame_limit:
+            raise ResourceLimitExceeded('depth', "maximum frame depth exceeded")
+        if self.ticks < 0:
+            self.check_limits()
+
+    def compile_source(self, source, filename='<string>'):
+        """编译源代码，启用了持久化缓存时优先从缓存中读取"""
+        if self.disk_cache is None:
+            return compile(source, filename, 'exec')
+        return self.disk_cache.compile(source, filename, self.code_cache)
+
+    def run_source(self, source, filename='<string>', f_globals=None,
+                   f_locals=None, **limits):
+        """编译并运行源代码（见 compile_source 与 run_code）"""
+        self.run_code(self.compile_source(source, filename),
+                      f_globals=f_globals, f_locals=f_locals, **limits)
+
+    def make_frame(self, code_obj, callargs={}, f_globals=None, f_locals=None,
+                   closure=None):
         """新建帧，主要对帧拥有的命名空间进行初始化
            `code_obj` 为 `code_obj`
            `callargs` 为函数调用时的参数
+           `closure` 为 code object 自由变量对应的 cell 元组
         """
-        if f_globals:
-            f_globals = f_globals
-            if not f_locals:
+        if f_globals is not None:
+            if f_locals is None:
                 f_locals = f_globals
         elif self.frames:
             f_globals = self.frame.f_globals
@@ -48,9 +270,18 @@ class VirtualMachine(object):
                 '__doc__': None,
                 '__package__': None,
             }
+        if code_obj.co_flags & inspect.CO_OPTIMIZED:
+            # 函数帧不建局部变量字典，参数按 co_varnames 下标写入快速局部变量槽位
+            decoded = self.code_cache.get(code_obj)
+            fastlocals = [_UNBOUND] * code_obj.co_nlocals
+            for name, value in callargs.items():
+                fastlocals[decoded.varindex[name]] = value
+            return Frame(code_obj, f_globals, None, self.frame, fastlocals,
+                         decoded, closure)
         # 将函数调用时的参数更新到局部变量空间中
         f_locals.update(callargs)
-        frame = Frame(code_obj, f_globals, f_locals, self.frame)
+        frame = Frame(code_obj, f_globals, f_locals, self.frame,
+                      decoded=self.code_cache.get(code_obj), closure=closure)
         return frame
     
     def push_frame(self, frame):
@@ -67,105 +298,282 @@ class VirtualMachine(object):
             self.frame = None
 
     def run_frame(self, frame):
-        """运行帧直至返回"""
+        """运行帧直至返回，返回帧的返回值"""
+        return self.resume_frame(frame)[1]
+
+    def resume_frame(self, frame, exc_info=None):
+        """运行（或恢复运行）帧直至返回或挂起，返回 (why, value)，why 为 'return' 或 'yield'
+           给出 `exc_info` 时，帧在恢复处直接抛出该异常（见 Generator.throw）
+        """
         self.push_frame(frame)
+        why = None
+        if exc_info is not None:
+            self.last_exception = exc_info
+            why = 'exception'
+        why = self.run_frames(frame, why)
+        self.pop_frame()
+        if why == 'exception':
+            # 抛出原来的异常对象，不重新构造
+            raise self.last_exception[1]
+        return why, self.return_value
+
+    def run_frames(self, entry, why=None, preemptible=False):
+        """主循环：从调用栈顶帧开始运行，直到入口帧 `entry` 返回、挂起或抛出异常，
+           返回 'return'、'yield' 或 'exception'，入口帧仍留在调用栈上。
+           指令由执行引擎 `self.execute` 逐条运行，直到出现返回、挂起、异常、块跳转或调用；
+           虚拟机函数之间的调用不会递归进入 run_frames：被调用帧由 CALL_FUNCTION
+           压入调用栈后，主循环直接切换到新帧执行，返回时再切回调用者。
+           执行引擎返回 'preempt' 时（见 byterun.green），`preemptible` 为真则连同整个
+           调用栈原样挂起并返回 'preempt'，下次以同一入口帧调用即从断点继续；
+           否则当前运行嵌套在宿主调用中，无法挂起，交由 preempt_nested 处理
+        """
+        frame = self.frame
+        execute = self.execute
         while True:
-            byteName, arguments = self.parse_byte_and_args()
-            why = self.dispatch(byteName, arguments)
+            if not why:
+                why = execute(frame)
+            if why == 'call':
+                # 切换到被调用帧
+                frame = self.frame
+                why = None
+                continue
+            if why == 'yield':
+                # 只有生成器帧会挂起，它总是入口帧
+                break
+            if why == 'preempt':
+                if preemptible:
+                    break
+                why = self.preempt_nested()
+                continue
+            if why == 'exception':
+                self.chain_exception()
+                why = self.handle_exception(frame)
             while why and frame.block_stack:
                 why = self.manage_block_stack(why)
+            # 非入口帧结束时回到调用者：返回值压入调用者的数据栈，
+            # 异常则继续在调用者的异常表与块栈中展开
+            while why and frame is not entry:
+                self.pop_frame()
+                returned, frame = frame, self.frame
+                if why == 'return':
+                    self.release_frame(returned)
+                    self.push(self.return_value)
+                    why = None
+                else:
+                    why = self.handle_exception(frame)
+                while why and frame.block_stack:
+                    why = self.manage_block_stack(why)
             if why:
                 break
-        self.pop_frame()
-        if why == 'exception':
-            exc, val, tb = self.last_exception
-            e = exc(val)
-            e.__traceback__ = tb
-            raise e
-        return self.return_value
+        return why
 
+    def release_frame(self, frame):
+        """正常返回的帧放回所属 code object 的空闲链表，下次调用同一函数时复用
+           （见 Function.make_call_frame），省去帧与数据栈的分配和回收。
+           只回收函数帧；逃逸的帧（运行结束后仍可能被访问，见 Frame.mark_escaped）
+           不回收。闭包捕获的是 cell 而不是帧，不影响回收。
+           宿主代码需要保存帧时应通过 current_frame 取得，直接保存 vm.frame 的帧仍会被复用
+        """
+        if frame.escaped or frame.fastlocals is None or not self.frame_pool_size:
+            return
+        code = frame.f_code
+        if code.co_flags & _NOT_POOLED:
+            return
+        pool = self.frame_pool.get(code)
+        if pool is None:
+            pool = self.frame_pool[code] = []
+        if len(pool) < self.frame_pool_size:
+            frame.clear()
+            pool.append(frame)
+
+    def current_frame(self):
+        """供宿主代码（虚拟机调用的宿主函数、调试器等）取得当前帧；
+           取得的帧及其调用者在返回后不会被复用
+        """
+        frame = self.frame
+        if frame is not None:
+            frame.mark_escaped()
+        return frame
 
-    def parse_byte_and_args(self):
-        """解析指令及其参数（如果有的话）
-           需要注意的是，Python 3.6 以后，每条指令占2个字节
+    def preempt_nested(self):
+        """执行引擎请求让出、而当前运行嵌套在宿主调用中（如宿主代码调用的虚拟机函数、
+           生成器）无法挂起时调用，返回继续运行时的 why。默认忽略让出请求
         """
-        f = self.frame
-        opoffset = f.f_lasti
-        # 获取要运行的指令
-        currentOp = f.opcodes[opoffset]
-        byteCode = currentOp.opcode    # 指令码
-        byteName = currentOp.opname    # 指令名
-        f.f_lasti += 1
-        if byteCode == dis.EXTENDED_ARG:
-            # Prefixes any opcode which has an argument too big to fit into the
-            # default two bytes. ext holds two additional bytes which, taken
-            # together with the subsequent opcode’s argument, comprise a
-            # four-byte argument, ext being the two most-significant bytes.
-            # We simply ignore the EXTENDED_ARG because that calculation
-            # is already done by dis, and stored in next currentOp.
-            # Lib/dis.py:_unpack_opargs
-            return self.parse_byte_and_args()
-        # 指令码 < dis.HAVE_ARGUMENT 都是有参指令
-        if byteCode >= dis.HAVE_ARGUMENT:
-            intArg = currentOp.arg
-            if byteCode in dis.hasconst:   # 查找常量
-                arg = f.f_code.co_consts[intArg]
-            elif byteCode in dis.hasname:  # 查找变量名
-                arg = f.f_code.co_names[intArg]
-            elif byteCode in dis.haslocal: # 查找局部变量名
-                arg = f.f_code.co_varnames[intArg]
-            elif byteCode in dis.hasjrel:  # 相对跳转位置
-                arg = f.f_lasti + intArg//2
-            elif byteCode in dis.hasjabs:  # 绝对跳转位置
-                arg = intArg//2
-            else:
-                arg = intArg
-            arguments = [arg]
+        return None
+
+    def chain_exception(self):
+        """新抛出的异常发生在 except / finally 块中时，把正在处理的异常记为其 __context__"""
+        value = self.last_exception[1]
+        handled = self.exc_info[1]
+        if handled is None or handled is value:
+            return
+        # 与 CPython 相同，避免在 __context__ 链上形成环
+        context = handled
+        while context is not None:
+            if context.__context__ is value:
+                context.__context__ = None
+                break
+            context = context.__context__
+        value.__context__ = handled
+
+    def handle_exception(self, frame):
+        """在帧的异常表中查找覆盖出错指令的 try 语句，找到时跳转到处理代码并返回 None，
+           否则返回 'exception'，交由块栈继续展开。异常表按起点从后往前排列，
+           第一个覆盖出错指令的表项即最内层的 try 语句
+        """
+        handlers = frame.decoded.handlers
+        if not handlers:
+            return 'exception'
+        index = frame.f_lasti - 1
+        for start, end, handler, level in handlers:
+            if start <= index < end:
+                break
         else:
-            arguments = []
-        return byteName, arguments
-    
-    def dispatch(self, byteName, arguments):
-        """映射每条指令调用的方法函数"""
+            return 'exception'
+        # 先展开位于该 try 语句之内的块（循环、finally、内层的 except 处理块），
+        # 其中的 finally 或未编入异常表的 try 语句会先接住异常
+        while frame.block_stack and start <= frame.block_stack[-1][1] < end:
+            if self.manage_block_stack('exception') is None:
+                return None
+        if frame.sp > level:
+            self.popn(frame.sp - level)
+        self.enter_handler(handler)
+        return None
+
+    def enter_handler(self, handler):
+        """进入 except / finally 处理代码：压入 except-handler 块，
+           依次压入原先正在处理的异常与新异常（各为 traceback、value、type 三个元素）
+        """
+        self.push_block('except-handler', handler)
+        exctype, value, tb = self.exc_info
+        self.push(tb, value, exctype)
+        exctype, value, tb = self.exc_info = self.last_exception
+        self.push(tb, value, exctype)
+        self.jump(handler)
+
+    def execute_table(self, frame):
+        """查表分派引擎：每条指令做一次下标取指、一次查表和一次函数调用"""
+        table = self.dispatch_table
+        opcodes = frame.decoded.instructions
         why = None
         try:
-            # 一元/二元操作指令都需要弹出数据栈，需与其他指令做出区分
-            if byteName.startswith('UNARY_'):
-                self.unaryOperator(byteName[6:])
-            elif byteName.startswith('BINARY_'):
-                self.binaryOperator(byteName[7:])
-            else:
-                # 通过指令名获取对应方法函数
-                bytecode_fn = getattr(self, 'byte_%s' % byteName, None)
-                if not bytecode_fn:
-                    raise VirtualMachineError(
-                        "unknown bytecode type: %s" % byteName
-                    )
-                why = bytecode_fn(*arguments)
+            while not why:
+                byteCode, byteName, arguments = opcodes[frame.f_lasti]
+                frame.f_lasti += 1
+                why = table[byteCode](self, *arguments)
         except:
             # 存储运行指令时的异常信息
             self.last_exception = sys.exc_info()[:2] + (None,)
             why = 'exception'
         return why
-    
+
+    def enable_profiling(self, profiler=None):
+        """开启指令级性能剖析，返回收集数据的 OpcodeProfiler
+           开启后执行引擎切换为带计时的 execute_profiled，关闭后换回原引擎，
+           未开启时主循环不做任何额外工作
+        """
+        if profiler is None:
+            profiler = OpcodeProfiler()
+        self.profiler = profiler
+        self.execute = self.execute_profiled
+        return profiler
+
+    def disable_profiling(self):
+        """关闭性能剖析，返回已收集数据的剖析器"""
+        profiler = self.profiler
+        self.profiler = None
+        self.execute = getattr(self, ENGINES[self.engine])
+        return profiler
+
+    def execute_profiled(self, frame):
+        """带剖析的查表分派引擎：记录每条指令的指令名、所在 code object 与行号以及耗时"""
+        profiler = self.profiler
+        record = profiler.record
+        clock = profiler.clock
+        table = self.dispatch_table
+        opcodes = frame.decoded.instructions
+        code = frame.f_code
+        lines = frame.decoded.lines
+        if frame.f_lasti == 0 and code.co_flags & inspect.CO_OPTIMIZED:
+            # 函数帧从第一条指令开始执行，即一次函数调用
+            profiler.record_call(code)
+        why = None
+        try:
+            while not why:
+                i = frame.f_lasti
+                byteCode, byteName, arguments = opcodes[i]
+                frame.f_lasti = i + 1
+                start = clock()
+                try:
+                    why = table[byteCode](self, *arguments)
+                finally:
+                    # 超级指令融合、窥孔优化后的伪指令按实际执行的指令码记录
+                    record(code, OPNAMES[byteCode], lines[i], clock() - start)
+        except:
+            self.last_exception = sys.exc_info()[:2] + (None,)
+            why = 'exception'
+        return why
+
+    def execute_sampled(self, frame):
+        """按指令数采样的查表分派引擎：每执行 `sampler.instructions` 条指令采样一次调用栈"""
+        sampler = self.sampler
+        table = self.dispatch_table
+        opcodes = frame.decoded.instructions
+        countdown = sampler.countdown
+        why = None
+        try:
+            while not why:
+                byteCode, byteName, arguments = opcodes[frame.f_lasti]
+                frame.f_lasti += 1
+                countdown -= 1
+                if not countdown:
+                    # 在指令执行前采样，栈顶帧的行号即本条指令所在行
+                    sampler.sample()
+                    countdown = sampler.instructions
+                why = table[byteCode](self, *arguments)
+        except:
+            self.last_exception = sys.exc_info()[:2] + (None,)
+            why = 'exception'
+        sampler.countdown = countdown
+        return why
+
+    def execute_threaded(self, frame):
+        """闭包串联引擎：code object 首次执行时被翻译为闭包列表（见 compile_threaded），
+           参数与跳转目标已绑定在闭包中，每条指令只做一次下标取指和一次调用
+        """
+        ops = frame.decoded.threaded_ops(self.dispatch_table)
+        why = None
+        try:
+            while not why:
+                i = frame.f_lasti
+                frame.f_lasti = i + 1
+                why = ops[i](self)
+        except:
+            self.last_exception = sys.exc_info()[:2] + (None,)
+            why = 'exception'
+        return why
+
     def push_block(self, b_type, handler=None):
-        level = len(self.frame.stack)
-        self.frame.block_stack.append(Block(b_type, handler, level))
+        frame = self.frame
+        frame.block_stack += ((b_type, handler, frame.sp),)
 
     def pop_block(self):
-        return self.frame.block_stack.pop()
+        frame = self.frame
+        block = frame.block_stack[-1]
+        frame.block_stack = frame.block_stack[:-1]
+        return block
     
     def unwind_block(self, block):
-        if block.type == 'except-handler':
+        b_type, handler, level = block
+        if b_type == 'except-handler':
             # exception 对应3个元素：type、value、traceback
-            offset = 3
-        else:
-            offset = 0
-        while len(self.frame.stack) > block.level + offset:
-            self.pop()
-        if block.type == 'except-handler':
+            level += 3
+        if self.frame.sp > level:
+            self.popn(self.frame.sp - level)
+        if b_type == 'except-handler':
+            # 恢复进入处理代码前正在处理的异常
             tb, value, exctype = self.popn(3)
-            self.last_exception = exctype, value, tb
+            self.exc_info = exctype, value, tb
     
     def manage_block_stack(self, why):
         """管理一个帧的块栈
@@ -173,102 +581,245 @@ class VirtualMachine(object):
         """
         frame = self.frame
         block = frame.block_stack[-1]
-        if block.type == 'loop' and why == 'continue':
+        b_type, handler, _ = block
+        if b_type == 'loop' and why == 'continue':
             self.jump(self.return_value)
             why = None
             return why
         self.pop_block()
         self.unwind_block(block)
-        if block.type == 'loop' and why == 'break':
+        if b_type == 'loop' and why == 'break':
             why = None
-            self.jump(block.handler)
+            self.jump(handler)
             return why
-        if (block.type in ['setup-except', 'finally'] and why == 'exception'):
-            self.push_block('except-handler')
-            exctype, value, tb = self.last_exception
-            self.push(tb, value, exctype)
-            self.push(tb, value, exctype) # yes, twice
+        if (b_type in ['setup-except', 'finally'] and why == 'exception'):
+            self.enter_handler(handler)
             why = None
-            self.jump(block.handler)
             return why
-        elif block.type == 'finally':
+        elif b_type == 'finally':
             if why in ('return', 'continue'):
                 self.push(self.return_value)
             self.push(why)
             why = None
-            self.jump(block.handler)
+            self.jump(handler)
             return why
         return why
 
     # 栈顶帧的数据栈操作
+    # 数据栈按 co_stacksize 预分配，`frame.sp` 指向栈顶的下一个位置；
+    # 出栈后将槽位置为 None，避免已出栈的对象被数据栈继续引用
     def top(self):
-        return self.frame.stack[-1]
+        f = self.frame
+        return f.stack[f.sp - 1]
 
     def pop(self):
-        return self.frame.stack.pop()
+        f = self.frame
+        sp = f.sp = f.sp - 1
+        val = f.stack[sp]
+        f.stack[sp] = None
+        return val
 
     def push(self, *vals):
-        self.frame.stack.extend(vals)
+        f = self.frame
+        sp = f.sp
+        top = f.sp = sp + len(vals)
+        # 等长切片赋值，不会改变列表大小
+        f.stack[sp:top] = vals
 
     def popn(self, n):
-        """弹出多个值"""
+        """弹出多个值，只做一次连续切片"""
         if n:
-            ret = self.frame.stack[-n:]
-            self.frame.stack[-n:] = []
+            f = self.frame
+            top = f.sp
+            sp = f.sp = top - n
+            ret = f.stack[sp:top]
+            f.stack[sp:top] = _NONES[n] if n < len(_NONES) else [None] * n
             return ret
         else:
             return []
     
     def peek(self, n):
         """获取多个值"""
-        return self.frame.stack[-n]
+        f = self.frame
+        return f.stack[f.sp - n]
     
     ## Stack manipulation
 
+    # 高频指令直接操作 frame.stack / frame.sp，省去 push/pop 的方法调用
+
     def byte_LOAD_CONST(self, const):
-        self.push(const)
+        f = self.frame
+        f.stack[f.sp] = const
+        f.sp += 1
 
     def byte_POP_TOP(self):
-        self.pop()
+        f = self.frame
+        f.sp -= 1
+        f.stack[f.sp] = None
+
+    def byte_DUP_TOP(self):
+        self.push(self.top())
+
+    def byte_DUP_TOP_TWO(self):
+        a, b = self.popn(2)
+        self.push(a, b, a, b)
+
+    def byte_ROT_TWO(self):
+        a, b = self.popn(2)
+        self.push(b, a)
+
+    def byte_ROT_THREE(self):
+        a, b, c = self.popn(3)
+        self.push(c, a, b)
 
     ## Names
 
-    def byte_LOAD_NAME(self, name):
+    # LOAD_NAME / LOAD_GLOBAL 使用内联缓存：解码时为每条这类指令附加一个缓存槽位
+    # `cache`（同时存放在 `decoded.caches` 中），记录 [版本号, 命名空间, 值]。
+    # 版本号 `_namespace_version` 在虚拟机写入或删除“已被缓存过的名字”、
+    # 以及调用可能改写命名空间的宿主代码后递增（见 _may_write_namespaces），
+    # 命名空间则用来区分以不同 globals 运行的同一 code object
+
+    def byte_LOAD_NAME(self, name, cache):
         frame = self.frame
-        if name in frame.f_locals:
-            val = frame.f_locals[name]
-        elif name in frame.f_globals:
-            val = frame.f_globals[name]
-        elif name in frame.f_builtins:
-            val = frame.f_builtins[name]
+        if cache[0] == _namespace_version and cache[1] is frame.f_locals:
+            val = cache[2]
         else:
-            raise NameError("name '%s' is not defined" % name)
-        self.push(val)
+            if name in frame.f_locals:
+                # 局部命名空间中的名字通常会被频繁重新赋值，不做缓存
+                val = frame.f_locals[name]
+            else:
+                if name in frame.f_globals:
+                    val = frame.f_globals[name]
+                elif name in frame.f_builtins:
+                    val = frame.f_builtins[name]
+                else:
+                    raise NameError("name '%s' is not defined" % name)
+                _cached_names.add(name)
+                _cached_namespaces.update((id(frame.f_locals),
+                                           id(frame.f_globals),
+                                           id(frame.f_builtins)))
+                cache[:] = _namespace_version, frame.f_locals, val
+        frame.stack[frame.sp] = val
+        frame.sp += 1
 
     def byte_STORE_NAME(self, name):
-        self.frame.f_locals[name] = self.pop()
+        f = self.frame
+        sp = f.sp = f.sp - 1
+        if name in _cached_names:
+            _bump_namespace_version()
+        f.f_locals[name] = f.stack[sp]
+        f.stack[sp] = None
+
+    def byte_DELETE_NAME(self, name):
+        if name in _cached_names:
+            _bump_namespace_version()
+        del self.frame.f_locals[name]
+
+    def byte_LOAD_FAST(self, index):
+        f = self.frame
+        val = f.fastlocals[index]
+        if val is _UNBOUND:
+            raise UnboundLocalError(
+                "local variable '%s' referenced before assignment"
+                % f.f_code.co_varnames[index]
+            )
+        f.stack[f.sp] = val
+        f.sp += 1
 
-    def byte_LOAD_FAST(self, name):
-        if name in self.frame.f_locals:
-            val = self.frame.f_locals[name]
-        else:
+    def byte_STORE_FAST(self, index):
+        f = self.frame
+        sp = f.sp = f.sp - 1
+        f.fastlocals[index] = f.stack[sp]
+        f.stack[sp] = None
+
+    def byte_DELETE_FAST(self, index):
+        fastlocals = self.frame.fastlocals
+        if fastlocals[index] is _UNBOUND:
             raise UnboundLocalError(
-                "local variable '%s' referenced before assignment" % name
+                "local variable '%s' referenced before assignment"
+                % self.frame.f_code.co_varnames[index]
             )
-        self.push(val)
+        fastlocals[index] = _UNBOUND
 
-    def byte_STORE_FAST(self, name):
-        self.frame.f_locals[name] = self.pop()
+    def byte_LOAD_GLOBAL(self, name, cache):
+        f = self.frame
+        if cache[0] == _namespace_version and cache[1] is f.f_globals:
+            val = cache[2]
+        else:
+            if name in f.f_globals:
+                val = f.f_globals[name]
+            elif name in f.f_builtins:
+                val = f.f_builtins[name]
+            else:
+                raise NameError("global name '%s' is not defined" % name)
+            _cached_names.add(name)
+            _cached_namespaces.update((id(f.f_globals), id(f.f_builtins)))
+            cache[:] = _namespace_version, f.f_globals, val
+        f.stack[f.sp] = val
+        f.sp += 1
+
+    def byte_STORE_GLOBAL(self, name):
+        if name in _cached_names:
+            _bump_namespace_version()
+        self.frame.f_globals[name] = self.pop()
+
+    def byte_DELETE_GLOBAL(self, name):
+        if name in _cached_names:
+            _bump_namespace_version()
+        del self.frame.f_globals[name]
+
+    # cell 指令的参数已解码为 cell 在快速局部变量槽位中的下标（见 Frame.init_cells）
+
+    def byte_LOAD_CLOSURE(self, index):
+        f = self.frame
+        f.stack[f.sp] = f.fastlocals[index]
+        f.sp += 1
+
+    def byte_LOAD_DEREF(self, index):
+        f = self.frame
+        try:
+            val = f.fastlocals[index].cell_contents
+        except ValueError:
+            raise self.unbound_deref(index)
+        f.stack[f.sp] = val
+        f.sp += 1
 
-    def byte_LOAD_GLOBAL(self, name):
+    def byte_STORE_DEREF(self, index):
         f = self.frame
-        if name in f.f_globals:
-            val = f.f_globals[name]
-        elif name in f.f_builtins:
-            val = f.f_builtins[name]
+        sp = f.sp = f.sp - 1
+        try:
+            f.fastlocals[index].cell_contents = f.stack[sp]
+        except AttributeError:
+            # Python 3.6：cell_contents 只读
+            set_cell_contents(f.fastlocals[index], f.stack[sp])
+        f.stack[sp] = None
+
+    def byte_DELETE_DEREF(self, index):
+        cell = self.frame.fastlocals[index]
+        try:
+            cell.cell_contents
+        except ValueError:
+            raise self.unbound_deref(index)
+        set_cell_contents(cell, _UNBOUND)
+
+    def byte_LOAD_CLASSDEREF(self, index):
+        # 类定义体中的自由变量：先查类的命名空间
+        f = self.frame
+        name = cell_name(f.f_code, index)
+        if name in f.f_locals:
+            self.push(f.f_locals[name])
         else:
-            raise NameError("global name '%s' is not defined" % name)
-        self.push(val)
+            self.byte_LOAD_DEREF(index)
+
+    def unbound_deref(self, index):
+        code = self.frame.f_code
+        name = cell_name(code, index)
+        if name in code.co_cellvars:
+            return UnboundLocalError(
+                "local variable '%s' referenced before assignment" % name)
+        return NameError("free variable '%s' referenced before assignment "
+                         "in enclosing scope" % name)
 
     ## Operators
 
@@ -288,6 +839,32 @@ class VirtualMachine(object):
         'OR':       operator.or_,
     }
 
+    INPLACE_OPERATORS = {
+        'POWER':    operator.ipow,
+        'MULTIPLY': operator.imul,
+        'FLOOR_DIVIDE': operator.ifloordiv,
+        'TRUE_DIVIDE':  operator.itruediv,
+        'MODULO':   operator.imod,
+        'ADD':      operator.iadd,
+        'SUBTRACT': operator.isub,
+        'LSHIFT':   operator.ilshift,
+        'RSHIFT':   operator.irshift,
+        'AND':      operator.iand,
+        'XOR':      operator.ixor,
+        'OR':       operator.ior,
+    }
+
+    UNARY_OPERATORS = {
+        'POSITIVE': operator.pos,
+        'NEGATIVE': operator.neg,
+        'NOT':      operator.not_,
+        'INVERT':   operator.invert,
+    }
+
+    def unaryOperator(self, op):
+        x = self.pop()
+        self.push(self.UNARY_OPERATORS[op](x))
+
     def binaryOperator(self, op):
         x, y = self.popn(2)
         self.push(self.BINARY_OPERATORS[op](x, y))
@@ -303,12 +880,15 @@ class VirtualMachine(object):
         lambda x, y: x not in y,
         lambda x, y: x is y,
         lambda x, y: x is not y,
-        lambda x, y: issubclass(x, Exception) and issubclass(x, y),
+        lambda x, y: issubclass(x, y),
     ]
 
     def byte_COMPARE_OP(self, opnum):
-        x, y = self.popn(2)
-        self.push(self.COMPARE_OPERATORS[opnum](x, y))
+        f = self.frame
+        stack = f.stack
+        sp = f.sp = f.sp - 1
+        stack[sp - 1] = self.COMPARE_OPERATORS[opnum](stack[sp - 1], stack[sp])
+        stack[sp] = None
 
     ## Attributes and indexing
 
@@ -319,16 +899,69 @@ class VirtualMachine(object):
 
     def byte_STORE_ATTR(self, name):
         val, obj = self.popn(2)
+        if isinstance(obj, types.ModuleType):
+            # 模块属性即模块的全局命名空间（如 builtins.abs = ...）
+            _namespace_item_changed(name)
         setattr(obj, name, val)
 
+    def byte_DELETE_ATTR(self, name):
+        obj = self.pop()
+        if isinstance(obj, types.ModuleType):
+            _namespace_item_changed(name)
+        delattr(obj, name)
+
+    def byte_STORE_SUBSCR(self):
+        val, obj, subscr = self.popn(3)
+        if type(obj) is dict and id(obj) in _cached_namespaces:
+            _namespace_item_changed(subscr)
+        obj[subscr] = val
+
+    def byte_DELETE_SUBSCR(self):
+        obj, subscr = self.popn(2)
+        if type(obj) is dict and id(obj) in _cached_namespaces:
+            _namespace_item_changed(subscr)
+        del obj[subscr]
+
     ## Building
 
     def byte_BUILD_LIST(self, count):
         elts = self.popn(count)
         self.push(elts)
 
+    def byte_BUILD_TUPLE(self, count):
+        elts = self.popn(count)
+        self.push(tuple(elts))
+
+    def byte_BUILD_SET(self, count):
+        elts = self.popn(count)
+        self.push(set(elts))
+
+    def byte_UNPACK_SEQUENCE(self, count):
+        seq = self.pop()
+        self.push(*reversed(unpack(seq, count)))
+
+    def byte_UNPACK_EX(self, arg):
+        # 低 8 位为星号前的个数，高位为星号后的个数
+        before, after = arg & 0xFF, arg >> 8
+        items = list(self.pop())
+        if len(items) < before + after:
+            raise ValueError("not enough values to unpack (expected at least "
+                             "%d, got %d)" % (before + after, len(items)))
+        rest = items[before:len(items) - after]
+        self.push(*reversed(items[:before] + [rest] + items[len(items) - after:]))
+
+    def byte_BUILD_SLICE(self, count):
+        self.push(slice(*self.popn(count)))
+
     def byte_BUILD_MAP(self, size):
-        self.push({})
+        # Python 3.5 以后 BUILD_MAP 从栈上取 size 对键值
+        items = self.popn(2 * size)
+        self.push(dict(zip(items[::2], items[1::2])))
+
+    def byte_BUILD_CONST_KEY_MAP(self, size):
+        keys = self.pop()
+        values = self.popn(size)
+        self.push(dict(zip(keys, values)))
 
     def byte_STORE_MAP(self):
         the_map, val, key = self.popn(3)
@@ -337,26 +970,32 @@ class VirtualMachine(object):
 
     def byte_LIST_APPEND(self, count):
         val = self.pop()
-        the_list = self.frame.stack[-count] # peek
+        the_list = self.peek(count)
         the_list.append(val)
 
     ## Jumps
 
     def byte_JUMP_FORWARD(self, jump):
-        self.jump(jump)
+        self.frame.f_lasti = jump
 
     def byte_JUMP_ABSOLUTE(self, jump):
-        self.jump(jump)
+        self.frame.f_lasti = jump
 
     def byte_POP_JUMP_IF_TRUE(self, jump):
-        val = self.pop()
+        f = self.frame
+        sp = f.sp = f.sp - 1
+        val = f.stack[sp]
+        f.stack[sp] = None
         if val:
-            self.jump(jump)
+            f.f_lasti = jump
 
     def byte_POP_JUMP_IF_FALSE(self, jump):
-        val = self.pop()
+        f = self.frame
+        sp = f.sp = f.sp - 1
+        val = f.stack[sp]
+        f.stack[sp] = None
         if not val:
-            self.jump(jump)
+            f.f_lasti = jump
 
     def jump(self, jump):
         """移动字节码指针至目标位置"""
@@ -382,31 +1021,350 @@ class VirtualMachine(object):
     def byte_BREAK_LOOP(self):
         return 'break'
 
+    def byte_CONTINUE_LOOP(self, dest):
+        # 位于 try / except / finally 块中的 continue，由块栈展开后跳转
+        self.return_value = dest
+        return 'continue'
+
     def byte_POP_BLOCK(self):
         self.pop_block()
 
+    ## Exceptions
+
+    def byte_SETUP_EXCEPT(self, dest):
+        self.push_block('setup-except', dest)
+
+    def byte_SETUP_FINALLY(self, dest):
+        self.push_block('finally', dest)
+
+    def byte_POP_EXCEPT(self):
+        block = self.pop_block()
+        if block[0] != 'except-handler':
+            raise VirtualMachineError("popped block is not an except handler")
+        self.unwind_block(block)
+
+    def byte_END_FINALLY(self):
+        # 栈顶为 None（正常离开 try 块）、why 字符串（return / continue 等
+        # 穿过 finally），或异常类型（未被处理的异常，其下为 value 与 traceback）
+        v = self.pop()
+        if v is None:
+            return None
+        if isinstance(v, str):
+            if v in ('return', 'continue'):
+                self.return_value = self.pop()
+            return v
+        val = self.pop()
+        tb = self.pop()
+        self.last_exception = (v, val, tb)
+        return 'exception'
+
+    def byte_RAISE_VARARGS(self, argc):
+        cause = None
+        if argc == 2:
+            cause = self.pop()
+        if argc == 0:
+            # 重新抛出正在处理的异常
+            if self.exc_info[1] is None:
+                raise RuntimeError("No active exception to reraise")
+            self.last_exception = self.exc_info
+            return 'exception'
+        exc = self.pop()
+        if cause is None:
+            raise exc
+        raise exc from cause
+
     ## Functions
 
-    def byte_MAKE_FUNCTION(self, argc):
+    def byte_MAKE_FUNCTION(self, flags):
+        # Python 3.6 以后参数为标志位，各部分按顺序压在 code、name 之下
         name = self.pop()
         code = self.pop()
-        defaults = self.popn(argc)
+        closure = self.pop() if flags & 0x08 else None
+        annotations = self.pop() if flags & 0x04 else None
+        kwdefaults = self.pop() if flags & 0x02 else None
+        defaults = self.pop() if flags & 0x01 else ()
         globs = self.frame.f_globals
-        fn = Function(name, code, globs, defaults, None, self)
+        fn = Function(name, code, globs, defaults, closure, self, kwdefaults)
+        if annotations:
+            fn._func.__annotations__ = annotations
         self.push(fn)
 
+    def call_function(self, func, posargs, kwargs):
+        """调用函数：虚拟机函数新建帧交给主循环，其他可调用对象直接调用"""
+        if type(func) is types.MethodType and type(func.__func__) is Function:
+            # 虚拟机函数绑定的方法：展开为对函数本身的调用
+            posargs = (func.__self__,) + tuple(posargs)
+            func = func.__func__
+        if type(func) is Function and func._vm is self:
+            if self.hybrid and self.prefers_native(func):
+                self.push(self.call_native(func, posargs, kwargs))
+                return
+            frame = func.make_call_frame(posargs, kwargs)
+            if func._generator:
+                # 生成器函数：不执行函数体，返回包装新帧的生成器
+                self.push(Generator(frame, self))
+                return
+            # 虚拟机函数：新帧交给主循环执行，不在宿主解释器中递归
+            self.push_frame(frame)
+            return 'call'
+        if func is locals:
+            # 内置 locals() 取到的是宿主解释器的帧，这里改为构建虚拟机当前帧的局部变量字典
+            retval = self.frame.f_locals
+        elif func is globals:
+            # globals() 同理，返回虚拟机当前帧的全局命名空间
+            retval = self.frame.f_globals
+        elif func is super and not posargs and not kwargs:
+            # 无参数的 super() 同样依赖调用者的帧：取 __class__ 自由变量与第一个参数
+            retval = self.zero_arg_super()
+        elif _may_write_namespaces(func):
+            # 宿主代码中的写入绕过虚拟机（exec、globals().update 等），调用后使内联缓存失效
+            try:
+                retval = func(*posargs, **kwargs)
+            finally:
+                _bump_namespace_version()
+        else:
+            retval = func(*posargs, **kwargs)
+        self.push(retval)
+
+    def prefers_native(self, func):
+        """混合执行时判断本次调用是否改由宿主解释器运行。
+           宿主解释器中的运行无法计入预算、也无法中断，设置了运行限制时一律在虚拟机中运行，
+           含有未实现指令的函数随之以 VirtualMachineError 失败
+        """
+        if self.has_limits:
+            return False
+        code = func.func_code
+        if code in self.native_codes:
+            return True
+        count = self.call_counts.get(code, 0) + 1
+        self.call_counts[code] = count
+        if count == 1:
+            # 首次调用时检查指令流，含有未实现的指令则始终以原生方式运行
+            table = self.dispatch_table
+            for byteCode, _, _ in func._decoded.instructions:
+                if getattr(table[byteCode], 'unsupported', False):
+                    self.native_codes.add(code)
+                    return True
+        if self.hot_threshold is not None and count > self.hot_threshold:
+            self.native_codes.add(code)
+            return True
+        return False
+
+    def call_native(self, func, args, kwargs):
+        """通过真实函数 `_func` 调用虚拟机函数，在调用边界记录调用次数与耗时；
+           开启剖析时同时记入剖析器（指令名记为 NATIVE_CALL）。
+           宿主解释器中的赋值绕过虚拟机，因此调用后若写入了被缓存的名字（或无法确定写入了
+           哪些名字），使所有内联缓存失效
+        """
+        code = func.func_code
+        entry = self.native_calls.get(code)
+        if entry is None:
+            entry = self.native_calls[code] = [0, 0.0]
+            self.native_writes[code] = _native_writes(code)
+        start = time.perf_counter()
+        try:
+            return func._func(*args, **kwargs)
+        finally:
+            writes = self.native_writes[code]
+            if writes is None or not writes.isdisjoint(_cached_names):
+                _bump_namespace_version()
+            elapsed = time.perf_counter() - start
+            entry[0] += 1
+            entry[1] += elapsed
+            profiler = self.profiler
+            if profiler is not None:
+                profiler.record_call(code)
+                profiler.record(code, 'NATIVE_CALL', code.co_firstlineno,
+                                elapsed)
+
+    def zero_arg_super(self):
+        f = self.frame
+        code = f.f_code
+        if '__class__' not in code.co_freevars or not code.co_argcount:
+            raise RuntimeError("super(): no arguments")
+        cells = code.co_cellvars + code.co_freevars
+        cls = f.fastlocals[code.co_nlocals + cells.index('__class__')]
+        first = f.fastlocals[0]
+        if first is _UNBOUND and code.co_varnames[0] in code.co_cellvars:
+            # 第一个参数同时是 cell 变量，值保存在 cell 中
+            first = f.fastlocals[
+                code.co_nlocals + cells.index(code.co_varnames[0])
+            ].cell_contents
+        return super(cls.cell_contents, first)
+
     def byte_CALL_FUNCTION(self, arg):
-        lenKw, lenPos = divmod(arg, 256) # KWargs not supported here
-        posargs = self.popn(lenPos)
+        posargs = self.popn(arg)
         func = self.pop()
-        frame = self.frame
-        retval = func(*posargs)
-        self.push(retval)
+        return self.call_function(func, posargs, _EMPTY_KWARGS)
+
+    def byte_CALL_FUNCTION_KW(self, arg):
+        kwnames = self.pop()
+        args = self.popn(arg)
+        func = self.pop()
+        npos = arg - len(kwnames)
+        kwargs = dict(zip(kwnames, args[npos:]))
+        return self.call_function(func, args[:npos], kwargs)
+
+    def byte_CALL_FUNCTION_EX(self, flags):
+        kwargs = self.pop() if flags & 0x01 else _EMPTY_KWARGS
+        posargs = self.pop()
+        func = self.pop()
+        return self.call_function(func, tuple(posargs), dict(kwargs))
+
+    def byte_LOAD_METHOD(self, name):
+        # Python 3.7 的方法调用：这里不做免绑定优化，直接压入绑定后的方法，
+        # 下方垫一个占位值以保持与 CALL_METHOD 约定的栈布局一致
+        obj = self.pop()
+        self.push(_UNBOUND, getattr(obj, name))
+
+    def byte_CALL_METHOD(self, arg):
+        posargs = self.popn(arg)
+        func = self.pop()
+        self.pop()
+        return self.call_function(func, posargs, _EMPTY_KWARGS)
 
     def byte_RETURN_VALUE(self):
         self.return_value = self.pop()
         return "return"
 
+    def byte_IMPORT_NAME(self, name):
+        level, fromlist = self.popn(2)
+        frame = self.frame
+        try:
+            # 首次导入时模块代码由宿主解释器执行，可能改写 builtins 等命名空间
+            self.push(__import__(name, frame.f_globals, None, fromlist, level))
+        finally:
+            _bump_namespace_version()
+
+    def byte_IMPORT_FROM(self, name):
+        mod = self.top()
+        try:
+            val = getattr(mod, name)
+        except AttributeError:
+            raise ImportError("cannot import name '%s'" % name)
+        self.push(val)
+
+    def byte_IMPORT_STAR(self):
+        mod = self.pop()
+        names = getattr(mod, '__all__', None)
+        if names is None:
+            names = [name for name in dir(mod) if not name.startswith('_')]
+        f_locals = self.frame.f_locals
+        _bump_namespace_version()
+        for name in names:
+            f_locals[name] = getattr(mod, name)
+
+    def byte_LOAD_BUILD_CLASS(self):
+        self.push(self.build_class)
+
+    def build_class(self, func, name, *bases, **kwds):
+        """对应内置函数 __build_class__：在虚拟机中执行类体，再由元类创建类"""
+        if not isinstance(func, Function):
+            raise TypeError("func must be a function")
+        metaclass = kwds.pop('metaclass', None)
+        if metaclass is None:
+            metaclass = type(bases[0]) if bases else type
+        prepare = getattr(metaclass, '__prepare__', None)
+        namespace = prepare(name, bases, **kwds) if prepare else {}
+        frame = self.make_frame(func.func_code, f_globals=func.func_globals,
+                                f_locals=namespace, closure=func.func_closure)
+        self.run_frame(frame)
+        return metaclass(name, bases, namespace, **kwds)
+
+    ## Generators
+
+    def byte_YIELD_VALUE(self):
+        self.return_value = self.pop()
+        return 'yield'
+
+    def byte_GET_YIELD_FROM_ITER(self):
+        iterable = self.top()
+        if not isinstance(iterable, (Generator, types.GeneratorType)):
+            self.pop()
+            self.push(iter(iterable))
+
+    def byte_YIELD_FROM(self):
+        value = self.pop()
+        receiver = self.top()
+        try:
+            if value is None:
+                retval = next(receiver)
+            else:
+                retval = receiver.send(value)
+        except StopIteration as e:
+            # 子迭代器结束，其返回值即 yield from 表达式的值
+            self.pop()
+            self.push(e.value)
+            return
+        self.return_value = retval
+        # 恢复时重新执行本条指令，把发送进来的值转交给子迭代器
+        self.frame.f_lasti -= 1
+        return 'yield'
+
+    ## Superinstructions（由 fuse_superinstructions 融合而成，参数为两条指令参数的拼接）
+
+    def byte_LOAD_FAST__LOAD_FAST(self, first, second):
+        f = self.frame
+        x = f.fastlocals[first]
+        y = f.fastlocals[second]
+        if x is _UNBOUND or y is _UNBOUND:
+            self.byte_LOAD_FAST(first)
+            self.byte_LOAD_FAST(second)
+            return
+        sp = f.sp
+        f.stack[sp] = x
+        f.stack[sp + 1] = y
+        f.sp = sp + 2
+
+    def byte_COMPARE_OP__POP_JUMP_IF_FALSE(self, opnum, jump):
+        f = self.frame
+        stack = f.stack
+        sp = f.sp - 2
+        val = self.COMPARE_OPERATORS[opnum](stack[sp], stack[sp + 1])
+        stack[sp] = stack[sp + 1] = None
+        f.sp = sp
+        if not val:
+            f.f_lasti = jump
+
+    def byte_COMPARE_OP__POP_JUMP_IF_TRUE(self, opnum, jump):
+        f = self.frame
+        stack = f.stack
+        sp = f.sp - 2
+        val = self.COMPARE_OPERATORS[opnum](stack[sp], stack[sp + 1])
+        stack[sp] = stack[sp + 1] = None
+        f.sp = sp
+        if val:
+            f.f_lasti = jump
+
+    def byte_FOR_ITER__STORE_FAST(self, jump, index):
+        f = self.frame
+        try:
+            f.fastlocals[index] = next(f.stack[f.sp - 1])
+        except StopIteration:
+            self.pop()
+            f.f_lasti = jump
+
+    ## Peephole（由 peephole_optimize 改写而成）
+
+    def byte_CONTAINS_FROZENSET(self, members):
+        # 栈顶仍为原来的常量元组，`members` 为其元素构成的 frozenset。
+        # 只有左操作数的类型恰为哈希与相等比较一致的内置类型时才查 frozenset，
+        # 其余对象（可能重写了 __eq__ / __hash__）按元组逐个比较，结果与 CPython 相同
+        f = self.frame
+        stack = f.stack
+        sp = f.sp = f.sp - 1
+        x = stack[sp - 1]
+        if type(x) in _FROZENSET_SAFE_TYPES:
+            stack[sp - 1] = x in members
+        else:
+            stack[sp - 1] = x in stack[sp]
+        stack[sp] = None
+
+    def byte_NOT_CONTAINS_FROZENSET(self, members):
+        self.byte_CONTAINS_FROZENSET(members)
+        f = self.frame
+        f.stack[f.sp - 1] = not f.stack[f.sp - 1]
+
     ## Prints
 
     def byte_PRINT_ITEM(self):
@@ -417,25 +1375,1489 @@ class VirtualMachine(object):
         print("")
 
 
+def _nop(vm, *arguments):
+    # EXTENDED_ARG：dis 已把扩展参数并入下一条指令的参数
+    pass
+
+
+def _make_unary_handler(fn):
+    if fn is None:
+        return None
+    def handler(vm):
+        vm.push(fn(vm.pop()))
+    return handler
+
+
+def _make_binary_handler(fn):
+    if fn is None:
+        return None
+    def handler(vm):
+        # 直接在栈上原地计算：弹出两个操作数，结果写回次栈顶
+        f = vm.frame
+        stack = f.stack
+        sp = f.sp = f.sp - 1
+        stack[sp - 1] = fn(stack[sp - 1], stack[sp])
+        stack[sp] = None
+    return handler
+
+
+def _make_const_binary_handler(fn):
+    if fn is None:
+        return None
+    def handler(vm, const):
+        f = vm.frame
+        stack = f.stack
+        sp = f.sp - 1
+        stack[sp] = fn(stack[sp], const)
+    return handler
+
+
+def _make_limited_jump(handler, position):
+    """回跳时按循环体的指令数扣除预算，在跳转之前检查，异常仍归属于跳转指令"""
+    def limited(vm, *arguments):
+        index = vm.frame.f_lasti
+        target = arguments[position]
+        if target < index:
+            vm.ticks -= index - target
+            if vm.ticks < 0:
+                vm.check_limits()
+        return handler(vm, *arguments)
+    return limited
+
+
+def _make_limited_call(handler):
+    """调用时扣除预算；调用虚拟机函数时检查调用深度，超出时撤销刚压入的帧"""
+    def limited(vm, *arguments):
+        why = handler(vm, *arguments)
+        if why == 'call':
+            vm.ticks -= 1 + len(vm.frame.decoded.instructions)
+            if vm.ticks < 0 or len(vm.frames) > vm.frame_limit:
+                try:
+                    vm.check_limits()
+                except ResourceLimitExceeded:
+                    vm.pop_frame()
+                    raise
+        else:
+            vm.ticks -= 1
+            if vm.ticks < 0:
+                vm.check_limits()
+        return why
+    return limited
+
+
+def _make_unknown_handler(byteName):
+    def handler(vm, *arguments):
+        raise VirtualMachineError("unknown bytecode type: %s" % byteName)
+    # 混合执行据此把含有未实现指令的函数交给宿主解释器（见 prefers_native）
+    handler.unsupported = True
+    return handler
+
+
+# 出栈时用于清空数据栈槽位的全 None 元组，按个数预先构建
+_NONES = [(None,) * n for n in range(32)]
+
+# 无关键字参数的调用共享的空字典（只读）
+_EMPTY_KWARGS = {}
+
+# 命名空间版本号：虚拟机写入或删除已被内联缓存的名字时递增，用于校验内联缓存。
+# `_cached_names` 为当前版本下被缓存过的名字，`_cached_namespaces` 为查找过这些名字的
+# 命名空间字典的 id：程序以下标赋值、删除这些字典中的名字（如 globals()['x'] = 1）、
+# 给模块赋值属性、import 以及调用可能改写命名空间的宿主代码时同样递增。
+# 递增后旧的缓存全部失效，两个集合随之清空，由重新填充的缓存再次登记，因此不会无限增长；
+# 集合中的 id 所属的字典在登记它的缓存槽位被覆盖前一直被该槽位引用，id 被复用的字典
+# 至多引起一次多余的失效。宿主对象的特殊方法（property、运算符重载等）中的写入不会被察觉
+_namespace_version = 0
+_cached_names = set()
+_cached_namespaces = set()
+
+
+def _bump_namespace_version():
+    global _namespace_version
+    _namespace_version += 1
+    _cached_names.clear()
+    _cached_namespaces.clear()
+
+
+# 会改写参数所给命名空间的内置函数
+_NAMESPACE_WRITERS = frozenset([
+    exec, eval, setattr, delattr, __import__, operator.setitem,
+    operator.delitem,
+])
+
+
+def _may_write_namespaces(func):
+    """虚拟机之外的可调用对象 `func` 运行时是否可能改写命名空间：
+       内置函数只有 exec、setattr 等以及命名空间字典自身的方法（update、pop 等）会改写，
+       内置类型的构造不会改写，其余宿主代码（Python 函数、自定义类等）一律视为可能改写
+    """
+    if type(func) is types.BuiltinFunctionType:
+        owner = func.__self__
+        if type(owner) is dict:
+            return id(owner) in _cached_namespaces
+        if owner is None or isinstance(owner, types.ModuleType):
+            return func in _NAMESPACE_WRITERS
+        return False
+    return not (type(func) is type and func.__module__ == 'builtins')
+
+
+def _namespace_item_changed(key):
+    """以下标修改了命名空间字典中的 `key`"""
+    try:
+        cached = key in _cached_names
+    except TypeError:
+        return
+    if cached:
+        _bump_namespace_version()
+
+
+# 原生运行的函数中出现即视为可能改写任意命名空间的名字：取得命名空间字典或模块、
+# 按名字动态赋值的内置函数
+_NAMESPACE_ACCESSORS = frozenset([
+    'globals', 'locals', 'vars', '__dict__', '__builtins__', 'exec', 'eval',
+    'setattr', 'delattr', '__import__',
+])
+
+# 按名字写入或删除命名空间（模块属性即模块的命名空间）的指令
+_NATIVE_STORE_OPS = frozenset([
+    'STORE_GLOBAL', 'DELETE_GLOBAL', 'STORE_NAME', 'DELETE_NAME',
+    'STORE_ATTR', 'DELETE_ATTR',
+])
+
+
+def _native_writes(code):
+    """以原生方式运行 `code`（包括其中嵌套的 code object）时可能写入或删除的命名空间中的
+       名字，即 STORE_GLOBAL、STORE_ATTR 等指令的名字；含有 import 或引用了
+       _NAMESPACE_ACCESSORS 中的名字时无法确定，返回 None。
+       经参数传入的命名空间字典、调用的宿主函数中的写入不会被察觉
+    """
+    if not _NAMESPACE_ACCESSORS.isdisjoint(code.co_names):
+        return None
+    names = set()
+    for instruction in dis.get_instructions(code):
+        opname = instruction.opname
+        if opname in ('IMPORT_NAME', 'IMPORT_STAR'):
+            return None
+        if opname in _NATIVE_STORE_OPS:
+            names.add(instruction.argval)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            nested = _native_writes(const)
+            if nested is None:
+                return None
+            names |= nested
+    return frozenset(names)
+
+
+# 快速局部变量槽位中表示“未赋值”的标记
+_UNBOUND = object()
+
+# 不放入空闲链表的函数帧：生成器与协程的帧由生成器对象持有
+_NOT_POOLED = (inspect.CO_GENERATOR | inspect.CO_COROUTINE |
+               inspect.CO_ASYNC_GENERATOR | inspect.CO_ITERABLE_COROUTINE)
+
+
 class Frame(object):
-    """Frame 类：维护一个 code object 引用，并管理必要的状态信息"""
+    """Frame 类：维护一个 code object 引用，并管理必要的状态信息
+       深递归时同时存在大量帧，因此使用 __slots__，不为每个帧建属性字典
+    """
+
+    __slots__ = ['f_code', 'decoded', 'f_globals', 'f_locals', 'fastlocals',
+                 'f_back', 'stack', 'sp', 'block_stack', 'f_builtins',
+                 'f_lasti', 'escaped']
 
-    def __init__(self, f_code, f_globals, f_locals, f_back):
+    def __init__(self, f_code, f_globals, f_locals, f_back, fastlocals=None,
+                 decoded=None, closure=None):
         self.f_code = f_code
-        self.opcodes = list(dis.get_instructions(self.f_code))
+        # 同一 code object 的所有帧共享同一份预解码指令流，帧中只保存其引用
+        self.decoded = decoded or decode_code(f_code)
         self.f_globals = f_globals
-        self.f_locals = f_locals
+        if f_locals is None:
+            # 函数帧：局部变量存放在按 co_nlocals 预分配的槽位中，
+            # 只有在访问 f_locals 时才临时构建字典（见 __getattr__）；
+            # `fastlocals` 可由调用方（参数绑定）直接给出
+            if fastlocals is None:
+                fastlocals = [_UNBOUND] * f_code.co_nlocals
+            self.fastlocals = fastlocals
+        else:
+            self.f_locals = f_locals
+            self.fastlocals = None
+        if self.decoded.cells is not None:
+            self.init_cells(self.decoded.cells, closure)
         self.f_back = f_back
-        self.stack = []    # 数据栈
-        self.block_stack = []    # 块栈
+        # 数据栈：按 co_stacksize 预分配，由栈指针 sp 寻址
+        self.stack = [None] * f_code.co_stacksize
+        self.sp = 0
+        # 块栈：元素为 (类型, handler, level) 元组；不可变元组，入栈、出栈时整体替换，
+        # 没有块的帧共用同一个空元组，不必各自分配列表
+        self.block_stack = ()
         if f_back:
             self.f_builtins = f_back.f_builtins
         else:
-            self.f_builtins = f_locals['__builtins__']
+            self.f_builtins = f_globals['__builtins__']
             if hasattr(self.f_builtins, '__dict__'):
                 self.f_builtins = self.f_builtins.__dict__
         # 最后运行指令，初始为 0
         self.f_lasti = 0
+        # 是否逃逸（见 mark_escaped）
+        self.escaped = False
+
+    def reset(self, f_globals, f_back, fastlocals, decoded, closure):
+        """复用空闲链表中的函数帧（见 VirtualMachine.release_frame），
+           结果与以相同参数新建的函数帧相同
+        """
+        self.decoded = decoded
+        self.f_globals = f_globals
+        self.fastlocals = fastlocals
+        if decoded.cells is not None:
+            self.init_cells(decoded.cells, closure)
+        self.f_back = f_back
+        if f_back:
+            self.f_builtins = f_back.f_builtins
+        else:
+            self.f_builtins = f_globals['__builtins__']
+            if hasattr(self.f_builtins, '__dict__'):
+                self.f_builtins = self.f_builtins.__dict__
+        self.f_lasti = 0
+        self.escaped = False
+
+    def mark_escaped(self):
+        """帧在运行结束后仍可能被访问（逃逸），不再放入空闲链表（见
+           VirtualMachine.release_frame）。经 f_back 可以访问到调用者，调用者链一并标记：
+           作为生成器帧的 f_back、交给宿主代码（current_frame）
+        """
+        frame = self
+        while frame is not None and not frame.escaped:
+            frame.escaped = True
+            frame = frame.f_back
+
+    def clear(self):
+        """放入空闲链表前清除对其他对象的引用：清空数据栈与块栈"""
+        sp = self.sp
+        if sp:
+            self.stack[:sp] = [None] * sp
+            self.sp = 0
+        self.block_stack = ()
+        self.fastlocals = self.f_back = self.f_globals = None
+
+    def init_cells(self, cells, closure):
+        """cell 变量与自由变量的 cell 依次存放在局部变量槽位之后（下标从 co_nlocals 开始），
+           LOAD_DEREF 等指令按下标直接取得 cell，不按名字查找；
+           本帧的 cell 变量新建 cell（同时是参数的，以参数值初始化），自由变量使用函数的闭包
+        """
+        fastlocals = self.fastlocals
+        if fastlocals is None:
+            # 类定义体等非函数帧：只有 cell 槽位
+            fastlocals = self.fastlocals = [_UNBOUND] * self.f_code.co_nlocals
+        for arg in cells:
+            if arg is None:
+                cell = make_empty_cell()
+            else:
+                cell = make_cell(fastlocals[arg])
+                fastlocals[arg] = _UNBOUND
+            fastlocals.append(cell)
+        if closure:
+            fastlocals.extend(closure)
+
+    def __getattr__(self, name):
+        # 仅在普通属性查找失败时调用：函数帧没有 f_locals 属性，按需由槽位构建
+        if name == 'f_locals' and self.fastlocals is not None:
+            code = self.f_code
+            varnames = code.co_varnames
+            fastlocals = self.fastlocals
+            f_locals = {
+                varnames[i]: fastlocals[i]
+                for i in range(len(varnames)) if fastlocals[i] is not _UNBOUND
+            }
+            cells = fastlocals[len(varnames):]
+            for name, cell in zip(code.co_cellvars + code.co_freevars, cells):
+                try:
+                    f_locals[name] = cell.cell_contents
+                except ValueError:
+                    pass
+            return f_locals
+        raise AttributeError(name)
+
+    @property
+    def f_lineno(self):
+        """当前指令对应的源代码行号"""
+        return self.decoded.lines[max(self.f_lasti - 1, 0)]
+
+
+# 伪指令：由超级指令融合、窥孔优化等在预解码指令流中改写出的指令，编号从 256 开始
+OPNAMES = list(dis.opname)
+OPMAP = dict(dis.opmap)
+
+
+def def_pseudo_op(name):
+    """登记一条伪指令，返回其指令码"""
+    OPMAP[name] = len(OPNAMES)
+    OPNAMES.append(name)
+    return OPMAP[name]
+
+
+# 指令参数类型，按指令码预先分类，解码时不再逐条查询 dis.hasxxx 列表
+ARG_NONE, ARG_CONST, ARG_NAME, ARG_LOCAL, ARG_JREL, ARG_JABS, ARG_CELL, ARG_INT = range(8)
+
+
+def _classify_args():
+    kinds = []
+    for byteCode in range(len(dis.opname)):
+        # 指令码 >= dis.HAVE_ARGUMENT 都是有参指令
+        if byteCode < dis.HAVE_ARGUMENT:
+            kinds.append(ARG_NONE)
+        elif byteCode in dis.hasconst:
+            kinds.append(ARG_CONST)
+        elif byteCode in dis.hasname:
+            kinds.append(ARG_NAME)
+        elif byteCode in dis.haslocal:
+            kinds.append(ARG_LOCAL)
+        elif byteCode in dis.hasjrel:
+            kinds.append(ARG_JREL)
+        elif byteCode in dis.hasjabs:
+            kinds.append(ARG_JABS)
+        elif byteCode in dis.hasfree:
+            kinds.append(ARG_CELL)
+        else:
+            kinds.append(ARG_INT)
+    return kinds
+
+
+ARG_KINDS = _classify_args()
+
+# 参数为跳转目标的指令（不含伪指令）
+JUMP_OPS = frozenset(byteCode for byteCode, kind in enumerate(ARG_KINDS)
+                     if kind in (ARG_JREL, ARG_JABS))
+
+# 带内联缓存的指令：解码后的参数末尾附加一个缓存槽位
+CACHED_OPS = frozenset([dis.opmap['LOAD_NAME'], dis.opmap['LOAD_GLOBAL']])
+
+
+class DecodedCode(object):
+    """DecodedCode 类：一个 code object 预解码后的指令流
+       `instructions` 中每一项为 (opcode, opname, arguments)，其中参数已完成解析：
+       常量、变量名已取出，跳转参数已换算为目标指令的下标
+    """
+
+    __slots__ = ['code', 'instructions', 'lines', 'varindex', 'caches',
+                 'fused', 'threaded', 'cells',
+                 'handlers', 'original_size']
+
+    def __init__(self, code, state=None):
+        self.code = code
+        # 局部变量名到快速局部变量槽位下标的映射
+        self.varindex = {name: i for i, name in enumerate(code.co_varnames)}
+        # 每个 cell 变量对应的参数槽位（不是参数则为 None），没有 cell 与自由变量时为 None
+        self.cells = None
+        if code.co_cellvars or code.co_freevars:
+            self.cells = tuple(self.varindex.get(name)
+                               for name in code.co_cellvars)
+        # 融合的超级指令数
+        self.fused = 0
+        # 闭包串联引擎的指令流，按分派表分别翻译（见 threaded_ops）
+        self.threaded = {}
+        # 异常表，每项为 (start, end, handler, level)，见 build_exception_table
+        self.handlers = ()
+        if state is not None:
+            # 从持久化缓存恢复，不再反汇编（见 DiskCache）
+            self.set_state(state)
+            return
+        self.instructions = []
+        self.lines = []
+        # 每条指令的内联缓存槽位，只有 CACHED_OPS 中的指令才有（见 VirtualMachine.byte_LOAD_NAME）
+        self.caches = []
+        lineno = code.co_firstlineno
+        # Python 3.6 以后每条指令占2个字节，指令下标 = 字节偏移 // 2
+        for index, ins in enumerate(dis.get_instructions(code)):
+            if ins.starts_line is not None:
+                lineno = ins.starts_line
+            self.lines.append(lineno)
+            arguments = self.parse_args(index, ins)
+            cache = None
+            if ins.opcode in CACHED_OPS:
+                cache = [None, None, None]
+                arguments += (cache,)
+            self.caches.append(cache)
+            self.instructions.append((ins.opcode, ins.opname, arguments))
+        # 优化之前的指令数
+        self.original_size = len(self.instructions)
+
+    def get_state(self):
+        """可用 marshal 序列化的指令流状态
+           参数中的 code object 与内联缓存槽位不直接保存，而是记为
+           (指令下标, 参数位置, co_consts 下标)，缓存槽位的 co_consts 下标记为 -1
+        """
+        instructions = []
+        fixups = []
+        for index, (opcode, byteName, arguments) in enumerate(self.instructions):
+            saved = []
+            for position, arg in enumerate(arguments):
+                if arg is self.caches[index] and arg is not None:
+                    fixups.append((index, position, -1))
+                    arg = None
+                elif isinstance(arg, types.CodeType):
+                    fixups.append((index, position,
+                                   _const_index(self.code, arg)))
+                    arg = None
+                saved.append(arg)
+            instructions.append((opcode, byteName, tuple(saved)))
+        return (instructions, self.lines, list(self.handlers), self.fused,
+                self.original_size, fixups)
+
+    def set_state(self, state):
+        (instructions, self.lines, handlers, self.fused, self.original_size,
+         fixups) = state
+        self.handlers = [tuple(entry) for entry in handlers]
+        self.caches = [None] * len(instructions)
+        instructions = [list(ins) for ins in instructions]
+        for index, position, const in fixups:
+            arguments = list(instructions[index][2])
+            if const < 0:
+                arg = self.caches[index] = [None, None, None]
+            else:
+                arg = self.code.co_consts[const]
+            arguments[position] = arg
+            instructions[index][2] = tuple(arguments)
+        self.instructions = [tuple(ins) for ins in instructions]
+
+    def threaded_ops(self, table):
+        """获取按分派表 `table` 翻译的闭包指令流，每个分派表只翻译一次"""
+        ops = self.threaded.get(id(table))
+        if ops is None:
+            ops = self.threaded[id(table)] = compile_threaded(self, table)
+        return ops
+
+    def parse_args(self, index, ins):
+        """解析指令参数，`index` 为指令下标"""
+        kind = ARG_KINDS[ins.opcode]
+        intArg = ins.arg
+        if kind == ARG_NONE:
+            return ()
+        code = self.code
+        if kind == ARG_CONST:      # 查找常量
+            arg = code.co_consts[intArg]
+        elif kind == ARG_NAME:     # 查找变量名
+            arg = code.co_names[intArg]
+        elif kind == ARG_LOCAL:    # 局部变量直接使用槽位下标
+            arg = intArg
+        elif kind == ARG_JREL:     # 相对跳转位置
+            arg = index + 1 + intArg//2
+        elif kind == ARG_JABS:     # 绝对跳转位置
+            arg = intArg//2
+        elif kind == ARG_CELL:     # cell 槽位紧接在局部变量槽位之后
+            arg = code.co_nlocals + intArg
+        else:
+            arg = intArg
+        return (arg,)
+
+
+class CodeCache(object):
+    """CodeCache 类：以 code object 为键的有界 LRU 缓存
+       递归函数的每次调用都会新建帧，缓存可避免对同一 code object 反复反汇编；
+       `passes` 为解码后依次施加在指令流上的优化函数
+    """
+
+    def __init__(self, maxsize=1024, passes=()):
+        self.maxsize = maxsize
+        self.passes = tuple(passes)
+        # 以 id 为键、并持有 code object 本身，保证 id 在缓存期间不会被复用；
+        # 不直接以 code object 为键，是因为仅行号不同的 code object 是相等的
+        self._entries = collections.OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, code):
+        key = id(code)
+        entry = self._entries.get(key)
+        if entry is not None and entry.code is code:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = DecodedCode(code)
+        for optimize in self.passes:
+            optimize(entry)
+        return self.add(entry)
+
+    def add(self, entry):
+        """放入一个已解码、已优化的指令流（如从 DiskCache 恢复的指令流）"""
+        key = id(entry.code)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        """缓存与优化统计：解码后与优化后的指令数、被融合的指令数"""
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'instructions': sum(
+                len(d.instructions) for d in self._entries.values()),
+            'original_instructions': sum(
+                d.original_size for d in self._entries.values()),
+            'fused': sum(d.fused for d in self._entries.values()),
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(list(self._entries.values()))
+
+
+code_cache = CodeCache()
+
+# 按优化选项组合共享的缓存，不带优化的组合即 `code_cache`
+_code_caches = {(): code_cache}
+
+
+def get_code_cache(superinstructions=False, exception_table=False,
+                   peephole=False):
+    """获取与优化选项对应的共享缓存"""
+    passes = ()
+    if exception_table:
+        passes += (build_exception_table,)
+    if peephole:
+        passes += (peephole_optimize,)
+    if superinstructions:
+        passes += (fuse_superinstructions,)
+    if passes not in _code_caches:
+        _code_caches[passes] = CodeCache(code_cache.maxsize, passes)
+    return _code_caches[passes]
+
+
+def decode_code(code):
+    """获取 code object 的预解码指令流（带缓存）"""
+    return code_cache.get(code)
+
+
+def _const_index(code, const):
+    for index, value in enumerate(code.co_consts):
+        if value is const:
+            return index
+    raise ValueError("%r is not a constant of %r" % (const, code))
+
+
+def _walk_code(code):
+    """按先序遍历 code object 及其中嵌套定义的全部 code object"""
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            for nested in _walk_code(const):
+                yield nested
+
+
+def _vm_version():
+    """虚拟机版本：本模块源代码的摘要，解码格式、伪指令编号或优化改变后缓存自动失效"""
+    try:
+        with open(__file__, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (OSError, NameError):
+        return 'unknown'
+
+
+VM_VERSION = _vm_version()
+
+
+class DiskCache(object):
+    """DiskCache 类：以源代码为键、保存在目录中的持久化缓存
+       每个程序一个文件，内容为定长文件头加一个 marshal 数据块：模块的 code object，
+       以及其中每个 code object 经 `code_cache` 优化后的指令流（见 DecodedCode.get_state）。
+       键为源代码、文件名、Python 版本、虚拟机版本与优化选项的摘要；
+       命中时不再调用 compile、不再反汇编，也不再施加优化，指令流直接放入 `code_cache`。
+       缓存写入失败或文件损坏时退化为普通编译
+    """
+
+    MAGIC = b'sBVM'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = self.misses = 0
+
+    def key(self, source, filename, code_cache):
+        digest = hashlib.sha1()
+        for part in (sys.version, VM_VERSION, filename,
+                     ','.join(p.__name__ for p in code_cache.passes)):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        digest.update(source.encode('utf-8') if isinstance(source, str)
+                      else source)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.bvm')
+
+    def compile(self, source, filename, code_cache):
+        """编译源代码为 code object，并保证其中的 code object 都已在 `code_cache` 中"""
+        path = self.path(self.key(source, filename, code_cache))
+        code = self.load(path, code_cache)
+        if code is not None:
+            self.hits += 1
+            return code
+        self.misses += 1
+        code = compile(source, filename, 'exec')
+        states = [code_cache.get(nested).get_state()
+                  for nested in _walk_code(code)]
+        self.store(path, code, states)
+        return code
+
+    def load(self, path, code_cache):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if data[:len(self.MAGIC)] != self.MAGIC:
+            return None
+        try:
+            code, states = marshal.loads(data[len(self.MAGIC):])
+            codes = list(_walk_code(code))
+            if len(codes) != len(states):
+                return None
+            entries = [DecodedCode(nested, state)
+                       for nested, state in zip(codes, states)]
+        except (EOFError, ValueError, TypeError, IndexError):
+            return None
+        for entry in entries:
+            code_cache.add(entry)
+        return code
+
+    def store(self, path, code, states):
+        # 先写临时文件再改名，多个进程同时写入同一程序的缓存也不会读到残缺的文件
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(self.MAGIC)
+                marshal.dump((code, states), f)
+            os.replace(tmp, path)
+        except (OSError, ValueError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.bvm'):
+                os.remove(os.path.join(self.directory, name))
+
+
+def build_exception_table(decoded):
+    """异常表：把 try/except 语句的 SETUP_EXCEPT 与弹出其块的 POP_BLOCK 从指令流中删去，
+       改为一项 (start, end, handler, level)：下标在 [start, end) 中的指令抛出异常时，
+       把数据栈恢复到 level 层后跳转到 handler（见 VirtualMachine.handle_exception）。
+       正常执行的 try 块不再压入、弹出块，只有抛出异常时才查表。
+       level 由 try 语句入口处的数据栈深度得到，只有深度唯一确定的 try 语句才编入异常表，
+       其余 try 语句、finally 与循环仍使用块栈
+    """
+    instructions = decoded.instructions
+    states = _block_states(decoded)
+    if states is None:
+        return
+    entries = {}
+    removed = set()
+    for index, (opcode, byteName, arguments) in enumerate(instructions):
+        if byteName != 'SETUP_EXCEPT' or len(states[index]) != 1:
+            continue
+        handler = arguments[0]
+        (level, blocks), = states[index]
+        # 找出 try 块中弹出本条 SETUP_EXCEPT 所压入块的 POP_BLOCK（try 块以 return
+        # 等结束时没有），这些 POP_BLOCK 必须在所有路径上都只弹出该块
+        block = ('setup-except', handler, level)
+        pops = []
+        for pop in range(index + 1, handler):
+            if instructions[pop][1] != 'POP_BLOCK':
+                continue
+            tops = set(state[1][-1:] == (block,) for state in states[pop])
+            if tops == {True}:
+                pops.append(pop)
+            elif True in tops:
+                break
+        else:
+            entries[index] = (handler, level)
+            removed.add(index)
+            removed.update(pops)
+    if not entries:
+        return
+
+    new_index = remove_instructions(decoded, removed)
+    # 嵌套的 try 语句删去指令后可能起点相同，此时范围较小的在前
+    decoded.handlers = sorted(
+        ((new_index[index + 1], new_index[handler], new_index[handler],
+          level) for index, (handler, level) in entries.items()),
+        key=lambda entry: (-entry[0], entry[1]),
+    )
+
+
+def remove_instructions(decoded, removed):
+    """从指令流中删去下标在 `removed` 中的指令，返回旧下标到新下标的映射
+       被删去指令的新下标为其后第一条保留指令的下标；跳转目标、行号表、
+       内联缓存与异常表按新下标重新排列
+    """
+    instructions = decoded.instructions
+    new_index = []
+    count = 0
+    for index in range(len(instructions) + 1):
+        new_index.append(count)
+        if index not in removed:
+            count += 1
+    kept, lines, caches = [], [], []
+    for index, (opcode, byteName, arguments) in enumerate(instructions):
+        if index in removed:
+            continue
+        if opcode in JUMP_OPS:
+            arguments = (new_index[arguments[0]],) + arguments[1:]
+        kept.append((opcode, byteName, arguments))
+        lines.append(decoded.lines[index])
+        caches.append(decoded.caches[index])
+    decoded.instructions = kept
+    decoded.lines = lines
+    decoded.caches = caches
+    decoded.handlers = [
+        (new_index[start], new_index[end], new_index[handler], level)
+        for start, end, handler, level in decoded.handlers
+    ]
+    return new_index
+
+
+# 块栈分析中需要单独处理的跳转指令，其余指令按 dis.stack_effect 顺序执行
+_NO_SUCCESSOR = frozenset(['RETURN_VALUE', 'RAISE_VARARGS', 'BREAK_LOOP',
+                           'CONTINUE_LOOP'])
+_CONDITIONAL_JUMPS = frozenset(['POP_JUMP_IF_TRUE', 'POP_JUMP_IF_FALSE',
+                                'JUMP_IF_TRUE_OR_POP', 'JUMP_IF_FALSE_OR_POP'])
+
+
+def _block_states(decoded):
+    """对指令流做抽象执行，求出每条指令执行前所有可能的 (数据栈深度, 块栈) 状态
+       块栈中的元素与运行时的块对应：('loop' / 'setup-except' / 'finally', handler, level)、
+       ('except-handler', level)；另用 ('none',) 与 ('why',) 标记 finally 代码入口处
+       栈顶的 None 与 why 字符串，以便确定 END_FINALLY 之后能否顺序执行。
+       return、break、continue 由块栈在运行时展开，不沿其路径分析。
+       遇到不认识的控制流（如 with 语句）时返回 None
+    """
+    code = decoded.code
+    instructions = decoded.instructions
+    states = [set() for _ in instructions]
+    pending = [(0, 0, ())]
+    while pending:
+        index, depth, blocks = pending.pop()
+        if (not 0 <= depth <= code.co_stacksize or len(blocks) > 20 or
+                index >= len(instructions)):
+            return None
+        state = (depth, blocks)
+        if state in states[index]:
+            continue
+        states[index].add(state)
+        opcode, byteName, arguments = instructions[index]
+        following = index + 1
+        if byteName in _NO_SUCCESSOR:
+            continue
+        elif byteName in ('JUMP_FORWARD', 'JUMP_ABSOLUTE'):
+            pending.append((arguments[0], depth, blocks))
+        elif byteName in _CONDITIONAL_JUMPS:
+            jump_depth = depth - 1 if byteName.startswith('POP_') else depth
+            pending.append((following, depth - 1, blocks))
+            pending.append((arguments[0], jump_depth, blocks))
+        elif byteName == 'FOR_ITER':
+            pending.append((following, depth + 1, blocks))
+            pending.append((arguments[0], depth - 1, blocks))
+        elif byteName == 'SETUP_LOOP':
+            pending.append((following, depth, blocks + (('loop', arguments[0], depth),)))
+            # break 跳到循环之后
+            pending.append((arguments[0], depth, blocks))
+        elif byteName in ('SETUP_EXCEPT', 'SETUP_FINALLY'):
+            handler = arguments[0]
+            kind = 'setup-except' if byteName == 'SETUP_EXCEPT' else 'finally'
+            pending.append((following, depth, blocks + ((kind, handler, depth),)))
+            # 抛出异常：压入 except-handler 块与6个元素
+            pending.append((handler, depth + 6,
+                            blocks + (('except-handler', depth),)))
+            if kind == 'finally':
+                # return / continue 穿过 finally：压入 why，return 与 continue 另压入一个值
+                pending.append((handler, depth + 1, blocks + (('why',),)))
+                pending.append((handler, depth + 2, blocks + (('why',),)))
+        elif byteName == 'POP_BLOCK':
+            if not blocks or blocks[-1][0] not in ('loop', 'setup-except',
+                                                   'finally'):
+                return None
+            popped, blocks = blocks[-1], blocks[:-1]
+            if popped[0] == 'finally':
+                # 编译器随后压入 None 并顺序进入 finally 代码
+                blocks += (('none',),)
+            pending.append((following, depth, blocks))
+        elif byteName == 'POP_EXCEPT':
+            if not blocks or blocks[-1][0] != 'except-handler':
+                return None
+            pending.append((following, blocks[-1][1], blocks[:-1]))
+        elif byteName == 'END_FINALLY':
+            if not blocks or blocks[-1][0] not in ('none', 'why',
+                                                   'except-handler'):
+                return None
+            # 只有栈顶为 None 时顺序执行，否则继续 return / continue 或重新抛出异常
+            if blocks[-1][0] == 'none':
+                pending.append((following, depth - 1, blocks[:-1]))
+        elif ARG_KINDS[opcode] in (ARG_JREL, ARG_JABS):
+            return None
+        elif opcode == dis.EXTENDED_ARG:
+            pending.append((following, depth, blocks))
+        else:
+            oparg = None
+            if opcode >= dis.HAVE_ARGUMENT:
+                oparg = arguments[0] if ARG_KINDS[opcode] == ARG_INT else 0
+            pending.append((following, depth + dis.stack_effect(opcode, oparg),
+                            blocks))
+    return states
+
+
+# 窥孔优化改写出的伪指令：与常量元组做 in / not in 判断，参数为元组元素构成的
+# frozenset，左操作数属于 _FROZENSET_SAFE_TYPES 时查 frozenset 代替逐个比较
+def_pseudo_op('CONTAINS_FROZENSET')
+def_pseudo_op('NOT_CONTAINS_FROZENSET')
+_FROZENSET_SAFE_TYPES = frozenset([int, float, complex, str, bytes, bool,
+                                   type(None)])
+
+# 常量折叠结果的大小上限（与 CPython 的 AST 优化器相近），避免在解码时算出巨大的常量
+FOLD_MAX_INT_BITS = 128
+FOLD_MAX_SIZE = 4096
+FOLD_MAX_ITEMS = 256
+
+_CONSTANT_TYPES = frozenset([int, float, complex, str, bytes, bool,
+                             type(None), type(Ellipsis)])
+_UNCONDITIONAL_JUMPS = frozenset(['JUMP_ABSOLUTE', 'JUMP_FORWARD'])
+_THREADED_JUMPS = _UNCONDITIONAL_JUMPS | _CONDITIONAL_JUMPS
+
+
+def peephole_optimize(decoded):
+    """窥孔优化，反复进行以下改写直到指令流不再变化：
+       常量折叠（常量的一元、二元运算与 BUILD_TUPLE，条件为常量的跳转）、
+       `x in (常量, ...)` 对内置类型的 x 改为 frozenset 成员判断、删去 LOAD_CONST/POP_TOP 对、
+       跳转到无条件跳转的跳转直接跳到最终目标（跳转串联）、删去不可达代码与空操作。
+       保留下来的指令沿用原来的行号，折叠出的指令使用第一条被折叠指令的行号；
+       `original_size` 记录优化之前的指令数
+    """
+    while True:
+        removed = False
+        for transform in (_fold_constants, _thread_jumps, _dead_code):
+            indexes = transform(decoded)
+            if indexes:
+                remove_instructions(decoded, indexes)
+                removed = True
+        if not removed:
+            break
+
+
+def _jump_targets(decoded):
+    targets = set(arguments[0] for opcode, _, arguments in decoded.instructions
+                  if opcode in JUMP_OPS)
+    for start, end, handler, level in decoded.handlers:
+        targets.update((start, end, handler))
+    return targets
+
+
+def _is_constant(value):
+    """能否作为折叠出的常量：不可变、可 marshal（见 DiskCache），且不太大"""
+    kind = type(value)
+    if kind is tuple or kind is frozenset:
+        return (len(value) <= FOLD_MAX_ITEMS and
+                all(_is_constant(item) for item in value))
+    if kind is int:
+        return value.bit_length() <= FOLD_MAX_INT_BITS
+    if kind is str or kind is bytes:
+        return len(value) <= FOLD_MAX_SIZE
+    return kind in _CONSTANT_TYPES
+
+
+def _fold_value(name, fn, args):
+    """计算常量表达式，结果过大、计算出错或不能作为常量时返回 _UNBOUND"""
+    if len(args) == 2:
+        x, y = args
+        # 结果可能很大的运算先估计大小，不做计算
+        if name == 'POWER' and type(x) is int and type(y) is int:
+            if y > 0 and x.bit_length() * y > FOLD_MAX_INT_BITS:
+                return _UNBOUND
+        elif name == 'LSHIFT' and type(y) is int and y > FOLD_MAX_INT_BITS:
+            return _UNBOUND
+        elif name == 'MULTIPLY':
+            for seq, count in ((x, y), (y, x)):
+                if (type(count) is int and type(seq) in (str, bytes, tuple) and
+                        len(seq) * count > FOLD_MAX_SIZE):
+                    return _UNBOUND
+    try:
+        value = fn(*args)
+    except Exception:
+        return _UNBOUND
+    return value if _is_constant(value) else _UNBOUND
+
+
+def _fold_constants(decoded):
+    """常量折叠，返回要删去的指令下标。`consts` 为紧挨当前指令之前、连续压入常量的
+       LOAD_CONST 的下标，其中除第一条外都不是跳转目标，因此它们压入的值一定由当前指令取用
+    """
+    instructions = decoded.instructions
+    targets = _jump_targets(decoded)
+    load_const = OPMAP['LOAD_CONST']
+    in_op, not_in_op = dis.cmp_op.index('in'), dis.cmp_op.index('not in')
+    removed = set()
+    consts = []
+
+    def replace(count, index, value):
+        # 把 `consts` 末尾 count 条 LOAD_CONST 与第 index 条指令替换为一条 LOAD_CONST
+        taken = consts[len(consts) - count:] if count else []
+        del consts[len(consts) - count:]
+        position = taken[0] if taken else index
+        removed.update(taken[1:])
+        if position != index:
+            removed.add(index)
+        instructions[position] = (load_const, 'LOAD_CONST', (value,))
+        consts.append(position)
+
+    for index, (opcode, byteName, arguments) in enumerate(instructions):
+        if index in targets:
+            consts = []
+        if byteName == 'LOAD_CONST':
+            consts.append(index)
+            continue
+        values = [instructions[i][2][0] for i in consts]
+        following = None
+        if index + 1 < len(instructions):
+            following = instructions[index + 1]
+        if byteName.startswith('UNARY_') and consts:
+            name = byteName[6:]
+            value = _fold_value(name, VirtualMachine.UNARY_OPERATORS.get(name),
+                                values[-1:])
+            if value is not _UNBOUND:
+                replace(1, index, value)
+                continue
+        elif byteName.startswith('BINARY_') and len(consts) >= 2:
+            name = byteName[7:]
+            value = _fold_value(name, VirtualMachine.BINARY_OPERATORS.get(name),
+                                values[-2:])
+            if value is not _UNBOUND:
+                replace(2, index, value)
+                continue
+        elif byteName in ('BUILD_TUPLE', 'BUILD_LIST', 'BUILD_SET') and (
+                len(consts) >= arguments[0]):
+            # 列表与集合只在紧接着做 in / not in 判断时折叠（成员判断不关心容器类型）
+            membership = (following is not None and index + 1 not in targets
+                          and following[1] == 'COMPARE_OP' and
+                          following[2][0] in (in_op, not_in_op))
+            value = tuple(values[len(values) - arguments[0]:])
+            if (byteName == 'BUILD_TUPLE' or membership) and _is_constant(value):
+                replace(arguments[0], index, value)
+                continue
+        elif (byteName == 'COMPARE_OP' and arguments[0] in (in_op, not_in_op)
+              and consts and type(values[-1]) is tuple):
+            try:
+                members = frozenset(values[-1])
+            except TypeError:
+                members = None
+            if members is not None:
+                name = ('CONTAINS_FROZENSET' if arguments[0] == in_op
+                        else 'NOT_CONTAINS_FROZENSET')
+                instructions[index] = (OPMAP[name], name, (members,))
+        elif byteName in ('POP_JUMP_IF_FALSE', 'POP_JUMP_IF_TRUE') and consts:
+            # 条件为常量：跳转或者不跳转是确定的
+            removed.add(index)
+            if bool(values[-1]) == (byteName == 'POP_JUMP_IF_TRUE'):
+                instructions[consts[-1]] = (OPMAP['JUMP_ABSOLUTE'],
+                                            'JUMP_ABSOLUTE', arguments)
+                consts = []
+            else:
+                removed.add(consts.pop())
+            continue
+        elif byteName == 'POP_TOP' and consts:
+            removed.add(consts.pop())
+            removed.add(index)
+            continue
+        consts = []
+    return removed
+
+
+def _thread_jumps(decoded):
+    """跳转串联：跳转目标为无条件跳转时直接跳到最终目标；返回跳到下一条指令、
+       可以删去的无条件跳转的下标
+    """
+    instructions = decoded.instructions
+    removed = set()
+    for index, (opcode, byteName, arguments) in enumerate(instructions):
+        if byteName not in _THREADED_JUMPS:
+            continue
+        target = arguments[0]
+        for _ in range(len(instructions)):
+            if instructions[target][1] not in _UNCONDITIONAL_JUMPS:
+                break
+            target = instructions[target][2][0]
+        else:
+            # 跳转成环（死循环），保持原样
+            continue
+        if target != arguments[0]:
+            if byteName == 'JUMP_FORWARD' and target < index:
+                # 串联后向回跳转：改为 JUMP_ABSOLUTE，运行限制只检查绝对跳转的回跳
+                opcode, byteName = OPMAP['JUMP_ABSOLUTE'], 'JUMP_ABSOLUTE'
+            instructions[index] = (opcode, byteName, (target,) + arguments[1:])
+        if byteName in _UNCONDITIONAL_JUMPS and target == index + 1:
+            removed.add(index)
+    return removed
+
+
+def _dead_code(decoded):
+    """返回不可达指令与空操作（NOP、已合并到参数中的 EXTENDED_ARG）的下标
+       从入口与异常表的处理代码出发，沿顺序执行与跳转参数（包括 SETUP_* 的处理代码）求可达指令
+    """
+    instructions = decoded.instructions
+    n = len(instructions)
+    reachable = [False] * n
+    pending = [0] + [handler for _, _, handler, _ in decoded.handlers]
+    while pending:
+        index = pending.pop()
+        while index < n and not reachable[index]:
+            reachable[index] = True
+            opcode, byteName, arguments = instructions[index]
+            if opcode in JUMP_OPS:
+                pending.append(arguments[0])
+            if byteName in _NO_SUCCESSOR or byteName in _UNCONDITIONAL_JUMPS:
+                break
+            index += 1
+    return set(
+        index for index in range(n)
+        if not reachable[index] or instructions[index][0] in (
+            dis.EXTENDED_ARG, OPMAP['NOP'])
+    )
+
+
+# 超级指令：(前一条指令名, 后一条指令名) -> 融合后的伪指令名
+SUPERINSTRUCTIONS = {
+    ('LOAD_FAST', 'LOAD_FAST'): 'LOAD_FAST__LOAD_FAST',
+    ('COMPARE_OP', 'POP_JUMP_IF_FALSE'): 'COMPARE_OP__POP_JUMP_IF_FALSE',
+    ('COMPARE_OP', 'POP_JUMP_IF_TRUE'): 'COMPARE_OP__POP_JUMP_IF_TRUE',
+    ('FOR_ITER', 'STORE_FAST'): 'FOR_ITER__STORE_FAST',
+}
+SUPERINSTRUCTIONS.update(
+    (('LOAD_CONST', name), 'LOAD_CONST__' + name)
+    for name in dis.opmap if name.startswith('BINARY_')
+)
+for _name in sorted(SUPERINSTRUCTIONS.values()):
+    def_pseudo_op(_name)
+
+
+def fuse_superinstructions(decoded):
+    """超级指令融合：把常见的相邻指令对合并为一条伪指令，每对省去一次分派
+       融合后的指令参数为两条指令参数的拼接；被跳转到的指令不参与融合（否则会
+       跳进一对指令的中间），其余跳转目标、行号表与内联缓存按新的下标重新排列
+    """
+    instructions = decoded.instructions
+    n = len(instructions)
+    targets = set(
+        arguments[0] for opcode, _, arguments in instructions
+        if opcode in JUMP_OPS
+    )
+    # 异常表的起点与处理代码入口同样不能落在一对指令的中间
+    for start, end, handler, level in decoded.handlers:
+        targets.update((start, handler))
+    # 找出可融合的指令对（记录前一条的下标），以及旧下标到新下标的映射
+    pairs = set()
+    new_index = []
+    index = 0
+    while index < n:
+        new_index.append(index - len(pairs))
+        if (index + 1 < n and index + 1 not in targets and
+                (instructions[index][1], instructions[index + 1][1])
+                in SUPERINSTRUCTIONS):
+            pairs.add(index)
+            new_index.append(index - len(pairs) + 1)
+            index += 2
+        else:
+            index += 1
+    if not pairs:
+        return
+
+    def remap(opcode, arguments):
+        if opcode in JUMP_OPS:
+            return (new_index[arguments[0]],) + arguments[1:]
+        return arguments
+
+    fused, lines, caches = [], [], []
+    index = 0
+    while index < n:
+        opcode, byteName, arguments = instructions[index]
+        arguments = remap(opcode, arguments)
+        if index in pairs:
+            opcode2, byteName2, arguments2 = instructions[index + 1]
+            byteName = SUPERINSTRUCTIONS[byteName, byteName2]
+            opcode = OPMAP[byteName]
+            arguments += remap(opcode2, arguments2)
+        fused.append((opcode, byteName, arguments))
+        lines.append(decoded.lines[index])
+        caches.append(decoded.caches[index])
+        index += 2 if index in pairs else 1
+    decoded.instructions = fused
+    decoded.lines = lines
+    decoded.caches = caches
+    decoded.fused = len(pairs)
+    new_index.append(len(fused))
+    decoded.handlers = [
+        (new_index[start], new_index[end], new_index[handler], level)
+        for start, end, handler, level in decoded.handlers
+    ]
+
+
+# 执行引擎名到 VirtualMachine 方法名的映射
+ENGINES = {
+    'table': 'execute_table',
+    'threaded': 'execute_threaded',
+}
+
+# 闭包串联引擎中按指令名特化的闭包工厂：以解码后的参数构造 op(vm)
+THREADED_OPS = {}
+
+
+def threaded_op(byteName):
+    def register(factory):
+        THREADED_OPS[byteName] = factory
+        return factory
+    return register
+
+
+def compile_threaded(decoded, table):
+    """把预解码指令流翻译为闭包列表 `ops`，`ops[i](vm)` 执行第 i 条指令
+       参数与跳转目标在翻译时绑定：常用指令使用 THREADED_OPS 中的特化闭包，
+       省去参数解包与间接调用；其余指令把参数绑定到分派表中的处理函数上。
+       虚拟机子类重写了某条指令时，该指令不使用特化闭包
+    """
+    base = VirtualMachine.get_dispatch_table()
+    ops = []
+    for byteCode, byteName, arguments in decoded.instructions:
+        handler = table[byteCode]
+        factory = THREADED_OPS.get(byteName)
+        if factory is not None and handler is base[byteCode]:
+            op = factory(*arguments)
+        else:
+            op = _bind_handler(handler, arguments)
+        ops.append(op)
+    return ops
+
+
+def _bind_handler(handler, arguments):
+    if not arguments:
+        return handler
+    if len(arguments) == 1:
+        arg, = arguments
+        def op(vm):
+            return handler(vm, arg)
+        return op
+    def op(vm):
+        return handler(vm, *arguments)
+    return op
+
+
+@threaded_op('LOAD_CONST')
+def _threaded_load_const(const):
+    def op(vm):
+        f = vm.frame
+        f.stack[f.sp] = const
+        f.sp += 1
+    return op
+
+
+@threaded_op('POP_TOP')
+def _threaded_pop_top():
+    def op(vm):
+        f = vm.frame
+        sp = f.sp = f.sp - 1
+        f.stack[sp] = None
+    return op
+
+
+@threaded_op('LOAD_FAST')
+def _threaded_load_fast(index):
+    def op(vm):
+        f = vm.frame
+        val = f.fastlocals[index]
+        if val is _UNBOUND:
+            return vm.byte_LOAD_FAST(index)
+        f.stack[f.sp] = val
+        f.sp += 1
+    return op
+
+
+@threaded_op('STORE_FAST')
+def _threaded_store_fast(index):
+    def op(vm):
+        f = vm.frame
+        sp = f.sp = f.sp - 1
+        f.fastlocals[index] = f.stack[sp]
+        f.stack[sp] = None
+    return op
+
+
+@threaded_op('LOAD_DEREF')
+def _threaded_load_deref(index):
+    def op(vm):
+        f = vm.frame
+        try:
+            f.stack[f.sp] = f.fastlocals[index].cell_contents
+        except ValueError:
+            raise vm.unbound_deref(index)
+        f.sp += 1
+    return op
+
+
+@threaded_op('STORE_DEREF')
+def _threaded_store_deref(index):
+    def op(vm):
+        f = vm.frame
+        sp = f.sp = f.sp - 1
+        try:
+            f.fastlocals[index].cell_contents = f.stack[sp]
+        except AttributeError:
+            set_cell_contents(f.fastlocals[index], f.stack[sp])
+        f.stack[sp] = None
+    return op
+
+
+@threaded_op('LOAD_GLOBAL')
+def _threaded_load_global(name, cache):
+    def op(vm):
+        f = vm.frame
+        if cache[0] == _namespace_version and cache[1] is f.f_globals:
+            f.stack[f.sp] = cache[2]
+            f.sp += 1
+        else:
+            return vm.byte_LOAD_GLOBAL(name, cache)
+    return op
+
+
+@threaded_op('COMPARE_OP')
+def _threaded_compare_op(opnum):
+    # 比较运算符在翻译时已知，不再每次查 COMPARE_OPERATORS 表
+    fn = VirtualMachine.COMPARE_OPERATORS[opnum]
+    def op(vm):
+        f = vm.frame
+        stack = f.stack
+        sp = f.sp = f.sp - 1
+        stack[sp - 1] = fn(stack[sp - 1], stack[sp])
+        stack[sp] = None
+    return op
+
+
+@threaded_op('JUMP_ABSOLUTE')
+@threaded_op('JUMP_FORWARD')
+def _threaded_jump(jump):
+    def op(vm):
+        vm.frame.f_lasti = jump
+    return op
+
+
+@threaded_op('POP_JUMP_IF_FALSE')
+def _threaded_pop_jump_if_false(jump):
+    def op(vm):
+        f = vm.frame
+        sp = f.sp = f.sp - 1
+        val = f.stack[sp]
+        f.stack[sp] = None
+        if not val:
+            f.f_lasti = jump
+    return op
+
+
+@threaded_op('POP_JUMP_IF_TRUE')
+def _threaded_pop_jump_if_true(jump):
+    def op(vm):
+        f = vm.frame
+        sp = f.sp = f.sp - 1
+        val = f.stack[sp]
+        f.stack[sp] = None
+        if val:
+            f.f_lasti = jump
+    return op
+
+
+@threaded_op('FOR_ITER')
+def _threaded_for_iter(jump):
+    def op(vm):
+        f = vm.frame
+        sp = f.sp
+        try:
+            f.stack[sp] = next(f.stack[sp - 1])
+            f.sp = sp + 1
+        except StopIteration:
+            f.stack[sp - 1] = None
+            f.sp = sp - 1
+            f.f_lasti = jump
+    return op
+
+
+class OpcodeProfiler(object):
+    """OpcodeProfiler 类：指令级性能剖析数据（见 VirtualMachine.enable_profiling）
+       `opcodes`：指令名 -> [执行次数, 累计耗时]
+       `codes`：code object -> [执行指令数, 累计耗时]
+       `lines`：(文件名, 行号) -> [执行指令数, 累计耗时]
+       `calls`：code object -> 函数调用次数
+       耗时为指令自身的处理时间，虚拟机函数调用切换到被调用帧后不再计入调用者
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        self.opcodes = {}
+        self.codes = {}
+        self.lines = {}
+        self.calls = {}
+
+    def record(self, code, byteName, lineno, elapsed):
+        for table, key in ((self.opcodes, byteName), (self.codes, code),
+                           (self.lines, (code.co_filename, lineno))):
+            entry = table.get(key)
+            if entry is None:
+                table[key] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def record_call(self, code):
+        self.calls[code] = self.calls.get(code, 0) + 1
+
+    @staticmethod
+    def code_label(code):
+        return '%s:%d(%s)' % (code.co_filename, code.co_firstlineno,
+                              code.co_name)
+
+    def as_dict(self):
+        """转换为可序列化为 JSON 的字典，按累计耗时从高到低排列"""
+        def rows(table, label):
+            items = sorted(table.items(), key=lambda item: -item[1][1])
+            return [dict(label(key), count=count, time=elapsed)
+                    for key, (count, elapsed) in items]
+        return {
+            'opcodes': rows(self.opcodes, lambda name: {'opname': name}),
+            'codes': rows(self.codes, lambda code: {
+                'code': self.code_label(code),
+                'calls': self.calls.get(code, 0),
+            }),
+            'lines': rows(self.lines, lambda key: {
+                'filename': key[0], 'lineno': key[1],
+            }),
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def create_stats(self):
+        """生成 pstats 格式的统计数据，使 `pstats.Stats(profiler)` 可直接使用
+           每个 code object 作为一个函数，累计耗时与自身耗时相同（不含被调用函数）
+        """
+        self.stats = {}
+        for code, (count, elapsed) in self.codes.items():
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            calls = self.calls.get(code, 1)
+            self.stats[key] = (calls, calls, elapsed, elapsed, {})
+        return self.stats
+
+    def dump_stats(self, filename):
+        """以 cProfile 相同的格式写入文件，可由 `pstats.Stats(filename)` 读取"""
+        with open(filename, 'wb') as f:
+            marshal.dump(self.create_stats(), f)
+
+
+class SamplingProfiler(object):
+    """SamplingProfiler 类：对虚拟机调用栈（`vm.frames`）定期采样的剖析器
+       默认由后台计时线程每隔 `interval` 秒采样一次，主循环没有额外开销；
+       给出 `instructions` 时改为每执行这么多条指令采样一次（执行引擎切换为 execute_sampled）。
+       `stacks` 记录每种调用栈出现的次数，栈由外到内，每层为 (co_name, 文件名, 行号)
+
+           sampler = SamplingProfiler(vm)
+           with sampler:
+               vm.run_code(code_obj)
+           sampler.write_folded('out.folded')  # 交给 flamegraph.pl 等工具
+    """
+
+    def __init__(self, vm, interval=0.001, instructions=None):
+        self.vm = vm
+        self.interval = interval
+        self.instructions = instructions
+        self.countdown = instructions
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        """记录一次当前的虚拟机调用栈，虚拟机空闲时不记录"""
+        frames = list(self.vm.frames)
+        if not frames:
+            return
+        stack = tuple((frame.f_code.co_name, frame.f_code.co_filename,
+                       frame.f_lineno) for frame in frames)
+        self.stacks[stack] += 1
+        self.samples += 1
+
+    def start(self):
+        if self.instructions:
+            vm = self.vm
+            vm.sampler = self
+            vm.execute = vm.execute_sampled
+        else:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name='byterun-sampler')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+        if self.vm.sampler is self:
+            self.vm.sampler = None
+            self.vm.execute = getattr(self.vm, ENGINES[self.vm.engine])
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def folded(self):
+        """折叠栈格式的文本：每行为以分号连接的栈帧加空格加采样次数"""
+        lines = []
+        for stack, count in sorted(self.stacks.items()):
+            frames = ';'.join('%s (%s:%d)' % frame for frame in stack)
+            lines.append('%s %d\n' % (frames, count))
+        return ''.join(lines)
+
+    def write_folded(self, filename):
+        with open(filename, 'w') as f:
+            f.write(self.folded())
+
+
+def unpack(seq, count):
+    """把序列解包为恰好 `count` 个元素的元组，个数不符时抛出与真实 Python 一致的 ValueError"""
+    items = tuple(seq)
+    if len(items) != count:
+        if len(items) > count:
+            raise ValueError("too many values to unpack (expected %d)" % count)
+        raise ValueError("not enough values to unpack (expected %d, got %d)"
+                         % (count, len(items)))
+    return items
+
+
+def cell_name(code, index):
+    """cell 槽位下标对应的变量名"""
+    return (code.co_cellvars + code.co_freevars)[index - code.co_nlocals]
 
 
 def make_cell(value):
@@ -447,17 +2869,48 @@ def make_cell(value):
     return fn.__closure__[0]
 
 
+def make_empty_cell():
+    """创建一个空的 cell 对象，对应尚未赋值的 cell 变量"""
+    if False:
+        value = None
+    return (lambda: value).__closure__[0]
+
+
+if sys.version_info >= (3, 7):
+    def set_cell_contents(cell, value):
+        """写入 cell 的内容，`value` 为 _UNBOUND 时清空"""
+        if value is _UNBOUND:
+            del cell.cell_contents
+        else:
+            cell.cell_contents = value
+else:
+    import ctypes
+
+    # Python 3.6 的 cell_contents 只读，通过 C API PyCell_Set 写入
+    _PyCell_Set = ctypes.pythonapi.PyCell_Set
+    _PyCell_Set.argtypes = (ctypes.py_object, ctypes.py_object)
+    _PyCell_Set.restype = ctypes.c_int
+
+    def set_cell_contents(cell, value):
+        """写入 cell 的内容，`value` 为 _UNBOUND 时清空"""
+        if value is _UNBOUND:
+            _PyCell_Set(cell, ctypes.py_object())
+        else:
+            _PyCell_Set(cell, value)
+
+
 class Function(object):
 
     # __slots__ 会固定对象的属性，无法再动态增加新的属性，这可以节省内存空间
     __slots__ = [
         'func_code', 'func_name', 'func_defaults', 'func_globals',
-        'func_locals', 'func_dict', 'func_closure',
+        'func_locals', 'func_dict', 'func_closure', 'func_kwdefaults',
         '__name__', '__dict__', '__doc__',
-        '_vm', '_func',
+        '_vm', '_func', '_bind', '_decoded', '_generator',
     ]
 
-    def __init__(self, name, code, globs, defaults, closure, vm):
+    def __init__(self, name, code, globs, defaults, closure, vm,
+                 kwdefaults=None):
         """这部分不需要去深究，但是代码会尽量注释说明"""
         self._vm = vm
         # 这里的 code 即所调用函数的 code_obj
@@ -466,33 +2919,276 @@ class Function(object):
         self.func_name = self.__name__ = name or code.co_name
         # 函数参数的默认值，如 func(a=5,b=3) ，则 func_defaults 为 (5,3)
         self.func_defaults = tuple(defaults)
+        # 仅限关键字参数的默认值，如 func(*, c=1) ，则 func_kwdefaults 为 {'c': 1}
+        self.func_kwdefaults = kwdefaults
         self.func_globals = globs
         self.func_locals = self._vm.frame.f_locals
         self.__dict__ = {}
-        # 函数的闭包信息
-        # self.func_closure = closure
+        # 函数的闭包信息：自由变量的 cell 元组（由外层帧的 LOAD_CLOSURE 取得）
+        self.func_closure = closure
         self.__doc__ = code.co_consts[0] if code.co_consts else None
         # 有时我们需要用到真实 Python 的函数，下面的代码是为它准备的
         kw = {
             'argdefs': self.func_defaults,
         }
-        # 为闭包创建 cell 对象
-        # if closure:
-        #     kw['closure'] = tuple(make_cell(0) for _ in closure)
+        # 真实函数与虚拟机函数共享同一组 cell
+        if closure:
+            kw['closure'] = closure
         self._func = types.FunctionType(code, globs, **kw)
+        self._func.__kwdefaults__ = kwdefaults
+        # 参数绑定函数与预解码指令流只在创建函数时获取一次
+        self._bind = make_binder(self)
+        self._decoded = vm.code_cache.get(code)
+        self._generator = bool(code.co_flags & inspect.CO_GENERATOR)
     
-    def __call__(self, *args, **kwargs):
-        """每调用一次函数，将创建一个新帧并运行"""
-        # 通过`inspect.getcallargs`获取绑定参数
-        callargs = inspect.getcallargs(self._func, *args, **kwargs)
-        # 为函数创建新帧
-        frame = self._vm.make_frame(
-            self.func_code, callargs, self.func_globals, {}
-        )
-        return self._vm.run_frame(frame)
-
+    def make_call_frame(self, args, kwargs):
+        """为一次调用绑定参数并创建新帧，有空闲的帧时复用（见 VirtualMachine.release_frame）"""
+        fastlocals = self._bind(args, kwargs)
+        vm = self._vm
+        pool = vm.frame_pool.get(self.func_code)
+        if pool:
+            frame = pool.pop()
+            frame.reset(self.func_globals, vm.frame, fastlocals, self._decoded,
+                        self.func_closure)
+            return frame
+        return Frame(self.func_code, self.func_globals, None, vm.frame,
+                     fastlocals, self._decoded, self.func_closure)
+
+    @property
+    def __closure__(self):
+        return self.func_closure
+
+    def __repr__(self):
+        return '<function %s at 0x%x>' % (self.func_name, id(self))
 
-Block = collections.namedtuple("Block", "type, handler, level")
+    def __call__(self, *args, **kwargs):
+        """每调用一次函数，将创建一个新帧并运行
+           （虚拟机内部的调用由 CALL_FUNCTION 直接处理，不经过这里）
+        """
+        vm = self._vm
+        if vm.hybrid and vm.prefers_native(self):
+            return vm.call_native(self, args, kwargs)
+        frame = self.make_call_frame(args, kwargs)
+        if self._generator:
+            return Generator(frame, vm)
+        vm.charge_call(frame)
+        result = vm.run_frame(frame)
+        vm.release_frame(frame)
+        return result
+
+    def __get__(self, instance, owner):
+        """作为类属性时像普通函数一样绑定为方法"""
+        if instance is None:
+            return self
+        return types.MethodType(self, instance)
+
+
+class Generator(object):
+    """Generator 类：包装一个挂起的虚拟机帧
+       调用生成器函数时只创建帧，每次 send / next / throw 从上次挂起处恢复运行，
+       直到下一条 YIELD_VALUE / YIELD_FROM 或函数返回；挂起期间帧不在调用栈上
+    """
+
+    def __init__(self, frame, vm):
+        self._vm = vm
+        # 生成器帧的 f_back 一直引用创建它的帧
+        if frame.f_back is not None:
+            frame.f_back.mark_escaped()
+        self.gi_frame = frame
+        self.gi_code = frame.f_code
+        self.gi_running = False
+        self.__name__ = frame.f_code.co_name
+        # 挂起在 except / finally 块中时，生成器自己正在处理的异常
+        self._exc_info = (None, None, None)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+    def send(self, value):
+        frame = self.gi_frame
+        if frame is None:
+            raise StopIteration
+        if self.gi_running:
+            raise ValueError("generator already executing")
+        if frame.f_lasti == 0:
+            if value is not None:
+                raise TypeError("can't send non-None value to a "
+                                "just-started generator")
+        else:
+            # 发送的值作为挂起处 yield 表达式的值
+            frame.stack[frame.sp] = value
+            frame.sp += 1
+        return self._resume()
+
+    def throw(self, typ, val=None, tb=None):
+        if isinstance(typ, BaseException):
+            typ, val = type(typ), typ
+        elif not isinstance(val, typ):
+            val = typ() if val is None else typ(val)
+        frame = self.gi_frame
+        if frame is None:
+            raise val
+        if self.gi_running:
+            raise ValueError("generator already executing")
+        receiver = self._yield_from_receiver()
+        if receiver is not None:
+            # 挂起在 yield from 中：先交给子迭代器处理
+            close = issubclass(typ, GeneratorExit)
+            delegate = getattr(receiver, 'close' if close else 'throw', None)
+            if delegate is not None:
+                self.gi_running = True
+                try:
+                    if close:
+                        delegate()
+                    else:
+                        return delegate(typ, val, tb)
+                except StopIteration as e:
+                    if close:
+                        raise
+                    # 子迭代器已结束：其返回值作为 yield from 表达式的值继续运行
+                    self._finish_yield_from()
+                    frame.stack[frame.sp] = e.value
+                    frame.sp += 1
+                    typ = None
+                except BaseException as e:
+                    self._finish_yield_from()
+                    typ, val, tb = type(e), e, e.__traceback__
+                finally:
+                    self.gi_running = False
+                if typ is None:
+                    return self._resume()
+        return self._resume((typ, val, tb))
+
+    def close(self):
+        if self.gi_frame is None:
+            return
+        try:
+            self.throw(GeneratorExit)
+        except (GeneratorExit, StopIteration):
+            pass
+        else:
+            raise RuntimeError("generator ignored GeneratorExit")
+
+    def _yield_from_receiver(self):
+        """挂起在 YIELD_FROM 时返回子迭代器（YIELD_FROM 挂起时 f_lasti 指向其自身）"""
+        frame = self.gi_frame
+        if frame.f_lasti and frame.decoded.instructions[frame.f_lasti][1] == 'YIELD_FROM':
+            return frame.stack[frame.sp - 1]
+        return None
+
+    def _finish_yield_from(self):
+        """弹出子迭代器并越过 YIELD_FROM"""
+        frame = self.gi_frame
+        frame.sp -= 1
+        frame.stack[frame.sp] = None
+        frame.f_lasti += 1
+
+    def _resume(self, exc_info=None):
+        # 生成器运行期间使用自己的异常处理状态，挂起或结束时恢复调用者的状态
+        vm = self._vm
+        outer = vm.exc_info
+        if self._exc_info[1] is not None:
+            vm.exc_info = self._exc_info
+        self.gi_running = True
+        try:
+            why, value = vm.resume_frame(self.gi_frame, exc_info)
+        except StopIteration as e:
+            self.gi_frame = None
+            raise RuntimeError("generator raised StopIteration") from e
+        except BaseException:
+            self.gi_frame = None
+            raise
+        finally:
+            self.gi_running = False
+            self._exc_info = (vm.exc_info if vm.exc_info is not outer
+                              else (None, None, None))
+            vm.exc_info = outer
+        if why == 'yield':
+            return value
+        self.gi_frame = None
+        if value is None:
+            raise StopIteration
+        raise StopIteration(value)
+
+
+def make_binder(func):
+    """根据 code object 的参数信息为函数生成参数绑定函数
+       绑定函数 `bind(args, kwargs)` 返回新帧的快速局部变量槽位列表，
+       `args` 为列表时会被直接复用；
+       只有位置参数的调用走快速路径，参数有误时交给 `inspect.getcallargs`
+       抛出与真实 Python 一致的 TypeError
+    """
+    code = func.func_code
+    argcount = code.co_argcount
+    kwonlycount = code.co_kwonlyargcount
+    nlocals = code.co_nlocals
+    varargs = code.co_flags & inspect.CO_VARARGS
+    varkw = code.co_flags & inspect.CO_VARKEYWORDS
+    defaults = list(func.func_defaults)
+    kwdefaults = func.func_kwdefaults or {}
+    # 可省略的位置参数从下标 mindefault 开始
+    mindefault = argcount - len(defaults)
+    # 参数之后的槽位（普通局部变量）初始均未赋值
+    rest = [_UNBOUND] * (nlocals - argcount)
+    simple = not (kwonlycount or varargs or varkw)
+    # 可通过关键字传入的参数名及其槽位下标
+    argindex = {
+        name: i for i, name in enumerate(code.co_varnames[:argcount + kwonlycount])
+    }
+    varargs_index = argcount + kwonlycount
+    varkw_index = varargs_index + (1 if varargs else 0)
+
+    def fail(args, kwargs):
+        inspect.getcallargs(func._func, *args, **kwargs)
+        raise TypeError("%s() got invalid arguments" % func.func_name)
+
+    def bind(args, kwargs):
+        nargs = len(args)
+        if simple and not kwargs and mindefault <= nargs <= argcount:
+            # 快速路径：只有位置参数（CALL_FUNCTION 弹出的参数列表直接复用）
+            fastlocals = args if type(args) is list else list(args)
+            if nargs < argcount:
+                fastlocals += defaults[nargs - mindefault:]
+            fastlocals += rest
+            return fastlocals
+        fastlocals = [_UNBOUND] * nlocals
+        if nargs > argcount:
+            if not varargs:
+                fail(args, kwargs)
+            fastlocals[:argcount] = args[:argcount]
+        else:
+            fastlocals[:nargs] = args
+        if varargs:
+            fastlocals[varargs_index] = tuple(args[argcount:])
+        if varkw:
+            extra = fastlocals[varkw_index] = {}
+        for name, value in kwargs.items():
+            index = argindex.get(name)
+            if index is None:
+                if not varkw:
+                    fail(args, kwargs)
+                extra[name] = value
+            elif fastlocals[index] is not _UNBOUND:
+                fail(args, kwargs)
+            else:
+                fastlocals[index] = value
+        for index in range(nargs, argcount):
+            if fastlocals[index] is _UNBOUND:
+                if index < mindefault:
+                    fail(args, kwargs)
+                fastlocals[index] = defaults[index - mindefault]
+        for index in range(argcount, varargs_index):
+            if fastlocals[index] is _UNBOUND:
+                name = code.co_varnames[index]
+                if name not in kwdefaults:
+                    fail(args, kwargs)
+                fastlocals[index] = kwdefaults[name]
+        return fastlocals
+
+    return bind
 
 
 if __name__ == '__main__':
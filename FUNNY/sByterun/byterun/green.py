@@ -0,0 +1,360 @@
+"""协作式绿色线程：在一个宿主线程中轮转运行大量虚拟机程序
+
+    scheduler = Scheduler(quantum=1000)
+    scheduler.spawn("result = wait(fetch())", fetch=fetch)
+    scheduler.run()
+    print(scheduler.metrics())
+
+每个任务是一个独立的 TaskVirtualMachine（调用栈、帧与异常状态互不干扰），
+调度器按就绪队列轮转，每个任务每次最多运行 `quantum` 条指令（时间片）后让出。
+任务中的程序可以调用 `wait(awaitable)` 等待 asyncio 的 future / 协程，
+或 `sleep(秒数)`：任务挂起直到 future 完成，其间调度器运行其他任务，并把控制权
+交还 asyncio 事件循环。`wait` 的返回值为 future 的结果，future 出错时在程序中抛出其异常
+"""
+import asyncio
+import collections
+import io
+import sys
+import time
+
+from .byterun import VirtualMachine, VirtualMachineError
+
+
+class TaskVirtualMachine(VirtualMachine):
+    """TaskVirtualMachine 类：按指令预算运行的虚拟机
+       执行引擎每条指令扣减一次 `budget`，预算用完或任务挂起在 future 上时返回 'preempt'
+    """
+
+    def __init__(self, task, engine='table', **options):
+        super(TaskVirtualMachine, self).__init__(engine=engine, **options)
+        self.task = task
+        self.budget = 0
+        # 同一时间片中嵌套运行（无法挂起）时每次补充的预算
+        self.quantum = 0
+        self.execute = (self.execute_budgeted_threaded if engine == 'threaded'
+                        else self.execute_budgeted)
+
+    def execute_budgeted(self, frame):
+        """带指令预算的查表分派引擎"""
+        table = self.dispatch_table
+        opcodes = frame.decoded.instructions
+        budget = self.budget
+        why = None
+        try:
+            while not why:
+                if budget <= 0:
+                    why = 'preempt'
+                    break
+                budget -= 1
+                byteCode, byteName, arguments = opcodes[frame.f_lasti]
+                frame.f_lasti += 1
+                why = table[byteCode](self, *arguments)
+        except:
+            self.last_exception = sys.exc_info()[:2] + (None,)
+            why = 'exception'
+        self.budget = budget
+        return why
+
+    def execute_budgeted_threaded(self, frame):
+        """带指令预算的闭包串联引擎"""
+        ops = frame.decoded.threaded_ops(self.dispatch_table)
+        budget = self.budget
+        why = None
+        try:
+            while not why:
+                if budget <= 0:
+                    why = 'preempt'
+                    break
+                budget -= 1
+                i = frame.f_lasti
+                frame.f_lasti = i + 1
+                why = ops[i](self)
+        except:
+            self.last_exception = sys.exc_info()[:2] + (None,)
+            why = 'exception'
+        self.budget = budget
+        return why
+
+    def call_function(self, func, posargs, kwargs):
+        why = super(TaskVirtualMachine, self).call_function(func, posargs,
+                                                            kwargs)
+        if why is None and self.task.future is not None:
+            # 刚调用的是 wait()：立即让出，future 完成后再继续
+            return 'preempt'
+        return why
+
+    def preempt_nested(self):
+        if self.task.future is not None:
+            self.task.cancel_wait()
+            error = VirtualMachineError(
+                "wait() cannot be used inside a generator or a function "
+                "called from host code")
+            self.last_exception = (VirtualMachineError, error, None)
+            return 'exception'
+        # 预算用完但无法挂起：补充预算，回到可挂起的调用层后再让出
+        self.task.instructions += self.quantum - self.budget
+        self.budget = self.quantum
+        return None
+
+
+class Task(object):
+    """Task 类：一个绿色线程，运行一段程序直到结束
+       `globals` 为程序的全局命名空间，`result` 为结束后全局变量 `result` 的值，
+       `exception` 为程序抛出的异常；开启输出捕获时 `stdout` 为程序的标准输出。
+       在协程中可以 `await task` 等待其结束
+    """
+
+    def __init__(self, scheduler, code, name, f_globals, capture_output,
+                 vm_options):
+        self.scheduler = scheduler
+        self.name = name
+        self.vm = TaskVirtualMachine(self, **vm_options)
+        self.globals = f_globals
+        self.frame = self.vm.make_frame(code, f_globals=f_globals)
+        self.stdout = io.StringIO() if capture_output else None
+        self.started = False
+        self.done = False
+        self.result = None
+        self.exception = None
+        # 正在等待的 future，以及恢复运行时交给程序的结果或异常
+        self.future = None
+        self.resume_why = None
+        # asyncio 中表示任务结束的 future，在调度器的事件循环中创建
+        self.finished = None
+        # 统计：时间片数、执行指令数、运行耗时、在就绪队列与挂起中等待的时间
+        self.slices = 0
+        self.instructions = 0
+        self.cpu_time = 0.0
+        self.ready_time = 0.0
+        self.max_ready_wait = 0.0
+        self.parked_time = 0.0
+        self.waits = 0
+        self.created = time.perf_counter()
+        self.ended = None
+        self.ready_since = self.created
+        self.parked_since = None
+
+    def __repr__(self):
+        return '<Task %s %s>' % (self.name, 'done' if self.done else 'pending')
+
+    def __await__(self):
+        if self.finished is None:
+            self.attach(asyncio.get_event_loop())
+        return self.finished.__await__()
+
+    def attach(self, loop):
+        """在事件循环 `loop` 中创建表示任务结束的 future"""
+        self.finished = loop.create_future()
+        if self.done:
+            self.set_finished()
+
+    def set_finished(self):
+        if self.exception is not None:
+            self.finished.set_exception(self.exception)
+            # 结果通过 metrics 与 task.exception 报告，不要求一定有人 await
+            self.finished.exception()
+        else:
+            self.finished.set_result(self.result)
+
+    def wait(self, awaitable):
+        """程序中的 wait()：挂起任务直到 `awaitable` 完成，返回值由恢复运行时填入"""
+        if self.future is not None:
+            raise VirtualMachineError("task is already waiting")
+        self.future = asyncio.ensure_future(awaitable)
+        self.waits += 1
+
+    def sleep(self, seconds):
+        self.wait(asyncio.sleep(seconds))
+
+    def cancel_wait(self):
+        self.future.cancel()
+        self.future = None
+
+    def resume_from_future(self):
+        """future 已完成：把结果替换为 wait() 调用表达式的值，或在调用处抛出异常"""
+        future, self.future = self.future, None
+        vm = self.vm
+        vm.pop()
+        if future.cancelled():
+            error = asyncio.CancelledError()
+        else:
+            error = future.exception()
+        if error is None:
+            vm.push(future.result())
+        else:
+            vm.last_exception = (type(error), error, None)
+            self.resume_why = 'exception'
+
+    def run_slice(self, quantum):
+        """运行一个时间片，返回任务是否已结束"""
+        vm = self.vm
+        vm.budget = vm.quantum = quantum
+        if not self.started:
+            vm.push_frame(self.frame)
+            self.started = True
+        why, self.resume_why = self.resume_why, None
+        stdout = sys.stdout
+        if self.stdout is not None:
+            sys.stdout = self.stdout
+        start = time.perf_counter()
+        try:
+            why = vm.run_frames(self.frame, why, preemptible=True)
+        finally:
+            self.cpu_time += time.perf_counter() - start
+            sys.stdout = stdout
+        self.slices += 1
+        self.instructions += quantum - vm.budget
+        if why == 'preempt':
+            return False
+        vm.pop_frame()
+        if why == 'exception':
+            self.exception = vm.last_exception[1]
+        else:
+            self.result = self.globals.get('result')
+        self.done = True
+        return True
+
+
+class Scheduler(object):
+    """Scheduler 类：轮转调度绿色线程的调度器
+       `quantum` 为每个时间片的指令数，`vm_options` 为各任务虚拟机的构造参数
+       （engine、superinstructions、exception_table 等，预解码指令流的缓存由所有任务共享）
+    """
+
+    def __init__(self, quantum=1000, capture_output=False, **vm_options):
+        self.quantum = quantum
+        self.capture_output = capture_output
+        self.vm_options = vm_options
+        self.tasks = []
+        self.ready = collections.deque()
+        self.parked = set()
+        self.loop = None
+        self._wakeup = None
+        self.started = self.stopped = None
+
+    def spawn(self, program, name=None, f_globals=None, **names):
+        """新建任务，`program` 为源代码或 code object，`names` 为额外放入全局命名空间的对象
+           全局命名空间中预先放入 wait 与 sleep
+        """
+        if isinstance(program, str):
+            program = compile(program, name or '<task>', 'exec')
+        if f_globals is None:
+            f_globals = {
+                '__builtins__': __builtins__,
+                '__name__': '__main__',
+                '__doc__': None,
+                '__package__': None,
+            }
+        name = name or 'task-%d' % len(self.tasks)
+        task = Task(self, program, name, f_globals, self.capture_output,
+                    self.vm_options)
+        f_globals.setdefault('wait', task.wait)
+        f_globals.setdefault('sleep', task.sleep)
+        f_globals.update(names)
+        self.tasks.append(task)
+        self.ready.append(task)
+        if self.loop is not None:
+            task.attach(self.loop)
+            self._wakeup.set()
+        return task
+
+    def run(self):
+        """在新的事件循环中运行全部任务直到结束"""
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.run_async())
+        finally:
+            loop.close()
+
+    async def run_async(self):
+        """在当前事件循环中运行全部任务直到结束（包括运行期间新建的任务）"""
+        self.loop = asyncio.get_event_loop()
+        self._wakeup = asyncio.Event()
+        for task in self.tasks:
+            if task.finished is None:
+                task.attach(self.loop)
+        self.started = time.perf_counter()
+        try:
+            while self.ready or self.parked:
+                if not self.ready:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                self.run_slice(self.ready.popleft())
+                # 每个时间片后把控制权交还事件循环，处理 I/O 与定时器
+                await asyncio.sleep(0)
+        finally:
+            self.stopped = time.perf_counter()
+            self.loop = None
+
+    def run_slice(self, task):
+        now = time.perf_counter()
+        wait = now - task.ready_since
+        task.ready_time += wait
+        task.max_ready_wait = max(task.max_ready_wait, wait)
+        if task.run_slice(self.quantum):
+            task.ended = time.perf_counter()
+            task.set_finished()
+        elif task.future is not None:
+            task.parked_since = time.perf_counter()
+            self.parked.add(task)
+            task.future.add_done_callback(lambda _: self._unpark(task))
+        else:
+            task.ready_since = time.perf_counter()
+            self.ready.append(task)
+
+    def _unpark(self, task):
+        now = time.perf_counter()
+        task.parked_time += now - task.parked_since
+        task.resume_from_future()
+        self.parked.discard(task)
+        task.ready_since = now
+        self.ready.append(task)
+        self._wakeup.set()
+
+    def metrics(self):
+        """调度统计：每个任务的时间片数、指令数、运行与等待时间，以及总体吞吐量与公平性
+           公平性为各任务就绪期间获得运行时间的比例 cpu / (cpu + 就绪等待) 的 Jain 指数，
+           1 表示完全公平
+        """
+        tasks = []
+        shares = []
+        for task in self.tasks:
+            busy = task.cpu_time + task.ready_time
+            share = task.cpu_time / busy if busy else 1.0
+            shares.append(share)
+            tasks.append({
+                'name': task.name,
+                'done': task.done,
+                'error': None if task.exception is None else
+                         '%s: %s' % (type(task.exception).__name__,
+                                     task.exception),
+                'slices': task.slices,
+                'instructions': task.instructions,
+                'waits': task.waits,
+                'cpu_time': task.cpu_time,
+                'ready_time': task.ready_time,
+                'max_ready_wait': task.max_ready_wait,
+                'parked_time': task.parked_time,
+                'latency': None if task.ended is None else
+                           task.ended - task.created,
+                'share': share,
+            })
+        elapsed = None
+        if self.started is not None:
+            elapsed = (self.stopped or time.perf_counter()) - self.started
+        instructions = sum(task.instructions for task in self.tasks)
+        finished = sum(task.done for task in self.tasks)
+        fairness = None
+        if shares:
+            fairness = sum(shares) ** 2 / (len(shares) *
+                                           sum(x * x for x in shares) or 1)
+        return {
+            'tasks': tasks,
+            'elapsed': elapsed,
+            'instructions': instructions,
+            'finished': finished,
+            'instructions_per_sec': instructions / elapsed if elapsed else None,
+            'tasks_per_sec': finished / elapsed if elapsed else None,
+            'fairness': fairness,
+        }
@@ -0,0 +1,1315 @@
+"""byterun 的测试，需要以 Python 3.6 或 3.7 运行：
+
+    python3.7 -m unittest test_byterun
+
+虚拟机按 Python 3.6/3.7 的字节码实现，在其他版本的解释器上运行时报错，而不是跳过全部用例
+"""
+import asyncio
+import io
+import json
+import os
+import pstats
+import sys
+import tempfile
+import textwrap
+import time
+import tracemalloc
+import unittest
+
+from benchmarks import gate
+from benchmarks.programs import Benchmark
+from byterun import byterun
+from byterun.batch import Job, main as batch_main, run_batch
+from byterun.green import Scheduler
+from byterun.byterun import (
+    OPMAP, CodeCache, DecodedCode, ResourceLimitExceeded,
+    SamplingProfiler, VirtualMachine, VirtualMachineError, code_cache,
+    decode_code, peephole_optimize,
+)
+
+
+def run_source(source, vm=None, **names):
+    """在虚拟机中运行源代码，返回 (模块命名空间, 标准输出)
+       `names` 为额外放入模块命名空间的对象
+    """
+    code_obj = compile(textwrap.dedent(source), "<test>", "exec")
+    vm = vm or VirtualMachine()
+    f_globals = {
+        '__builtins__': __builtins__,
+        '__name__': '__main__',
+        '__doc__': None,
+        '__package__': None,
+    }
+    f_globals.update(names)
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        vm.run_code(code_obj, f_globals=f_globals)
+        output = sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+    return f_globals, output
+
+
+def setUpModule():
+    if not (3, 6) <= sys.version_info[:2] < (3, 8):
+        raise RuntimeError("byterun runs Python 3.6/3.7 bytecode, "
+                           "run the tests with Python 3.6 or 3.7 (got %d.%d)"
+                           % sys.version_info[:2])
+
+
+class ByterunTestCase(unittest.TestCase):
+    # 构造虚拟机的参数，子类可用不同的优化选项重跑全部用例
+    vm_options = {}
+
+    def run_source(self, source, vm=None, **names):
+        return run_source(source, vm or VirtualMachine(**self.vm_options),
+                          **names)
+
+    def test_print(self):
+        _, output = self.run_source("print(1+2)")
+        self.assertEqual(output, '3\n')
+
+    def test_recursive_function(self):
+        ns, _ = self.run_source("""\
+            def fib(n):
+                if n < 2:
+                    return n
+                return fib(n - 1) + fib(n - 2)
+            result = fib(10)
+        """)
+        self.assertEqual(ns['result'], 55)
+
+    def test_calls_do_not_recurse_in_host(self):
+        ns, _ = self.run_source("""\
+            def depth(n):
+                if n == 0:
+                    return 0
+                return depth(n - 1) + 1
+            deep = depth(%d)
+            def double(x):
+                return x * 2
+            doubled = list(map(double, [1, 2, 3]))
+            def fail(n):
+                if n == 0:
+                    return undefined_name
+                return fail(n - 1)
+        """ % (sys.getrecursionlimit() * 3))
+        self.assertEqual(ns['deep'], sys.getrecursionlimit() * 3)
+        self.assertEqual(ns['doubled'], [2, 4, 6])
+        with self.assertRaises(NameError):
+            ns['fail'](5)
+
+    def test_argument_binding(self):
+        source = """\
+            def f(a, b=2, *args, c, d=4, **kwargs):
+                return (a, b, args, c, d, kwargs)
+            def g(x, y=1):
+                return x - y
+            results = [
+                f(1, c=3),
+                f(1, 2, 3, 4, c=5, e=6),
+                f(*[1], **{'c': 3, 'd': 5}),
+                g(5), g(5, 2), g(y=3, x=4),
+                [n * n for n in range(3)],
+            ]
+        """
+        ns, _ = self.run_source(source)
+        native = {}
+        exec(textwrap.dedent(source), native)
+        self.assertEqual(ns['results'], native['results'])
+        for args, kwargs in [((), {}), ((1, 2, 3), {}), ((1,), {'x': 1}),
+                             ((1,), {'z': 1})]:
+            with self.assertRaises(TypeError) as vm_error:
+                ns['g'](*args, **kwargs)
+            with self.assertRaises(TypeError) as native_error:
+                native['g'](*args, **kwargs)
+            self.assertEqual(str(vm_error.exception),
+                             str(native_error.exception))
+
+    def test_global_inline_caches_are_invalidated(self):
+        ns, _ = self.run_source("""\
+            def get():
+                return len, scale
+            scale = 1
+            seen = []
+            for i in range(3):
+                seen.append(get())
+                if i == 0:
+                    len = 'shadowed'
+                    scale = 2
+                elif i == 1:
+                    del len
+        """)
+        self.assertEqual(ns['seen'], [(len, 1), ('shadowed', 2), (len, 2)])
+
+    def test_namespace_writes_invalidate_caches(self):
+        source = """\
+            import os
+            sep = 'mine'
+            def get_sep():
+                return sep
+            def get():
+                return x
+            namespace = globals()
+            x = 1
+            seen = [get_sep(), get()]
+            from os import *
+            namespace['x'] = 2
+            seen += [get_sep(), get()]
+            del namespace['x']
+            try:
+                get()
+            except NameError:
+                seen.append('deleted')
+        """
+        ns, _ = self.run_source(source)
+        native = {}
+        exec(textwrap.dedent(source), native)
+        self.assertEqual(ns['seen'], native['seen'])
+        self.assertEqual(ns['seen'], ['mine', 1, os.sep, 2, 'deleted'])
+
+    def test_host_writes_invalidate_caches(self):
+        source = """\
+            import builtins
+            def get():
+                return x
+            def get_abs():
+                return byterun_test_abs
+            seen = []
+            x = 1
+            seen.append(get())
+            globals().update(x=2)
+            seen.append(get())
+            exec("x = 3", globals())
+            seen.append(get())
+            host_store(globals(), 'x', 4)
+            seen.append(get())
+            globals().pop('x')
+            try:
+                get()
+            except NameError:
+                seen.append('popped')
+            builtins.byterun_test_abs = 1
+            seen.append(get_abs())
+            builtins.byterun_test_abs = 2
+            seen.append(get_abs())
+            del builtins.byterun_test_abs
+            try:
+                get_abs()
+            except NameError:
+                seen.append('deleted')
+        """
+        def host_store(namespace, name, value):
+            namespace[name] = value
+        ns, _ = self.run_source(source, host_store=host_store)
+        native = {'host_store': host_store}
+        exec(textwrap.dedent(source), native)
+        self.assertEqual(ns['seen'], native['seen'])
+        self.assertEqual(ns['seen'], [1, 2, 3, 4, 'popped', 1, 2, 'deleted'])
+
+    def test_compare_ops(self):
+        source = """\
+            def count(n, s):
+                t = 0
+                for i in range(n):
+                    if i is not None and i <= 15 and i in s:
+                        t = t + 1
+                return t
+            result = [count(20, [1, 3, 5, 7])]
+            result += [op(a, b) for a in (1, 2.0, None) for b in (2, None)
+                       for op in (lambda a, b: a == b, lambda a, b: a != b,
+                                  lambda a, b: a is b, lambda a, b: a is not b)]
+            result += [1 < 2, 2 <= 2, 'b' > 'a', 'a' >= 'b', 3 not in {1, 2}]
+            result += [sorted({n, n + 1, 2}) for n in range(3)]
+        """
+        ns, _ = self.run_source(source)
+        native = {}
+        exec(textwrap.dedent(source), native)
+        self.assertEqual(ns['result'], native['result'])
+        self.assertEqual(ns['result'][0], 4)
+
+    def test_fast_locals(self):
+        ns, _ = self.run_source("""\
+            def f(a, b):
+                c = a * b
+                d = locals()
+                del c
+                return d
+            result = f(2, 3)
+            def g():
+                x = x
+            try_g = g
+        """)
+        self.assertEqual(ns['result'], {'a': 2, 'b': 3, 'c': 6})
+        with self.assertRaises(UnboundLocalError):
+            ns['try_g']()
+
+    def test_preallocated_stack(self):
+        frames = []
+        class RecordingVM(VirtualMachine):
+            def push_frame(self, frame):
+                frames.append(frame)
+                super(RecordingVM, self).push_frame(frame)
+        ns, _ = self.run_source("""\
+            def add3(a, b, c):
+                return a + b + c
+            n = 3
+            squares = [0, 1, n - 1 + 2, n * n]
+            total = add3(1, 2, 3)
+        """, RecordingVM())
+        self.assertEqual(ns['squares'], [0, 1, 4, 9])
+        self.assertEqual(ns['total'], 6)
+        for frame in frames:
+            self.assertEqual(len(frame.stack), frame.f_code.co_stacksize)
+            self.assertEqual(frame.stack, [None] * len(frame.stack))
+
+    def test_frames_are_compact(self):
+        vm = VirtualMachine(**self.vm_options)
+        code = compile("for i in range(2):\n    pass\n", "<test>", "exec")
+        frame = vm.make_frame(code)
+        self.assertFalse(hasattr(frame, '__dict__'))
+        self.assertIs(frame.decoded, vm.code_cache.get(code))
+        self.assertEqual(frame.block_stack, ())
+        vm.push_frame(frame)
+        vm.push_block('loop', 7)
+        self.assertEqual(frame.block_stack, (('loop', 7, 0),))
+        self.assertEqual(vm.pop_block(), ('loop', 7, 0))
+        self.assertEqual(frame.block_stack, ())
+        vm.pop_frame()
+
+    def test_frames_are_reused(self):
+        source = """\
+            def fib(n):
+                if n < 2:
+                    return n
+                return fib(n - 1) + fib(n - 2)
+            def closure(x):
+                def inner():
+                    return x
+                return inner
+            def square(x):
+                return x * x
+            def shared():
+                keep(current_frame())
+                return 1
+            def shared_from_host(x):
+                keep(current_frame())
+                return x
+            def counter():
+                yield 1
+            def make():
+                return counter()
+            def raises():
+                return {}['missing']
+            def catches():
+                try:
+                    raises()
+                except KeyError as e:
+                    errors.append(e)
+                return 1
+            result = fib(10)
+            values = [get() for get in [closure(i) for i in range(3)]]
+            squares = list(map(square, [1, 2, 3]))
+            calls = [shared(), shared(), catches(), catches()]
+            calls += list(map(shared_from_host, [1, 2]))
+            counts = [next(gen) for gen in [make(), make()]]
+        """
+        vm = VirtualMachine(**self.vm_options)
+        frames = []
+        errors = []
+        ns, _ = self.run_source(source, vm, keep=frames.append, errors=errors,
+                                current_frame=vm.current_frame)
+        self.assertEqual(ns['result'], 55)
+        self.assertEqual(ns['values'], [0, 1, 2])
+        self.assertEqual(ns['squares'], [1, 4, 9])
+        self.assertEqual(ns['counts'], [1, 1])
+        pooled = {code.co_name: pool
+                  for code, pool in vm.frame_pool.items() if pool}
+        self.assertLessEqual(len(pooled['fib']), vm.frame_pool_size)
+        for frame in pooled['fib']:
+            self.assertIsNone(frame.f_back)
+            self.assertEqual(frame.sp, 0)
+        # 虚拟机内的调用（run_frames）与宿主代码的回调（Function.__call__）都复用帧
+        self.assertIn('closure', pooled)
+        self.assertIn('inner', pooled)
+        self.assertIn('square', pooled)
+        # 处理过异常后正常返回的帧照常复用，以异常结束的帧不回收
+        self.assertIn('catches', pooled)
+        self.assertNotIn('raises', pooled)
+        # 逃逸的帧不复用：经 current_frame 交给宿主代码的帧（虚拟机内调用与宿主回调）
+        # 以及生成器帧的 f_back
+        for name in ['shared', 'shared_from_host', 'make', 'counter']:
+            self.assertNotIn(name, pooled)
+        self.assertEqual([frame.f_code.co_name for frame in frames],
+                         ['shared'] * 2 + ['shared_from_host'] * 2)
+        self.assertEqual(len(set(map(id, frames))), 4)
+        for frame in frames:
+            self.assertIsNotNone(frame.f_globals)
+        self.assertEqual(len(errors), 2)
+
+        vm = VirtualMachine(frame_pool=0, **self.vm_options)
+        ns, _ = self.run_source(source, vm, keep=lambda frame: None,
+                                errors=[], current_frame=vm.current_frame)
+        self.assertEqual(ns['result'], 55)
+        self.assertEqual(vm.frame_pool, {})
+
+    def test_unary_and_binary_operators(self):
+        ns, _ = self.run_source("""\
+            a = -(3 ** 2) % 7
+            b = not a
+            c = ~a << 2
+        """)
+        self.assertEqual((ns['a'], ns['b'], ns['c']), (5, False, -24))
+
+    def test_subscript_and_slice(self):
+        ns, _ = self.run_source("""\
+            d = {}
+            d['a'] = 1
+            d['b'] = d['a'] + 1
+            del d['a']
+            items = list(range(10))
+            parts = items[2:5], items[::3], items[:-8]
+        """)
+        self.assertEqual(ns['d'], {'b': 2})
+        self.assertEqual(ns['parts'], ([2, 3, 4], [0, 3, 6, 9], [0, 1]))
+
+    def test_generators(self):
+        source = """\
+            def reverse(data):
+                for index in range(len(data)-1, -1, -1):
+                    yield data[index]
+
+            def func2():
+                print("func2")
+                yield 'a'
+                yield 'b'
+                return 'done'
+
+            def delegate():
+                result = yield from func2()
+                received = yield result
+                yield received * 2
+
+            def echo():
+                value = None
+                while True:
+                    try_value = yield value
+                    value = try_value
+
+            chars = [c for c in reverse('abc')]
+            f2 = func2()
+            print("=====")
+            lazy = list(f2)
+            gen = delegate()
+            delegated = [next(gen), next(gen), next(gen), gen.send(21)]
+            squares = sum(x * x for x in range(10))
+            e = echo()
+            next(e)
+            echoed = [e.send(1), e.send('x')]
+            e.close()
+        """
+        ns = self.assertSameAsNative(
+            source, ['chars', 'lazy', 'delegated', 'squares', 'echoed'])
+        self.assertIsNone(ns['e'].gi_frame)
+
+    def test_generator_throw(self):
+        ns, _ = self.run_source("""\
+            def inner():
+                yield 1
+                yield 2
+            def outer():
+                yield from inner()
+            def bad():
+                yield 1
+                raise StopIteration
+        """)
+        gen = ns['outer']()
+        self.assertEqual(next(gen), 1)
+        with self.assertRaises(KeyError):
+            gen.throw(KeyError('k'))
+        with self.assertRaises(StopIteration):
+            next(gen)
+        gen = ns['bad']()
+        next(gen)
+        with self.assertRaises(RuntimeError):
+            next(gen)
+        gen = ns['inner']()
+        with self.assertRaises(TypeError):
+            gen.send(1)
+
+    def test_generators_stream_in_constant_memory(self):
+        source = """\
+            def numbers(n):
+                i = 0
+                while i < n:
+                    yield i
+                    i += 1
+            def squares(it):
+                for x in it:
+                    yield x * x
+            def chain(it):
+                yield from it
+            total = sum(y for y in chain(squares(numbers(N))))
+        """
+        peaks = []
+        for n in [500, 5000]:
+            tracemalloc.start()
+            try:
+                ns, _ = self.run_source(source, N=n)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+            self.assertEqual(ns['total'], sum(x * x for x in range(n)))
+        self.assertLess(peaks[1], peaks[0] * 2)
+
+    def test_iterator_classes(self):
+        ns, output = self.run_source("""\
+            class Reverse:
+                \"\"\"Iterator for looping over a sequence backwards.\"\"\"
+                def __init__(self, data):
+                    self._data = data
+                    self._index = len(data)
+
+                def __iter__(self):
+                    return self
+
+                def __next__(self):
+                    if self._index == 0:
+                        raise StopIteration
+                    self._index -= 1
+                    return self._data[self._index]
+
+            for char in Reverse('abc'):
+                print(char)
+        """)
+        self.assertEqual(output, 'c\nb\na\n')
+        self.assertEqual(ns['Reverse'].__doc__,
+                         'Iterator for looping over a sequence backwards.')
+
+    def assertSameAsNative(self, source, names=()):
+        """在虚拟机与原生解释器中分别运行，比较标准输出与指定的全局变量"""
+        ns, output = self.run_source(source)
+        native = {}
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            exec(textwrap.dedent(source), native)
+            native_output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(output, native_output)
+        for name in names:
+            self.assertEqual(ns[name], native[name])
+        return ns
+
+    def test_closures(self):
+        ns = self.assertSameAsNative("""\
+            def outer_func():
+                lis = []
+                def inner_func(val):
+                    lis.append(val)
+                    return list(lis)
+                return inner_func
+            fn = outer_func()
+            appended = [fn('a'), fn('b')]
+
+            def traps():
+                flis = []
+                for i in range(3):
+                    def inner_func():
+                        return i * i
+                    flis.append(inner_func)
+                return [f() for f in flis]
+
+            def counter(start):
+                count = start
+                def bump(step=1):
+                    nonlocal count
+                    count += step
+                    return count
+                return bump
+            bump = counter(10)
+            counts = [bump(), bump(5)]
+
+            foo = lambda x: lambda: x
+            gen = (lambda: x ** 2 for x in range(3))
+            lst = [lambda: x ** 2 for x in range(3)]
+            lambdas = [foo(3)(), [f() for f in gen], [f() for f in lst]]
+
+            class Base:
+                def name(self):
+                    return 'base'
+            class Child(Base):
+                def name(self):
+                    return 'child of ' + super().name()
+            names = Child().name()
+
+            def unbound():
+                def inner():
+                    return value
+                value = 1
+                del value
+                return inner
+            print(appended, traps(), counts, lambdas, names)
+        """, ['appended', 'counts', 'lambdas', 'names'])
+        self.assertEqual(len(ns['fn'].__closure__), 1)
+        self.assertIsNone(ns['traps'].__closure__)
+        with self.assertRaises(NameError):
+            ns['unbound']()()
+
+    def test_unpacking(self):
+        self.assertSameAsNative("""\
+            a, b = 1, 2
+            (c, d), e = [(3, 4), 5]
+            first, *middle, last = range(6)
+            *init, tail = 'xyz'
+            result = [a, b, c, d, e, first, middle, last, init, tail]
+        """, ['result'])
+        for source in ["a, b = 1, 2, 3", "a, b, c = 1, 2", "a, *b, c = [1]"]:
+            with self.assertRaises(ValueError) as vm_error:
+                self.run_source(source)
+            with self.assertRaises(ValueError) as native_error:
+                exec(source, {})
+            self.assertEqual(str(vm_error.exception.args[0]),
+                             str(native_error.exception))
+
+    def test_imports(self):
+        self.assertSameAsNative("""\
+            import time
+            from functools import reduce
+            from os.path import *
+            time_module = time.__name__
+            total = reduce(lambda x, y: x + y, list(range(6)))
+            joined = join('a', 'b')
+        """, ['time_module', 'total', 'joined'])
+
+    def test_exceptions(self):
+        self.assertSameAsNative("""\
+            log = []
+            def parse(values):
+                good = bad = 0
+                for value in values:
+                    try:
+                        if value % 3 == 0:
+                            raise ValueError(value)
+                        good = good + {}[value] if value % 3 == 1 else good + 1
+                    except KeyError:
+                        bad = bad + 1
+                    except ValueError as e:
+                        bad = bad + e.args[0] % 2
+                    else:
+                        log.append('else')
+                    finally:
+                        good = good + 0
+                return good, bad
+
+            def nested(x):
+                try:
+                    try:
+                        return 1 / x
+                    except ZeroDivisionError:
+                        log.append('zero')
+                        raise
+                    finally:
+                        log.append('inner finally')
+                except ArithmeticError as e:
+                    return type(e).__name__
+
+            def loop_control():
+                out = []
+                for i in range(6):
+                    try:
+                        if i == 1:
+                            continue
+                        if i == 4:
+                            break
+                        out.append(i)
+                    finally:
+                        out.append('f%d' % i)
+                while True:
+                    try:
+                        out.append([1, 2][5])
+                    except IndexError:
+                        break
+                return out
+
+            def context():
+                try:
+                    try:
+                        raise KeyError('a')
+                    except KeyError:
+                        raise ValueError('b')
+                except ValueError as e:
+                    return repr(e.__context__)
+
+            def gen():
+                try:
+                    yield 1
+                    yield 2
+                except GeneratorExit:
+                    log.append('closed')
+                    raise
+                finally:
+                    log.append('gen finally')
+
+            g = gen()
+            next(g)
+            g.close()
+            result = [parse(range(10)), nested(0), nested(2), loop_control(),
+                      context(), log]
+        """, ['result'])
+
+    def test_original_exception_is_raised(self):
+        error = KeyError('missing')
+        with self.assertRaises(KeyError) as cm:
+            self.run_source("""\
+                def f():
+                    try:
+                        raise error
+                    finally:
+                        pass
+                f()
+            """, error=error)
+        self.assertIs(cm.exception, error)
+        with self.assertRaises(RuntimeError):
+            self.run_source("raise")
+
+    def test_disk_cache(self):
+        source = textwrap.dedent("""\
+            def f(n):
+                try:
+                    return [i * 2 for i in range(n)]
+                except ValueError:
+                    return None
+            result = f(3)
+        """)
+        with tempfile.TemporaryDirectory() as directory:
+            results = []
+            for expected_hits in [0, 1]:
+                vm = VirtualMachine(cache_dir=directory, **self.vm_options)
+                vm.code_cache.clear()
+                code = vm.compile_source(source, '<cached>')
+                self.assertEqual(vm.disk_cache.hits, expected_hits)
+                # 恢复的指令流与重新解码、优化的指令流相同
+                fresh = CodeCache(passes=vm.code_cache.passes)
+                for nested in [code] + [c for c in code.co_consts
+                                        if isinstance(c, type(code))]:
+                    self.assertEqual(vm.code_cache.get(nested).get_state(),
+                                     fresh.get(nested).get_state())
+                ns = {'__builtins__': __builtins__}
+                vm.run_code(code, f_globals=ns)
+                results.append(ns['result'])
+            self.assertEqual(results, [[0, 2, 4]] * 2)
+
+            # 损坏的缓存文件按未命中处理
+            for name in os.listdir(directory):
+                with open(os.path.join(directory, name), 'wb') as f:
+                    f.write(b'sBVM garbage')
+            vm = VirtualMachine(cache_dir=directory, **self.vm_options)
+            vm.compile_source(source, '<cached>')
+            self.assertEqual((vm.disk_cache.hits, vm.disk_cache.misses), (0, 1))
+
+    def test_profiling(self):
+        vm = VirtualMachine(**self.vm_options)
+        profiler = vm.enable_profiling()
+        ns, _ = self.run_source("""\
+            def fib(n):
+                if n < 2:
+                    return n
+                return fib(n - 1) + fib(n - 2)
+            result = fib(6)
+        """, vm)
+        self.assertIs(vm.disable_profiling(), profiler)
+        self.assertEqual(vm.execute, getattr(vm, 'execute_' + vm.engine))
+        self.assertEqual(ns['result'], 8)
+        fib = ns['fib'].func_code
+        self.assertEqual(profiler.calls[fib], 25)
+        self.assertEqual(profiler.opcodes['RETURN_VALUE'][0], 26)
+        self.assertEqual(sum(count for count, _ in profiler.opcodes.values()),
+                         sum(count for count, _ in profiler.codes.values()))
+        self.assertIn(('<test>', 2), profiler.lines)
+        data = json.loads(profiler.to_json())
+        self.assertEqual(set(data), {'opcodes', 'codes', 'lines'})
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        self.assertEqual(stats.stats[('<test>', 1, 'fib')][:2], (25, 25))
+
+    def test_hybrid_hot_functions_run_natively(self):
+        vm = VirtualMachine(hybrid=True, hot_threshold=5, **self.vm_options)
+        profiler = vm.enable_profiling()
+        ns, _ = self.run_source("""\
+            def square(x):
+                return x * x
+            result = [square(i) for i in range(8)]
+            result.extend(map(square, [8, 9]))
+        """, vm)
+        vm.disable_profiling()
+        self.assertEqual(ns['result'], [i * i for i in range(10)])
+        square = ns['square'].func_code
+        # 前 5 次在虚拟机中运行，此后（包括宿主代码中的调用）交给宿主解释器
+        self.assertEqual(vm.native_calls[square][0], 5)
+        self.assertEqual(profiler.calls[square], 10)
+        self.assertEqual(profiler.opcodes['NATIVE_CALL'][0], 5)
+        self.assertEqual(profiler.opcodes['RETURN_VALUE'][0], 5 + 1 + 1)
+        # 不写入命名空间的函数原生运行后，内联缓存保持有效
+        version = byterun._namespace_version
+        self.assertEqual(ns['square'](3), 9)
+        self.assertEqual(vm.native_calls[square][0], 6)
+        self.assertEqual(byterun._namespace_version, version)
+
+    def test_hybrid_native_stores_invalidate_caches(self):
+        vm = VirtualMachine(hybrid=True, hot_threshold=4, **self.vm_options)
+        ns, _ = self.run_source("""\
+            counter = 0
+            def bump():
+                global counter
+                counter += 1
+            def main():
+                seen = []
+                for i in range(5):
+                    for j in range(3):
+                        bump()
+                    seen.append(counter)
+                return seen
+            result = main()
+        """, vm)
+        self.assertEqual(ns['result'], [3, 6, 9, 12, 15])
+        self.assertEqual(vm.native_calls[ns['bump'].func_code][0], 11)
+
+    def test_hybrid_respects_run_limits(self):
+        vm = VirtualMachine(hybrid=True, hot_threshold=0, **self.vm_options)
+        code = compile(textwrap.dedent("""\
+            import contextlib
+            def spin():
+                while True:
+                    pass
+            def managed():
+                with contextlib.suppress(KeyError):
+                    pass
+            result = [abs(i) for i in range(3)]
+        """), "<test>", "exec")
+        f_globals = {'__builtins__': __builtins__}
+        # 设置了限制时不以原生方式运行：热点函数与含有未实现指令的函数都留在虚拟机中
+        vm.run_code(code, f_globals=f_globals, max_instructions=10 ** 6)
+        with self.assertRaises(ResourceLimitExceeded):
+            vm.run_code(compile("spin()", "<test>", "exec"),
+                        f_globals=f_globals, max_instructions=10 ** 4)
+        with self.assertRaises(VirtualMachineError):
+            vm.run_code(compile("managed()", "<test>", "exec"),
+                        f_globals=f_globals, timeout=10)
+        self.assertEqual(vm.native_calls, {})
+        # 解除限制后照常以原生方式运行
+        vm.run_code(compile("managed()", "<test>", "exec"), f_globals=f_globals)
+        self.assertEqual(list(vm.native_calls), [f_globals['managed'].func_code])
+
+    def test_hybrid_unsupported_opcodes_run_natively(self):
+        source = """\
+            import contextlib
+            def managed():
+                with contextlib.suppress(KeyError):
+                    return {}['missing']
+                return 'suppressed'
+            result = managed()
+        """
+        with self.assertRaises(VirtualMachineError):
+            self.run_source(source)
+        vm = VirtualMachine(hybrid=True, hot_threshold=None, **self.vm_options)
+        ns, _ = self.run_source(source, vm)
+        self.assertEqual(ns['result'], 'suppressed')
+        self.assertEqual(vm.native_calls[ns['managed'].func_code][0], 1)
+
+    def test_run_limits(self):
+        vm = VirtualMachine(**self.vm_options)
+        table = vm.dispatch_table
+        runaway = """\
+            def spin():
+                while True:
+                    try:
+                        pass
+                    except Exception:
+                        pass
+            try:
+                spin()
+            except Exception:
+                caught = True
+            while True:
+                pass
+        """
+        for limits, limit in [({'max_instructions': 10000}, 'instructions'),
+                              ({'timeout': 0.05}, 'deadline')]:
+            ns = {'__builtins__': __builtins__}
+            with self.assertRaises(ResourceLimitExceeded) as cm:
+                vm.run_code(compile(textwrap.dedent(runaway), '<test>', 'exec'),
+                            f_globals=ns, **limits)
+            self.assertEqual(cm.exception.limit, limit)
+            # 程序可以捕获，但超出限制后每次检查都会再次抛出
+            self.assertTrue(ns['caught'])
+            self.assertEqual(vm.frames, [])
+            self.assertIs(vm.dispatch_table, table)
+
+        source = """\
+            def depth(n):
+                if n == 0:
+                    return 0
+                return depth(n - 1) + 1
+            result = depth(N)
+        """
+        code = compile(textwrap.dedent(source), '<test>', 'exec')
+        ns = {'__builtins__': __builtins__, 'N': 48}
+        vm.run_code(code, f_globals=ns, max_depth=50, max_instructions=10000)
+        self.assertEqual(ns['result'], 48)
+        ns['N'] = 49
+        with self.assertRaises(ResourceLimitExceeded) as cm:
+            vm.run_code(code, f_globals=ns, max_depth=50)
+        self.assertEqual(cm.exception.limit, 'depth')
+        self.assertIsInstance(cm.exception, VirtualMachineError)
+        self.assertIsNone(vm.max_depth)
+
+        # 宿主代码（map、any 等）回调的虚拟机函数同样受限制
+        callbacks = """\
+            import itertools
+            def never(x):
+                return False
+            def nest(n):
+                return list(map(nest, [n + 1]))
+            if NEST:
+                nest(0)
+            any(map(never, itertools.count()))
+        """
+        code = compile(textwrap.dedent(callbacks), '<test>', 'exec')
+        for nest, limits, limit in [
+                (False, {'max_instructions': 10000}, 'instructions'),
+                (False, {'timeout': 0.05}, 'deadline'),
+                (True, {'max_depth': 50}, 'depth')]:
+            ns = {'__builtins__': __builtins__, 'NEST': nest}
+            with self.assertRaises(ResourceLimitExceeded) as cm:
+                vm.run_code(code, f_globals=ns, **limits)
+            self.assertEqual(cm.exception.limit, limit)
+            self.assertEqual(vm.frames, [])
+
+    def test_sampling_by_instruction_count(self):
+        vm = VirtualMachine(**self.vm_options)
+        source = """\
+            def fib(n):
+                if n < 2:
+                    return n
+                return fib(n - 1) + fib(n - 2)
+            result = fib(6)
+        """
+        with SamplingProfiler(vm, instructions=1) as sampler:
+            ns, _ = self.run_source(source, vm)
+        self.assertEqual(ns['result'], 8)
+        self.assertEqual(vm.execute, getattr(vm, 'execute_' + vm.engine))
+        profiler = vm.enable_profiling()
+        self.run_source(source, vm)
+        executed = sum(count for count, _ in profiler.opcodes.values())
+        self.assertEqual(sampler.samples, executed)
+        folded = sampler.folded()
+        self.assertIn('<module> (<test>:5);fib (<test>:4);fib (<test>:2) ',
+                      folded)
+        self.assertEqual(sum(int(line.rsplit(' ', 1)[1])
+                             for line in folded.splitlines()), executed)
+
+    def test_sampling_by_timer(self):
+        vm = VirtualMachine(**self.vm_options)
+        sampler = SamplingProfiler(vm, interval=0.001)
+        def wait_for_sample():
+            deadline = time.time() + 5
+            while not sampler.samples and time.time() < deadline:
+                time.sleep(0.001)
+        with sampler:
+            self.run_source("""\
+                def outer():
+                    return wait_for_sample()
+                outer()
+            """, vm, wait_for_sample=wait_for_sample)
+        self.assertGreater(sampler.samples, 0)
+        self.assertIsNone(sampler._thread)
+        stack = next(iter(sampler.stacks))
+        self.assertEqual([name for name, _, _ in stack], ['<module>', 'outer'])
+
+    def test_dispatch_table_is_built_once_per_class(self):
+        class SubVM(VirtualMachine):
+            pass
+        self.assertIs(VirtualMachine().dispatch_table,
+                      VirtualMachine().dispatch_table)
+        self.assertIsNot(SubVM().dispatch_table,
+                         VirtualMachine().dispatch_table)
+
+    def test_decoded_code_is_shared(self):
+        code_obj = compile("def f(n):\n    return n + 1\n", "<test>", "exec")
+        f_code = code_obj.co_consts[0]
+        decoded = decode_code(f_code)
+        self.assertIs(decode_code(f_code), decoded)
+        # 跳转参数已换算为指令下标
+        loop = compile("for i in x:\n    pass\n", "<test>", "exec")
+        for opcode, opname, arguments in decode_code(loop).instructions:
+            if opname == 'FOR_ITER':
+                self.assertEqual(arguments, (6,))
+
+    def test_code_cache_is_bounded(self):
+        maxsize = code_cache.maxsize
+        code_cache.maxsize = 2
+        try:
+            for i in range(5):
+                decode_code(compile("x = %d" % i, "<test>", "exec"))
+            self.assertLessEqual(len(code_cache), 2)
+        finally:
+            code_cache.maxsize = maxsize
+
+
+class SuperinstructionTestCase(ByterunTestCase):
+    vm_options = {'superinstructions': True}
+
+    def test_superinstructions_are_fused(self):
+        vm = VirtualMachine(superinstructions=True)
+        ns, _ = self.run_source("""\
+            def f(n, step):
+                total = 0
+                for i in range(n):
+                    if i > step:
+                        total = total + i * 2
+                    elif i == 0:
+                        continue
+                    total = total - step
+                return total
+            result = f(10, 3)
+        """, vm)
+        self.assertEqual(ns['result'], 51)
+        decoded = vm.code_cache.get(ns['f'].func_code)
+        names = [name for _, name, _ in decoded.instructions]
+        for name in ['FOR_ITER__STORE_FAST', 'LOAD_FAST__LOAD_FAST',
+                     'COMPARE_OP__POP_JUMP_IF_FALSE', 'LOAD_CONST__BINARY_MULTIPLY']:
+            self.assertIn(name, names)
+        self.assertEqual(len(decoded.instructions) + decoded.fused,
+                         len(decode_code(ns['f'].func_code).instructions))
+        self.assertGreaterEqual(vm.code_cache.stats()['fused'], decoded.fused)
+
+
+class ThreadedEngineTestCase(ByterunTestCase):
+    vm_options = {'engine': 'threaded'}
+
+    def test_code_is_translated_once(self):
+        vm = VirtualMachine(engine='threaded')
+        ns, _ = self.run_source("""\
+            def f(n):
+                return n + 1
+            result = [f(i) for i in range(3)]
+        """, vm)
+        self.assertEqual(ns['result'], [1, 2, 3])
+        decoded = vm.code_cache.get(ns['f'].func_code)
+        ops = decoded.threaded_ops(vm.dispatch_table)
+        self.assertEqual(len(ops), len(decoded.instructions))
+        self.assertIs(decoded.threaded_ops(vm.dispatch_table), ops)
+
+    def test_overridden_handlers_are_used(self):
+        loaded = []
+        class TracingVM(VirtualMachine):
+            def byte_LOAD_CONST(self, const):
+                loaded.append(const)
+                super(TracingVM, self).byte_LOAD_CONST(const)
+        ns, _ = self.run_source("x = 'spam'\ny = x * 2",
+                                TracingVM(engine='threaded'))
+        self.assertEqual(ns['y'], 'spamspam')
+        self.assertIn('spam', loaded)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            VirtualMachine(engine='jit')
+
+
+class ThreadedSuperinstructionTestCase(ByterunTestCase):
+    vm_options = {'engine': 'threaded', 'superinstructions': True}
+
+
+class ExceptionTableTestCase(ByterunTestCase):
+    vm_options = {'exception_table': True}
+
+    def test_try_statements_use_table(self):
+        vm = VirtualMachine(**self.vm_options)
+        ns, _ = self.run_source("""\
+            def f(values):
+                total = 0
+                for value in values:
+                    try:
+                        try:
+                            total = total + 10 // value
+                        except ZeroDivisionError:
+                            total = total - 1
+                            raise
+                    except ArithmeticError:
+                        total = total * 2
+                return total
+            result = f([1, 0, 2])
+        """, vm)
+        self.assertEqual(ns['result'], 23)
+        decoded = vm.code_cache.get(ns['f'].func_code)
+        names = [name for _, name, _ in decoded.instructions]
+        self.assertNotIn('SETUP_EXCEPT', names)
+        self.assertEqual(len(decoded.handlers), 2)
+        # 内层 try 语句在前；处理代码入口处数据栈上只有 for 循环的迭代器
+        (start, end, handler, level), outer = decoded.handlers
+        self.assertEqual(start, outer[0])
+        self.assertLess(end, outer[1])
+        self.assertEqual(level, 1)
+        self.assertEqual(names[handler], 'DUP_TOP')
+
+
+class ExceptionTableThreadedTestCase(ByterunTestCase):
+    vm_options = {'engine': 'threaded', 'superinstructions': True,
+                  'exception_table': True}
+
+
+class PeepholeTestCase(ByterunTestCase):
+    vm_options = {'peephole': True}
+
+    def test_peephole_rewrites(self):
+        decoded = DecodedCode(compile("pass", "<test>", "exec"))
+        op = lambda name, *arguments: (OPMAP[name], name, arguments)
+        decoded.instructions = [
+            op('LOAD_CONST', 2),
+            op('LOAD_CONST', 3),
+            op('BINARY_MULTIPLY'),
+            op('UNARY_NEGATIVE'),
+            op('LOAD_CONST', None),
+            op('POP_TOP'),
+            op('LOAD_CONST', True),
+            op('POP_JUMP_IF_FALSE', 11),
+            op('JUMP_FORWARD', 10),
+            op('LOAD_CONST', 'dead'),
+            op('JUMP_ABSOLUTE', 12),
+            op('NOP'),
+            op('RETURN_VALUE'),
+        ]
+        decoded.lines = list(range(1, 14))
+        decoded.caches = [None] * 13
+        peephole_optimize(decoded)
+        self.assertEqual(decoded.instructions,
+                         [op('LOAD_CONST', -6), op('RETURN_VALUE')])
+        self.assertEqual(decoded.lines, [1, 13])
+
+    def test_membership_uses_frozenset(self):
+        vm = VirtualMachine(**self.vm_options)
+        source = """\
+            class W:
+                # 相等比较与哈希不一致：frozenset 查不到，按元组逐个比较才能找到
+                def __eq__(self, other):
+                    return other == 2
+                def __hash__(self):
+                    return 7
+            def check(x):
+                return x in (1, 2, 3), x not in ('a', 'b')
+            result = [check(v) for v in (1, 'a', [], 4.0, 2.0, W())]
+        """
+        ns, _ = self.run_source(source, vm)
+        native = {}
+        exec(textwrap.dedent(source), native)
+        self.assertEqual(ns['result'], native['result'])
+        decoded = vm.code_cache.get(ns['check'].func_code)
+        names = [name for _, name, _ in decoded.instructions]
+        self.assertIn('CONTAINS_FROZENSET', names)
+        self.assertIn('NOT_CONTAINS_FROZENSET', names)
+        stats = vm.code_cache.stats()
+        self.assertGreaterEqual(stats['original_instructions'],
+                                stats['instructions'])
+
+
+class PeepholeThreadedTestCase(PeepholeTestCase):
+    vm_options = {'engine': 'threaded', 'superinstructions': True,
+                  'exception_table': True, 'peephole': True}
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def test_results_and_errors(self):
+        jobs = [
+            Job('ok', "print('hi')\nresult = 6 * 7"),
+            Job('error', "def f():\n    return 1 / 0\nf()"),
+            compile("result = {'code': [1, 2]}", "<code>", "exec"),
+            Job('exit', "import sys\nprint('bye')\nsys.exit(3)"),
+            Job('exit0', "import sys\nresult = 1\nsys.exit()"),
+        ]
+        results = sorted(run_batch(iter(jobs), workers=2),
+                         key=lambda result: result.index)
+        self.assertEqual([r.name for r in results],
+                         ['ok', 'error', '<code>', 'exit', 'exit0'])
+        self.assertEqual([r.status for r in results],
+                         ['ok', 'error', 'ok', 'error', 'ok'])
+        self.assertEqual((results[0].result, results[0].stdout), (42, 'hi\n'))
+        self.assertEqual(results[1].error, 'ZeroDivisionError: division by zero')
+        self.assertIn('ZeroDivisionError', results[1].traceback)
+        self.assertEqual(results[2].result, {'code': [1, 2]})
+        # sys.exit() 只结束该程序：工作进程继续运行，输出保留
+        self.assertEqual((results[3].error, results[3].stdout),
+                         ('SystemExit: 3', 'bye\n'))
+        self.assertEqual(results[4].result, 1)
+        self.assertEqual(len(set(r.pid for r in results)), 2)
+
+    def test_timeout_and_recycling(self):
+        jobs = [Job('loop', "while True:\n    pass")]
+        jobs += [Job(str(i), "result = %d" % i) for i in range(4)]
+        results = list(run_batch(jobs, workers=2, timeout=0.5, max_jobs=1))
+        # 按完成顺序产出：死循环的程序超时后最后完成
+        self.assertEqual(results[-1].name, 'loop')
+        self.assertEqual(results[-1].status, 'timeout')
+        ok = results[:-1]
+        self.assertEqual(sorted(r.result for r in ok), [0, 1, 2, 3])
+        # 每个工作进程只运行一个程序
+        self.assertEqual(len(set(r.pid for r in ok)), 4)
+
+    def test_rejects_unknown_engine(self):
+        stderr = sys.stderr
+        sys.stderr = io.StringIO()
+        try:
+            with self.assertRaises(SystemExit) as exit:
+                batch_main(['--engine', 'jit', 'program.py'])
+            message = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(exit.exception.code, 2)
+        self.assertIn("invalid choice: 'jit'", message)
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def test_round_robin(self):
+        log = []
+        source = """\
+            for i in range(50):
+                log.append(tag)
+            result = len(log)
+        """
+        scheduler = Scheduler(quantum=20)
+        tasks = [scheduler.spawn(textwrap.dedent(source), log=log, tag=tag)
+                 for tag in 'ab']
+        scheduler.run()
+        self.assertEqual(sorted(log), ['a'] * 50 + ['b'] * 50)
+        # 时间片轮转：两个任务交替运行，而不是一个运行完再运行另一个
+        self.assertNotEqual(log, ['a'] * 50 + ['b'] * 50)
+        self.assertEqual(tasks[1].result, 100)
+        metrics = scheduler.metrics()
+        self.assertEqual(metrics['finished'], 2)
+        for task in metrics['tasks']:
+            self.assertGreater(task['slices'], 1)
+            self.assertEqual(task['instructions'], metrics['tasks'][0]['instructions'])
+        self.assertGreater(metrics['fairness'], 0.5)
+        self.assertLessEqual(metrics['fairness'], 1.0)
+
+    def test_wait(self):
+        async def fetch(x):
+            await asyncio.sleep(0.001)
+            return x * 10
+
+        async def fail():
+            raise KeyError('io')
+
+        source = textwrap.dedent("""\
+            a = wait(fetch(ID))
+            try:
+                wait(fail())
+            except KeyError as e:
+                b = (type(e), e.args)
+            sleep(0)
+            def g():
+                yield wait(fetch(1))
+            try:
+                list(g())
+            except Exception as e:
+                c = type(e).__name__
+            print(ID)
+            result = (a, b, c)
+        """)
+        scheduler = Scheduler(capture_output=True, engine='threaded')
+        tasks = [scheduler.spawn(source, ID=i, fetch=fetch, fail=fail)
+                 for i in range(5)]
+
+        async def main():
+            runner = asyncio.ensure_future(scheduler.run_async())
+            results = [await task for task in tasks]
+            await runner
+            return results
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(main())
+        finally:
+            loop.close()
+        self.assertEqual(results, [
+            (i * 10, (KeyError, ('io',)), 'VirtualMachineError')
+            for i in range(5)
+        ])
+        self.assertEqual([task.stdout.getvalue() for task in tasks],
+                         ['%d\n' % i for i in range(5)])
+        self.assertEqual([t['waits'] for t in scheduler.metrics()['tasks']],
+                         [4] * 5)
+
+    def test_task_exception(self):
+        scheduler = Scheduler()
+        task = scheduler.spawn("def f():\n    raise ValueError(1)\nf()")
+        scheduler.run()
+        self.assertTrue(task.done)
+        self.assertIsInstance(task.exception, ValueError)
+        self.assertEqual(scheduler.metrics()['tasks'][0]['error'],
+                         'ValueError: 1')
+
+class GateTestCase(unittest.TestCase):
+
+    def test_classify(self):
+        # 耗时中位数的置信区间整体超出阈值才判为回归或提升
+        self.assertEqual(gate.classify((1.2, 1.3), 1.0, 0.1), 'regression')
+        self.assertEqual(gate.classify((1.05, 1.3), 1.0, 0.1), 'ok')
+        self.assertEqual(gate.classify((0.7, 0.85), 1.0, 0.1), 'improvement')
+        self.assertEqual(gate.classify((0.7, 0.95), 1.0, 0.1), 'ok')
+        self.assertEqual(gate.classify((1.2, 1.3), 1.0, 0.5), 'ok')
+
+    def test_check(self):
+        bench = Benchmark('sum', "result = sum(range(N))\nprint(result)\n",
+                          100, None)
+        def check(baseline):
+            return gate.check(bench, baseline, repeat=3)
+        new = check(None)
+        self.assertEqual(new['status'], 'new')
+        self.assertEqual(len(new['times']), 3)
+        self.assertEqual(check({'median': 1e-9})['status'], 'regression')
+        self.assertEqual(check({'median': 1e3})['status'], 'improvement')
+        # 基线中单独给出的阈值优先
+        result = check({'median': 1e-9, 'threshold': 1e12})
+        self.assertEqual((result['status'], result['threshold']), ('ok', 1e12))
+        # 虚拟机与原生运行抛出同样的异常时照常比较耗时，结果不一致时判为语义不符
+        raises = Benchmark('raises', "1 / 0", 1, None)
+        self.assertEqual(gate.check(raises, None, repeat=1)['status'], 'new')
+        differs = Benchmark(
+            'differs', "import sys\nresult = sys._getframe().f_code.co_name",
+            1, None)
+        result = gate.check(differs, {'median': 1.0}, repeat=1)
+        self.assertEqual((result['status'], result['mismatches']),
+                         ('mismatch', ['result']))
+        # 只在虚拟机中出错：新出现的错误判为 error，基线中已记录的判为 unsupported
+        unsupported = Benchmark('unsupported', textwrap.dedent("""\
+            import contextlib
+            with contextlib.suppress(KeyError):
+                pass
+        """), 1, None)
+        result = gate.check(unsupported, None, repeat=1)
+        self.assertEqual(result['status'], 'error')
+        result = gate.check(unsupported, {'error': result['error']}, repeat=1)
+        self.assertEqual(result['status'], 'unsupported')
+
+    def test_baselines_are_keyed_by_vm_options(self):
+        key = gate.config_key({'peephole': True, 'engine': 'threaded'})
+        self.assertEqual(key, 'engine=threaded,peephole=True')
+        configs = {key: {'fib': {'median': 1.0, 'threshold': 0.1,
+                                 'error': None}}}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'baselines.json')
+            self.assertEqual(gate.load_baselines(path), {})
+            gate.save_baselines(path, configs)
+            self.assertEqual(gate.load_baselines(path), configs)
+            # 没有记录虚拟机选项的旧格式不再使用
+            with open(path, 'w') as f:
+                json.dump({'benchmarks': {'fib': {'median': 1.0}}}, f)
+            self.assertEqual(gate.load_baselines(path), {})
+
+
+if __name__ == '__main__':
+    unittest.main()